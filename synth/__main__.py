@@ -36,6 +36,9 @@ from common import ISO8601
 from common import importer
 from events import Events
 import device_factory
+import sharding
+import checkpoint
+import profiler
 import zeromq_rx, zeromq_tx
 from directories import *
 import faulthandler
@@ -46,6 +49,7 @@ g_get_sim_time = None   # TODO: Find a more elegant way for logging to discover
 g_slack_webhook = None
 g_instance_name = None
 g_asked_to_pause = False
+g_profiler = None
 
 # Set up Python logger to report simulated time
 def in_simulated_time(self,secs=None):
@@ -65,6 +69,8 @@ def init_logging(params):
                     datefmt='%Y-%m-%dT%H:%M:%S'
                     )
     logging.Formatter.converter = in_simulated_time # Make logger use simulated time
+    if sharding.is_worker(params):
+        logging.getLogger('').handlers[0].setLevel(logging.WARNING)    # A shard's console goes to its .err file, which need only say what went wrong (its .out has everything)
 
     # Log to file
     try:
@@ -208,6 +214,9 @@ def signal_catcher(signal_received, frame):
     if signal_received == signal.SIGUSR1:
         logging.info("Pause requested")
         g_asked_to_pause = True
+    if signal_received == signal.SIGUSR2 and g_profiler is not None:
+        logging.info("Profile requested")
+        g_profiler.report()
     logging.info("FYI Python stack is:")
     tb = traceback.format_list(traceback.extract_stack())
     for L in tb:
@@ -222,8 +231,9 @@ def main():
     global g_get_sim_time
     global g_instance_name
     global g_asked_to_pause
+    global g_profiler
     
-    def incomingAsyncEvent(packet):    # CAUTION: Called asynchronously from the ZeroMQ rx thread
+    def incomingAsyncEvent(packet):    # CAUTION: Called asynchronously from the ZeroMQ rx thread (unless the engine has an event loop)
         if "action" in packet:
             if packet["action"] == "event":
                 if packet["headers"]["Instancename"] == g_instance_name:
@@ -246,6 +256,8 @@ def main():
 
     params = get_params()
     assert g_instance_name is not None, "Instance name has not been defined, but this is required for logfile naming"
+    if sharding.is_worker(params):
+        g_instance_name = sharding.init_worker(params, g_instance_name)
     init_logging(params)
     logging.info("*** Synth starting at real time "+str(datetime.now())+" ***")
     logging.info("Parameters:\n"+json.dumps(params, sort_keys=True, indent=4, separators=(',', ': ')))
@@ -254,7 +266,15 @@ def main():
     install_signal_catcher()
 
     Tstart = time.time()
-    random.seed(12345)  # Ensure reproduceability
+
+    if sharding.is_coordinator(params):
+        status = sharding.run_coordinator(params, g_instance_name)
+        logging.info("Elapsed real time: "+str(int(time.time()-Tstart))+" seconds")
+        post_to_slack(["Finished OK", "Finished with errors"][status != 0])
+        exit(status)
+
+    if not sharding.is_worker(params):
+        random.seed(12345)  # Ensure reproduceability (shards seed themselves)
 
     if not "client" in params:
         logging.error("No client defined to receive simulation results")
@@ -266,14 +286,34 @@ def main():
         return
     engine = importer.get_class('engine', params['engine']['type'])(params['engine'], client.enter_interactive, event_count_callback)
     g_get_sim_time = engine.get_now_no_lock
+    if params.get("profile", False):
+        g_profiler = profiler.Profiler(g_instance_name, params["profile"])
+        engine.set_profiler(g_profiler)
+    if params.get("group_properties", True):
+        engine.set_profiler(device_factory.PropertyGrouper(g_profiler))  # See device_factory.py
+
+    checkpointer = None
+    if "checkpoint" in params:
+        checkpointer = checkpoint.Checkpointer(g_instance_name, params)
+        if checkpointer.can_resume():
+            params["restart_log"] = False   # Keep the .evt file that we're resuming
 
     if not "events" in params:
         logging.warning("No events defined")
     events = Events(client, engine, g_instance_name, params, params["events"])
 
-    zeromq_rx.init(incomingAsyncEvent, emit_logging=True)
+    if checkpointer is not None:
+        checkpointer.start(engine, client, events)
+
+    if engine.get_event_loop() is None:
+        zeromq_rx.init(incomingAsyncEvent, emit_logging=True)
+    else:
+        zeromq_rx.init_asyncio(engine.get_event_loop(), incomingAsyncEvent, emit_logging=True)
     zeromq_tx.init(emit_logging=True)
 
+    if sharding.is_worker(params):
+        sharding.start_progress_reporting(g_instance_name, events, engine)
+
     logging.info("Simulation starts")
 
     faulthandler.dump_traceback_later(600, repeat=True) # TEMP - every 10 minutes emit a stack trace for every thread - to diagnose hanging issue
@@ -282,6 +322,8 @@ def main():
         while engine.events_to_come():
             engine.next_event()
             client.tick()
+            if checkpointer is not None:
+                checkpointer.tick()
             if g_asked_to_pause:
                 g_asked_to_pause = False
                 logging.info("Paused")
@@ -297,6 +339,8 @@ def main():
     logging.info("Ending device logging ("+str(len(device_factory.g_devices))+" devices were emulated)")
     events.flush()
     client.close()
+    if g_profiler is not None:
+        g_profiler.report()
 
     logging.info("Elapsed real time: "+str(int(time.time()-Tstart))+" seconds")
 
@@ -327,10 +371,4 @@ if __name__ == "__main__":
 
     check_install()
 
-    if False:    # Profile
-        import cProfile, pstats
-        cProfile.run('main()', 'profiling')
-        p = pstats.Stats('profiling')
-        p.sort_stats('cumulative').print_stats(30)
-    else:
-        main()
+    main()  # To profile, set "profile" : true (see profiler.py)
@@ -0,0 +1,287 @@
+"""BENCHMARK
+   Measure Synth's performance on a set of representative scenarios, and compare it with a stored baseline so that regressions show up.
+
+   Run from the top-level directory::
+
+        ./benchmark                 # Run all cases, and compare with the baseline
+        ./benchmark 90000_events    # Run just some cases
+        ./benchmark --save          # Run, and make the results the new baseline
+
+   Each case runs a bundled scenario in its own process, with the null client (so we measure Synth rather than a client, except in cases which measure output) and
+   with "profile" turned on (see profiler.py), which costs about a microsecond per event. For each case we record:
+
+    * events_per_s : the rate at which the engine executed events during the historical phase
+    * devices_per_s : the rate of device creation (devices created by create_device(s), per second spent creating them)
+    * peak_rss_mb : the peak memory use of the process
+    * wall_time_s : how long the whole run took
+
+   Results are written to benchmark_results.json in the log directory, and compared with benchmark_baseline.json there
+   (or the file given by --baseline). A metric which is worse than the baseline by more than --tolerance (default 10%) is a regression.
+   The exit status is 1 if there are any regressions, if any case fails (crashes or times out), or if a case in the baseline
+   has no result now. Baselines are only meaningful on the machine which recorded them.
+
+   Benchmarks must run offline, so device functions which need Google Maps or Dark Sky (latlong, mobile, weather) are removed
+   from scenarios, and any scenario which still needs them is skipped. Some scenarios are cut down to run in reasonable time.
+"""
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import importlib.util
+from datetime import datetime
+from directories import *
+
+CASES = [   # name, scenario, (optionally) the maximum number of devices which any one create_device event may create, and the client to use (default null)
+    { "name" : "10secs", "scenario" : "10secs" },
+    { "name" : "90000_events", "scenario" : "90000_events" },
+    { "name" : "1000_devices", "scenario" : "1000_devices" },
+    { "name" : "20000_devices", "scenario" : "20000_devices" },     # Device creation rate
+    { "name" : "100000_devices", "scenario" : "100000_devices" },   # ... using create_devices
+    { "name" : "speedtest", "scenario" : "speedtest" },
+    { "name" : "ev_2k", "scenario" : "ev_100k", "max_repeats" : 2000 },
+    { "name" : "explode", "scenario" : "explode", "client" : { "type" : "filesystem", "filename" : "benchmark_explode", "write_csv" : False } },  # Output of exploded devices
+    { "name" : "timefunctions", "scenario" : "timefunction_devices", "max_repeats" : 200 },  # Devices made only of timefunction variables
+    { "name" : "comms_outages", "scenario" : "comms_outages", "max_repeats" : 200 },         # Unreliable comms, with buffering
+    { "name" : "large_estate", "scenario" : "large_estate" },   # Loading a large model (7000 devices in a hierarchy)
+    { "name" : "occupancy", "scenario" : "occupancy_devices", "max_repeats" : 200 }         # Devices driven by occupancy patterns
+]
+
+NETWORK_FUNCTIONS = { "latlong" : "Google Maps", "mobile" : "Google Maps", "weather" : "Dark Sky" }
+METRICS = { # name : True if higher is better
+    "events_per_s" : True,
+    "devices_per_s" : True,
+    "peak_rss_mb" : False,
+    "wall_time_s" : False
+}
+DEFAULT_TOLERANCE = 0.1
+DEFAULT_TIMEOUT_S = 900
+PROFILE_TOP = 1000      # So that the profile report always includes device creation
+RESULTS_FILE = LOG_DIR + "benchmark_results.json"
+BASELINE_FILE = LOG_DIR + "benchmark_baseline.json"
+
+def load_synth_main():
+    """Synth's top-level module, for its parameter-file parsing"""
+    spec = importlib.util.spec_from_file_location("synth_main", os.path.join(os.path.dirname(os.path.abspath(__file__)), "__main__.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_scenario(synth_main, name):
+    s = open(SCENARIO_DIR + name + ".json", "rt").read()
+    s = synth_main.preprocess(s)
+    s = synth_main.remove_C_comments(s)
+    return json.loads(s)
+
+def remove_network_functions(spec, removed):
+    """Remove device functions which need network services, from anywhere in <spec>. Adds the names of any removed to <removed>"""
+    if isinstance(spec, dict):
+        for name in NETWORK_FUNCTIONS:
+            if name in spec:
+                del spec[name]
+                removed.add(name)
+        for v in spec.values():
+            remove_network_functions(v, removed)
+    elif isinstance(spec, list):
+        for v in spec:
+            remove_network_functions(v, removed)
+
+def network_services(spec):
+    """Return the set of network services which <spec> still needs (e.g. model functions named in a list)"""
+    services = set()
+    if isinstance(spec, dict):
+        for (k,v) in spec.items():
+            if k in NETWORK_FUNCTIONS:
+                services.add(NETWORK_FUNCTIONS[k])
+            services |= network_services(v)
+    elif isinstance(spec, list):
+        for v in spec:
+            services |= network_services(v)
+    elif isinstance(spec, str) and spec in NETWORK_FUNCTIONS:
+        services.add(NETWORK_FUNCTIONS[spec])
+    return services
+
+def prepare_case(synth_main, case):
+    """Write the parameter file for a case. Returns (instance name, notes) or (None, reason for skipping)"""
+    scenario = load_scenario(synth_main, case["scenario"])
+    removed = set()
+    remove_network_functions(scenario, removed)
+    services = network_services(scenario)
+    if len(services) > 0:
+        return (None, "needs " + ", ".join(sorted(services)))
+    notes = []
+    if len(removed) > 0:
+        notes.append("removed " + ", ".join(sorted(removed)))
+    if "max_repeats" in case:
+        for event in scenario.get("events", []):
+            if "create_device" in event.get("action", {}) and event.get("repeats", 1) > case["max_repeats"]:
+                event["repeats"] = case["max_repeats"]
+                notes.append("create_device repeats cut to " + str(case["max_repeats"]))
+
+    scenario["client"] = case.get("client", { "type" : "null" })    # Naming the client here makes this file name the instance
+    scenario["profile"] = { "top" : PROFILE_TOP }
+    scenario.pop("shards", None)
+    instance_name = "benchmark_" + case["name"]
+    open(ACCOUNTS_DIR + instance_name + ".json", "wt").write(json.dumps(scenario, indent=4))
+    return (instance_name, "; ".join(notes))
+
+def parse_results(instance_name):
+    result = {}
+    out = open(LOG_DIR + instance_name + ".out", "rt").read()
+    m = re.search(r"Historical phase executed (\d+) events in ([\d.]+)s real time", out)
+    if m is not None and int(m.group(1)) > 0:   # Scenarios which run in real time have no historical phase
+        result["events"] = int(m.group(1))
+        result["events_per_s"] = int(m.group(1)) / max(float(m.group(2)), 0.001)
+    (devices, seconds) = (0, 0.0)
+    for m in re.finditer(r"Created devices (\d+) to (\d+)", out):   # Cohorts, each created by one create_devices event
+        devices += int(m.group(2)) - int(m.group(1)) + 1
+    if os.path.exists(LOG_DIR + instance_name + ".profile"):
+        for L in open(LOG_DIR + instance_name + ".profile", "rt"):
+            fields = L.split()
+            if len(fields) == 7 and fields[6] == "device_factory.create_device":
+                devices += int(fields[0])
+                seconds += float(fields[1])
+            elif len(fields) == 7 and fields[6] == "device_factory.create_devices":
+                seconds += float(fields[1])
+    if devices > 0:
+        result["devices"] = devices
+        result["devices_per_s"] = devices / max(seconds, 0.000001)
+    return result
+
+def run_case(synth_main, case, timeout):
+    (instance_name, notes) = prepare_case(synth_main, case)
+    if instance_name is None:
+        print("{:15s} SKIPPED ({})".format(case["name"], notes))
+        return None
+    print("{:15s} running{}".format(case["name"], " (" + notes + ")" if notes else ""), flush=True)
+
+    env = dict(os.environ, PYTHONHASHSEED="0")
+    start = time.time()
+    p = subprocess.Popen([sys.executable, "synth", instance_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    while True:
+        (pid, status, rusage) = os.wait4(p.pid, os.WNOHANG)   # Unlike Popen.wait(), tells us the peak memory use of this process
+        if pid != 0:
+            break
+        if time.time() - start > timeout:
+            p.kill()
+            os.wait4(p.pid, 0)
+            print("{:15s} FAILED (timed out after {}s)".format(case["name"], timeout))
+            return { "failed" : "timed out after " + str(timeout) + "s" }
+        time.sleep(0.1)
+    wall_time = time.time() - start
+    p.returncode = os.waitstatus_to_exitcode(status)
+    if p.returncode != 0:
+        print("{:15s} FAILED (exit status {}, see {})".format(case["name"], p.returncode, LOG_DIR + instance_name + ".out"))
+        return { "failed" : "exit status " + str(p.returncode) }
+
+    result = parse_results(instance_name)
+    result["wall_time_s"] = wall_time
+    result["peak_rss_mb"] = rusage.ru_maxrss / 1024.0  # ru_maxrss is in kB
+    result["notes"] = notes
+    return result
+
+def compare(results, baseline, tolerance):
+    """Print a comparison with the baseline. Returns the number of regressions"""
+    regressions = 0
+    print()
+    print("{:15s} {:15s} {:>12s} {:>12s} {:>8s}".format("case", "metric", "baseline", "now", "change"))
+    for (name, result) in results.items():
+        for (metric, higher_is_better) in METRICS.items():
+            if result.get(metric, None) is None:
+                continue
+            now = result[metric]
+            before = baseline.get(name, {}).get(metric, None)
+            if before is None or before == 0:
+                print("{:15s} {:15s} {:>12s} {:12.1f}".format(name, metric, "-", now))
+                continue
+            change = (now - before) / before
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = "REGRESSION"
+                regressions += 1
+            elif worse < -tolerance:
+                flag = "improved"
+            print("{:15s} {:15s} {:12.1f} {:12.1f} {:+7.1f}% {}".format(name, metric, before, now, change * 100, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Synth on representative scenarios")
+    parser.add_argument("cases", nargs="*", help="Cases to run (default all): " + ", ".join([c["name"] for c in CASES]))
+    parser.add_argument("--save", action="store_true", help="Make these results the baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Fractional worsening which counts as a regression")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT_S, help="Maximum seconds for each case")
+    args = parser.parse_args()
+
+    cases = [c for c in CASES if len(args.cases) == 0 or c["name"] in args.cases]
+    if len(cases) == 0:
+        print("No such case(s): " + " ".join(args.cases))
+        return 2
+
+    synth_main = load_synth_main()
+    results = {}
+    for case in cases:
+        result = run_case(synth_main, case, args.timeout)
+        if result is not None:
+            results[case["name"]] = result
+
+    output = { "written" : datetime.now().isoformat(), "machine" : platform.node(), "python" : platform.python_version(), "results" : results }
+    open(RESULTS_FILE, "wt").write(json.dumps(output, indent=4, sort_keys=True))
+    print("Results written to " + RESULTS_FILE)
+
+    regressions = 0
+    baseline_results = {}
+    if os.path.exists(args.baseline):
+        baseline = json.loads(open(args.baseline, "rt").read())
+        baseline_results = baseline["results"]
+        print("Comparing with baseline " + args.baseline + " written " + baseline["written"] + " on " + baseline["machine"])
+        regressions = compare(results, baseline_results, args.tolerance)
+    else:
+        print("No baseline to compare with (run with --save to make one)")
+        compare(results, {}, args.tolerance)
+
+    if args.save:
+        open(args.baseline, "wt").write(json.dumps(output, indent=4, sort_keys=True))
+        print("Saved as baseline " + args.baseline)
+
+    failed = [name for (name, result) in results.items() if "failed" in result]
+    missing = [c["name"] for c in cases if c["name"] not in results and "failed" not in baseline_results.get(c["name"], { "failed" : "" })]  # Skipped now, but not when the baseline was made
+    if len(results) < len(cases):
+        print(str(len(cases) - len(results)) + " case(s) skipped")
+    if len(failed) > 0:
+        print(str(len(failed)) + " case(s) failed: " + ", ".join(failed))
+    if len(missing) > 0:
+        print(str(len(missing)) + " case(s) in the baseline have no result: " + ", ".join(missing))
+    if regressions > 0:
+        print(str(regressions) + " regression(s)")
+    if regressions > 0 or len(failed) > 0 or len(missing) > 0:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""CHECKPOINT
+   Save the complete state of a simulation, so that a restarted run can resume from it instead of re-simulating all its history.
+
+   Add e.g. ``"checkpoint" : { "interval" : "P1D" }`` to a scenario (or on the command-line) and Synth writes <instance>.checkpoint
+   to the log directory every "interval" of simulated time, and also when the simulation first catches-up with real time
+   (unless ``"when_caught_up" : false``). When the same scenario is run again it resumes from the checkpoint, if there is one
+   (unless ``"resume" : false``), and carries on exactly as the original run would have done.
+
+   A checkpoint contains:
+
+    * The engine's simulation time and pending events (including periodic timers)
+    * Every device object, with its properties, timefunctions and model
+    * The state of the random-number generators (the global one, and those belonging to device classes) and all other
+      class-level state of device classes, such as Basic.device_number
+    * How many events have been written, and how far through its .evt file the run has got
+    * The client's state, for clients which support checkpointing (filesystem: its CSV data, and how far through its current JSON file it has got)
+
+   On resume the .evt file, and the filesystem client's current JSON file, are truncated to where they were at the checkpoint,
+   so output from a resumed run is identical to that of an uninterrupted one.
+
+   A checkpoint is a pickle, compressed with zlib. It records a hash of the scenario's parameters, and is ignored (with a warning)
+   if the parameters have since changed. Other clients don't save their state, so anything they hadn't yet sent when the
+   checkpoint was written is lost, and anything they sent after it is sent again.
+"""
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import io
+import json
+import time
+import zlib
+import pickle
+import random
+import hashlib
+import logging
+import importlib
+import isodate
+import device_factory
+from common import ISO8601
+from directories import *
+
+VERSION = 1
+MAGIC = b"SYNTH CHECKPOINT\n"
+COMPRESSION_LEVEL = 1       # zlib level. Checkpoints are written often and must load quickly, so we favour speed over size
+STATE_PACKAGES = ["devices", "timefunctions", "models"]     # Class-level state of classes in these packages is saved
+STATE_TYPES = (type(None), bool, int, float, str, tuple, list, dict, set, random.Random)
+RECURSION_LIMIT = 100000    # Pickling is recursive, and devices can refer to each other in long chains (e.g. through a model)
+
+def params_hash(params):
+    """A hash of the scenario, ignoring parameters which don't affect what is simulated"""
+    p = { k : v for (k,v) in params.items() if k not in ["checkpoint", "restart_log"] }
+    return hashlib.md5(json.dumps(p, sort_keys=True).encode("utf-8")).hexdigest()
+
+def class_state():
+    """Return {(module name, class name) : {attribute : value}} for all class-level state of loaded device (etc.) classes"""
+    state = {}
+    for (module_name, module) in list(sys.modules.items()):
+        if module is None or module_name.split(".")[0] not in STATE_PACKAGES:
+            continue
+        for (class_name, cls) in list(vars(module).items()):
+            if not isinstance(cls, type) or cls.__module__ != module_name:
+                continue
+            attributes = { k : v for (k,v) in vars(cls).items() if not k.startswith("__") and isinstance(v, STATE_TYPES) }
+            if len(attributes) > 0:
+                state[(module_name, class_name)] = attributes
+    return state
+
+def restore_class_state(state):
+    for ((module_name, class_name), attributes) in state.items():
+        cls = getattr(importlib.import_module(module_name), class_name)
+        for (k,v) in attributes.items():
+            setattr(cls, k, v)
+
+class Pickler(pickle.Pickler):
+    """Objects which belong to the running process (engine, client and callbacks) are saved by name, to be
+       replaced by their equivalents in the resuming process. Composite device classes are saved as the list of classes they're composed from."""
+    def __init__(self, f, external):
+        super(Pickler, self).__init__(f, pickle.HIGHEST_PROTOCOL)
+        self.external = { id(obj) : name for (name, obj) in external.items() }
+
+    def persistent_id(self, obj):
+        return self.external.get(id(obj), None)
+
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and "composed_from" in obj.__dict__:
+            return (device_factory.compose_class, (obj.composed_from,))
+        return NotImplemented
+
+class Unpickler(pickle.Unpickler):
+    def __init__(self, f, external):
+        super(Unpickler, self).__init__(f)
+        self.external = external
+
+    def persistent_load(self, name):
+        return self.external[name]
+
+class Checkpointer():
+    def __init__(self, instance_name, params):
+        spec = params.get("checkpoint", {})
+        self.filename = LOG_DIR + instance_name + ".checkpoint"
+        self.interval = None
+        if "interval" in spec:
+            self.interval = isodate.parse_duration(spec["interval"]).total_seconds()
+        self.when_caught_up = spec.get("when_caught_up", True)
+        self.resume_enabled = spec.get("resume", True)
+        self.params_hash = params_hash(params)
+        self.next_time = None
+        self.written_when_caught_up = False
+        self.engine = None
+
+    def read_header(self):
+        """Return the header of the existing checkpoint file, or None if there isn't one we can resume from"""
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                logging.warning("Ignoring "+self.filename+" as it isn't a checkpoint file")
+                return None
+            header = json.loads(f.readline().decode("utf-8"))
+        if header["version"] != VERSION:
+            logging.warning("Ignoring "+self.filename+" as it was written by a different version of Synth")
+            return None
+        if header["params_hash"] != self.params_hash:
+            logging.warning("Ignoring "+self.filename+" as the scenario's parameters have changed since it was written")
+            return None
+        return header
+
+    def can_resume(self):
+        return self.resume_enabled and self.read_header() is not None
+
+    def external_objects(self, engine, client, events):
+        external = { "engine" : engine, "client" : client, "update_callback" : events.update_callback }
+        for (name, action) in events.actions.items():
+            external["action." + name] = action
+        return external
+
+    def start(self, engine, client, events):
+        """Call once everything is set up. Resumes from the checkpoint file if it can (returning True)"""
+        (self.engine, self.client, self.events) = (engine, client, events)
+        resumed = False
+        if self.can_resume():
+            self.resume()
+            resumed = True
+        if self.interval is not None:
+            self.next_time = engine.get_now_no_lock() + self.interval
+        self.written_when_caught_up = getattr(engine, "caught_up", False)
+        return resumed
+
+    def tick(self):
+        """Call after each event, to write a checkpoint if one is due"""
+        if self.interval is not None and self.engine.get_now_no_lock() >= self.next_time:
+            self.write()
+            self.next_time = self.engine.get_now_no_lock() + self.interval
+        if self.when_caught_up and not self.written_when_caught_up and getattr(self.engine, "caught_up", False):
+            self.write()
+            self.written_when_caught_up = True
+
+    def write(self):
+        t = time.time()
+        state = {
+            "engine" : self.engine.get_checkpoint(),
+            "devices" : device_factory.g_devices,
+            "class_state" : class_state(),
+            "random" : random.getstate(),
+            "events" : self.events.get_checkpoint(),
+            "client" : self.client.get_checkpoint()
+            }
+        header = {
+            "version" : VERSION,
+            "params_hash" : self.params_hash,
+            "sim_time" : ISO8601.epoch_seconds_to_ISO8601(self.engine.get_now_no_lock()),
+            "real_time" : time.ctime(),
+            "devices" : len(device_factory.g_devices)
+            }
+        f = io.BytesIO()
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            Pickler(f, self.external_objects(self.engine, self.client, self.events)).dump(state)
+        finally:
+            sys.setrecursionlimit(limit)
+        data = zlib.compress(f.getvalue(), COMPRESSION_LEVEL)
+
+        temp_filename = self.filename + ".tmp"   # Write then rename, so that there's always a complete checkpoint file even if we're killed mid-write
+        with open(temp_filename, "wb") as f:
+            f.write(MAGIC)
+            f.write((json.dumps(header) + "\n").encode("utf-8"))
+            f.write(data)
+        os.replace(temp_filename, self.filename)
+        logging.info("Wrote checkpoint at simulation time "+header["sim_time"]+" ({:,} bytes in {:.2f}s)".format(len(data) + len(MAGIC), time.time() - t))
+
+    def resume(self):
+        t = time.time()
+        with open(self.filename, "rb") as f:
+            f.read(len(MAGIC))
+            header = json.loads(f.readline().decode("utf-8"))
+            data = zlib.decompress(f.read())
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            state = Unpickler(io.BytesIO(data), self.external_objects(self.engine, self.client, self.events)).load()
+        finally:
+            sys.setrecursionlimit(limit)
+
+        self.engine.restore_checkpoint(state["engine"])
+        device_factory.restore_devices(state["devices"])
+        restore_class_state(state["class_state"])
+        random.setstate(state["random"])
+        self.events.restore_checkpoint(state["events"])
+        self.client.restore_checkpoint(state["client"])
+        logging.info("Resumed from checkpoint written at simulation time "+header["sim_time"]+" (real time "+header["real_time"]+"), with "+str(header["devices"])+" devices, in {:.2f}s".format(time.time() - t))
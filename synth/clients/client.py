@@ -18,6 +18,15 @@ class Client:
         """Update an existing device's properties (for some clients it's an error to update a device before calling add_device()"""
         pass
 
+    def update_variants(self, time, properties, names, variants):
+        """Update several devices whose properties are identical except for those in <names> (which must include "$id"),
+           which take the values in each tuple of <variants> in turn (see explode_factor in events.py).
+           Clients can override this to avoid processing each variant from scratch"""
+        new_props = properties.copy()
+        for values in variants:
+            new_props.update(zip(names, values))
+            self.update_device(new_props["$id"], time, new_props)
+
     @abstractmethod
     def get_device(self):
         """Get parameters for one device."""
@@ -57,3 +66,11 @@ class Client:
     def close(self):
         """Write all pending data (e.g. before exiting)."""
         pass
+
+    def get_checkpoint(self):
+        """Return any state which a resumed run would need (see checkpoint.py). Clients which keep no such state needn't override this"""
+        return None
+
+    def restore_checkpoint(self, state):
+        """Carry on from state returned by get_checkpoint()"""
+        pass
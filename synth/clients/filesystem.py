@@ -79,6 +79,15 @@ class Filesystem(Client):
         self.json_stream.write_event(properties)
         return True
 
+    def update_variants(self, time, properties, names, variants):
+        if len(variants) == 0:  # (An explode_factor of 0)
+            return
+        properties = properties.copy()
+        properties.update(zip(names, variants[0]))  # (So that properties are in the same order as if we'd called update_device() for each variant)
+        properties["$ts"] = time
+        evt2csv.insert_variants(self.events, properties, names, variants)
+        self.json_stream.write_variants(properties, names, variants)
+
     def get_device(self):
         return None
 
@@ -101,6 +110,13 @@ class Filesystem(Client):
     def async_command(self, argv):
         logging.warning("Async command ignored by filesystem client: "+str(argv))
 
+    def get_checkpoint(self):
+        return { "events" : self.events, "json_stream" : self.json_stream.get_checkpoint() }
+
+    def restore_checkpoint(self, state):
+        self.events = state["events"]
+        self.json_stream.restore_checkpoint(state["json_stream"])
+
     def close(self):
         """Called to clean up on exiting."""
         self.json_stream.close()
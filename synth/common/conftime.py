@@ -1,4 +1,5 @@
 import time
+import functools
 import isodate
 import pendulum
 
@@ -9,6 +10,13 @@ def get_interval(conf, key, default):
         return default
 
 
+@functools.lru_cache(maxsize=None)
+def duration_seconds(duration):
+    """Given an ISO8601 duration string (e.g. "PT1H") return seconds.
+       Devices parse durations from their params each time one is created, and there are only ever a few distinct ones, so we remember them"""
+    return isodate.parse_duration(duration).total_seconds()
+
+
 def get_time(conf, key, default):
     if key in conf:
         return pendulum.interval.instance(isodate.parse_datetime(conf[key]))
@@ -53,6 +53,23 @@ def insert_properties(the_dict, properties):
 
     the_dict[key] = existingProps
 
+def insert_variants(the_dict, properties, names, variants):
+    """Update an event dict with several events whose properties are identical except for those in <names> (which must include "$id"),
+       which take the values in each tuple of <variants> in turn"""
+    assert "$ts" in properties
+    newProps = list(properties.items())
+    positions = [list(properties.keys()).index(name) for name in names]
+    id_slot = names.index("$id")
+    ts = TIME_FORMAT % float(properties["$ts"]) + SEP
+    for values in variants:
+        for (pos, name, value) in zip(positions, names, values):
+            newProps[pos] = (name, value)
+        key = ts + str(values[id_slot])
+        if key in the_dict:
+            the_dict[key].extend(newProps)
+        else:
+            the_dict[key] = list(newProps)
+
 def write_as_json(the_dict, filename):
     out = []
     for e in sorted(the_dict.keys()):
@@ -0,0 +1,217 @@
+"""SPATIAL
+   An index of things (e.g. devices) by latitude and longitude, which finds the nearest things to a point, or those within a radius of it.
+
+   Distances are great-circle distances, so are right everywhere on the Earth, including across the antimeridian and near the poles.
+   Each point is held as a unit vector (x,y,z) in a grid of cubic cells, so the chord between two points - which orders them just as the
+   great-circle distance does - is found without trigonometry, and a query only visits the cells near the point it's asked about.
+   Things can be moved or removed at any time, so the index can follow devices as they move.
+
+   A query costs time proportional to the number of cells it visits, which is small for points within a few cells of each other,
+   and never more than a scan of every thing in the index. Things at the same distance are returned in the order in which they were first added, or in an order given by the caller.
+   Run "python3 -m common.geo.spatial" (from the synth directory) to test and measure.
+"""
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import math
+import heapq
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_CELL_KM = 50.0
+
+def unit_vector(latitude, longitude):
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+def chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2.0))
+
+def km_to_chord(km):
+    return 2.0 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2.0)
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points"""
+    (x1, y1, z1) = unit_vector(lat1, lon1)
+    (x2, y2, z2) = unit_vector(lat2, lon2)
+    return chord_to_km(math.sqrt((x1-x2)*(x1-x2) + (y1-y2)*(y1-y2) + (z1-z2)*(z1-z2)))
+
+class SpatialIndex():
+    def __init__(self, cell_km = DEFAULT_CELL_KM):
+        self.cell = km_to_chord(cell_km)    # Size of each cell (as a chord of the unit sphere)
+        self.cells = {}         # (i,j,k) -> { thing : (x,y,z,sequence) }
+        self.where = {}         # thing -> (i,j,k)
+        self.sequence = {}      # thing -> order in which it was first added
+        self.next_sequence = 0
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, thing):
+        return thing in self.where
+
+    def _cell_of(self, v):
+        return (int(math.floor(v[0] / self.cell)), int(math.floor(v[1] / self.cell)), int(math.floor(v[2] / self.cell)))
+
+    def set(self, thing, latitude, longitude, order = None):
+        """Add <thing> at the given point, or move it there. Things at the same distance are returned in <order> (by default, the order in which they were first added)"""
+        self.remove(thing)
+        if order is not None:
+            self.sequence[thing] = order
+        elif thing not in self.sequence:
+            self.sequence[thing] = self.next_sequence
+            self.next_sequence += 1
+        v = unit_vector(latitude, longitude)
+        c = self._cell_of(v)
+        self.cells.setdefault(c, {})[thing] = v + (self.sequence[thing],)
+        self.where[thing] = c
+
+    def remove(self, thing):
+        c = self.where.pop(thing, None)
+        if c is not None:   # (We remember its sequence, so if it comes back it keeps its place)
+            contents = self.cells[c]
+            del contents[thing]
+            if len(contents) == 0:
+                del self.cells[c]
+
+    def nearest(self, latitude, longitude, count = 1):
+        """Return a list of up to <count> (distance in km, thing), nearest first"""
+        if count < 1 or len(self.where) == 0:
+            return []
+        p = unit_vector(latitude, longitude)
+        (ci, cj, ck) = self._cell_of(p)
+        best = []   # Heap of (-chord, -sequence, thing) of the best <count> so far, worst at the top
+        visited = 0
+        r = 0
+        while True:
+            # Every thing we haven't yet seen is in a cell at least r cells away on some axis, so more than (r-1) * cell away
+            if len(best) == count and -best[0][0] <= (r-1) * self.cell:
+                break
+            if r * self.cell > 2.0 or visited + (2*r+1)**3 - (2*r-1)**3 > len(self.cells):   # Searched everywhere, or it would be quicker to look everywhere
+                best = []
+                for contents in self.cells.values():
+                    self._consider(p, contents, best, count)
+                break
+            for c in self._shell(ci, cj, ck, r):
+                contents = self.cells.get(c, None)
+                if contents is not None:
+                    self._consider(p, contents, best, count)
+            visited += (2*r+1)**3 - (2*r-1)**3 if r > 0 else 1
+            r += 1
+        result = sorted([(-neg_chord, -neg_seq, thing) for (neg_chord, neg_seq, thing) in best], key=lambda e: (e[0], e[1]))
+        return [(chord_to_km(chord), thing) for (chord, _, thing) in result]
+
+    def _consider(self, p, contents, best, count):
+        for (thing, (x, y, z, seq)) in contents.items():
+            chord = math.sqrt((p[0]-x)*(p[0]-x) + (p[1]-y)*(p[1]-y) + (p[2]-z)*(p[2]-z))
+            entry = (-chord, -seq, thing)
+            if len(best) < count:
+                heapq.heappush(best, entry)
+            elif entry[:2] > best[0][:2]:  # Nearer (or as near, but added earlier)
+                heapq.heapreplace(best, entry)
+
+    def _shell(self, ci, cj, ck, r):
+        """The cells which are exactly r cells away (on the furthest axis) from cell (ci,cj,ck)"""
+        if r == 0:
+            yield (ci, cj, ck)
+            return
+        for i in range(ci-r, ci+r+1):
+            for j in range(cj-r, cj+r+1):
+                if abs(i-ci) == r or abs(j-cj) == r:
+                    for k in range(ck-r, ck+r+1):
+                        yield (i, j, k)
+                else:
+                    yield (i, j, ck-r)
+                    yield (i, j, ck+r)
+
+    def within(self, latitude, longitude, radius_km):
+        """Return a list of (distance in km, thing) for everything within <radius_km>, nearest first"""
+        p = unit_vector(latitude, longitude)
+        limit = km_to_chord(radius_km)
+        (ci, cj, ck) = self._cell_of(p)
+        reach = int(math.ceil(limit / self.cell))
+        if (2*reach+1)**3 > len(self.cells):
+            candidates = self.cells.values()
+        else:
+            candidates = [self.cells[c] for c in self._cube(ci, cj, ck, reach) if c in self.cells]
+        result = []
+        for contents in candidates:
+            for (thing, (x, y, z, seq)) in contents.items():
+                chord = math.sqrt((p[0]-x)*(p[0]-x) + (p[1]-y)*(p[1]-y) + (p[2]-z)*(p[2]-z))
+                if chord <= limit:
+                    result.append((chord, seq, thing))
+        result.sort(key=lambda e: (e[0], e[1]))
+        return [(chord_to_km(chord), thing) for (chord, _, thing) in result]
+
+    def _cube(self, ci, cj, ck, reach):
+        for i in range(ci-reach, ci+reach+1):
+            for j in range(cj-reach, cj+reach+1):
+                for k in range(ck-reach, ck+reach+1):
+                    yield (i, j, k)
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    assert abs(distance_km(51.5074, -0.1278, 48.8566, 2.3522) - 343.5) < 1.0   # London - Paris
+    assert abs(distance_km(0, 179.9, 0, -179.9) - 22.2) < 0.1                  # Across the antimeridian
+    assert abs(distance_km(89.9, 0, 89.9, 180) - 22.2) < 0.1                   # Across the pole
+
+    index = SpatialIndex()
+    index.set("fiji", -17.7, 178.0)
+    index.set("samoa", -13.8, -172.0)
+    index.set("london", 51.5, -0.1)
+    assert [thing for (_, thing) in index.nearest(-16.0, -179.5, 2)] == ["fiji", "samoa"]   # Squared-degree distance would pick London second
+    index.set("fiji", 51.6, -0.1)   # Move it
+    assert index.nearest(51.55, -0.1)[0][1] == "london"     # Equidistant, but London was added first
+    assert [thing for (_, thing) in index.within(51.5, -0.1, 20)] == ["london", "fiji"]
+    index.remove("london")
+    assert "london" not in index and len(index) == 2
+
+    # Check against brute force, and time
+    random.seed(1)
+    N = 100000
+    points = {}
+    index = SpatialIndex()
+    for i in range(N):
+        (lat, lon) = (random.uniform(35, 60), random.uniform(-10, 30))   # Europe-ish
+        if i % 10 == 0:
+            (lat, lon) = (math.degrees(math.asin(random.uniform(-1, 1))), random.uniform(-180, 180))   # ... and some anywhere
+        points[i] = (lat, lon)
+        index.set(i, lat, lon)
+    queries = [(random.uniform(35, 60), random.uniform(-10, 30)) for q in range(200)] + [(random.uniform(-90, 90), random.uniform(-180, 180)) for q in range(50)]
+    for (lat, lon) in queries[:20] + queries[-10:]:
+        brute = sorted([(distance_km(lat, lon, p[0], p[1]), i) for (i, p) in points.items()])
+        found = index.nearest(lat, lon, 5)
+        assert [i for (_, i) in found] == [i for (_, i) in brute[:5]], (lat, lon)
+        near = index.within(lat, lon, 100.0)
+        assert [i for (_, i) in near] == [i for (d, i) in brute if d <= 100.0]
+    for (name, query) in [("nearest", lambda q: index.nearest(q[0], q[1], 1)), ("nearest 10", lambda q: index.nearest(q[0], q[1], 10)),
+                          ("within 50km", lambda q: index.within(q[0], q[1], 50.0))]:
+        start = time.perf_counter()
+        for q in queries:
+            query(q)
+        indexed = (time.perf_counter() - start) / len(queries)
+        print("{:12s} {:8.1f} us per query of {:,} points".format(name, indexed * 1e6, N))
+    start = time.perf_counter()
+    for q in queries[:20]:
+        min([(distance_km(q[0], q[1], p[0], p[1]), i) for (i, p) in points.items()])
+    print("{:12s} {:8.1f} us per query by scanning".format("scan", (time.perf_counter() - start) / 20 * 1e6))
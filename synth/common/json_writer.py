@@ -10,6 +10,7 @@ from . import merge_test
 
 TEMP_DIRECTORY = "/tmp/synth_json_writer/"  # We build each file in a temporary directory, then move when it's finished (so that anyone watching the destination directory doesn't ever encounter partially-written files
 DEFAULT_DIRECTORY = "../synth_logs/"
+PLACEHOLDER = "\x00"      # Marks where to substitute values into a pre-encoded event (see write_variants())
 DEFAULT_MAX_EVENTS_PER_FILE = 100000    # FYI 100,000 messages is max JSON file size that DP can ingest (if that's where you end-up putting these files)
 
 class Stream():
@@ -36,16 +37,56 @@ class Stream():
         self.first_timestamp = None
  
     def _write_event(self, properties):
-        self.check_next_file()
         jprops = properties.copy()
-        if self.first_timestamp is None:
-            self.first_timestamp = jprops["$ts"]
         jprops["$ts"] = int(jprops["$ts"] * 1000) # Convert timestamp to ms as that's what DP uses internally in JSON files
-        s = json_quick.dumps(jprops)
+        self.write_encoded(json_quick.dumps(jprops), properties["$ts"])
+
+    def write_encoded(self, s, ts):
+        """Write an event which is already encoded as a JSON string (with its $ts in ms). <ts> is its timestamp in (epoch) seconds"""
+        self.check_next_file()
+        if self.first_timestamp is None:
+            self.first_timestamp = ts
         if self.events_in_this_file > 0:
             s = ",\n" + s
         self.file.write(s)
 
+    def write_encoded_batch(self, strings, ts):
+        """Write several events which are already encoded as JSON strings (see write_encoded()), all with timestamp <ts>"""
+        i = 0
+        while i < len(strings):
+            self.check_next_file()
+            if self.first_timestamp is None:
+                self.first_timestamp = ts
+            n = min(len(strings) - i, self.max_events_per_file - self.events_in_this_file)   # As many as fit in this file
+            s = ",\n".join(strings[i:i+n])
+            if self.events_in_this_file > 0:
+                s = ",\n" + s
+            self.file.write(s)
+            self.events_in_this_file += n - 1
+            i += n
+
+    def write_variants(self, properties, names, variants):
+        """Write several events whose properties are identical except for the string-valued properties in <names>,
+           which take the values in each tuple of <variants> in turn. The event is only encoded once."""
+        jprops = properties.copy()
+        jprops["$ts"] = int(jprops["$ts"] * 1000)
+        for (i, name) in enumerate(names):
+            jprops[name] = PLACEHOLDER + str(i) + PLACEHOLDER
+        pieces = json_quick.dumps(jprops).split(PLACEHOLDER)
+        if self.merge or len(pieces) != 2 * len(names) + 1: # Can't merge encoded events (or a value contains our placeholder)
+            for values in variants:
+                props = properties.copy()
+                props.update(zip(names, values))
+                self.write_event(props)
+            return
+        slots = [(k, int(pieces[k])) for k in range(1, len(pieces), 2)]
+        strings = []
+        for values in variants:
+            for (k, i) in slots:
+                pieces[k] = values[i]
+            strings.append("".join(pieces))
+        self.write_encoded_batch(strings, properties["$ts"])
+
     def write_event(self, properties):
         if not self.merge:
             self._write_event(properties)
@@ -101,6 +142,28 @@ class Stream():
             self.first_timestamp = None
             self.file_count += 1
 
+    def get_checkpoint(self):
+        """Return our state, including how far we've got through the current file (see checkpoint.py)"""
+        state = self.__dict__.copy()
+        del state["file"]
+        state["position"] = None
+        if self.file is not None:
+            self.file.flush()
+            state["position"] = self.file.tell()
+        return state
+
+    def restore_checkpoint(self, state):
+        """Carry on from a checkpoint, truncating the current file (which must still be in the temp directory) to where it was"""
+        if self.file is not None:
+            self.file.close()
+        state = state.copy()
+        position = state.pop("position")
+        self.__dict__.update(state)
+        self.file = None
+        if self.filename is not None:
+            os.truncate(TEMP_DIRECTORY + self.filename, position)
+            self.file = open(TEMP_DIRECTORY + self.filename, "at")
+
     def close(self):
         if len(self.last_event) != 0:
             self._write_event(self.last_event)
@@ -2,6 +2,10 @@
 # (with the exception that multiple specifications within a string are separated by ";")
 # This is the opening-hours format that DevicePilot uses
 #
+# parse() compiles the specs into a Schedule: the seconds of the week at which it opens or closes. So is_open() is a binary search
+# of a few numbers rather than a walk of every spec, is_open_many() does the same for an array of times at once, and
+# next_transition() says exactly when a schedule will next open or close, so that devices can wait for that rather than polling.
+#
 # Copyright (c) 2020 DevicePilot Ltd.
 #
 # Permission is hereby granted, free of charge, to any person obtaining a copy
@@ -23,9 +27,15 @@
 # SOFTWARE.
 
 import time
+import bisect
+import math
+import numpy
 
 DAYS = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
 RANGE_SEP = "-"
+DAY_S = 24 * 60 * 60
+WEEK_S = 7 * DAY_S
+EPOCH_WEEK_OFFSET_S = 3 * DAY_S     # The Unix epoch was a Thursday, so this many seconds into a Monday-based week
 
 def starts_with_day(s):
     for d in range(len(DAYS)):
@@ -115,16 +125,87 @@ def _parse_opening_time(specstr):
     return spec
 
 
+class Schedule(list):
+    """A list of specs, compiled into the seconds of the week at which the schedule opens or closes.
+       Specs include both their start and end times (to the second), so e.g. "Mo 09:00-17:00" is open from 09:00:00 until 17:00:01"""
+    def __init__(self, specs):
+        super(Schedule, self).__init__(specs)
+        intervals = []  # [start, end) seconds of the week, for each day of each spec
+        for spec in self:
+            start = int(round(spec.start_hour * 3600))
+            end = min(int(round(spec.end_hour * 3600)) + 1, DAY_S)
+            if start < end:
+                for d in range(len(DAYS)):
+                    if spec.days[d]:
+                        intervals.append((d * DAY_S + start, d * DAY_S + end))
+        intervals.sort()
+        merged = []
+        for (start, end) in intervals:
+            if len(merged) > 0 and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.open_at_week_end = len(merged) > 0 and merged[-1][1] == WEEK_S    # ... and so at the start of the week, before any transition
+        open_at_week_start = len(merged) > 0 and merged[0][0] == 0
+        self.transitions = []   # Seconds of the week at which the schedule opens or closes
+        for (start, end) in merged:
+            self.transitions.extend([start, end])
+        if self.open_at_week_end:
+            del self.transitions[-1]
+        if open_at_week_start:
+            del self.transitions[0]
+        if self.open_at_week_end != open_at_week_start:  # Opening or closing as one week turns into the next
+            self.transitions.insert(0, 0)
+        self.transition_array = numpy.array(self.transitions, dtype=numpy.int64)
+
+    def is_open(self, epoch):
+        s = (math.floor(epoch) + EPOCH_WEEK_OFFSET_S) % WEEK_S
+        return self.open_at_week_end != (bisect.bisect_right(self.transitions, s) % 2 == 1)
+
+    def is_open_many(self, epochs):
+        """is_open() of each of an array of times, as an array of bools"""
+        s = (numpy.floor(numpy.asarray(epochs, dtype=numpy.float64)).astype(numpy.int64) + EPOCH_WEEK_OFFSET_S) % WEEK_S
+        return (numpy.searchsorted(self.transition_array, s, side="right") % 2 == 1) != self.open_at_week_end
+
+    def next_transition(self, epoch):
+        """The first time after <epoch> at which the schedule opens or closes, or None if it never does"""
+        if len(self.transitions) == 0:
+            return None
+        second = math.floor(epoch)
+        s = (second + EPOCH_WEEK_OFFSET_S) % WEEK_S
+        i = bisect.bisect_right(self.transitions, s)
+        if i < len(self.transitions):
+            return second - s + self.transitions[i]
+        return second - s + WEEK_S + self.transitions[0]
+
 def parse(desc):
     specs = [] 
     for spec in desc.split(";"):
         spec = spec.strip()
         specs.append(_parse_opening_time(spec))
-    return specs
+    return Schedule(specs)
 
 def is_open(epoch, specs):
     """Given a list of spec classes (as returned by parse_opening_times),
        returns true if the time (in Unix epoch-seconds) is within the specified range"""
+    if not isinstance(specs, Schedule):
+        specs = Schedule(specs)
+    return specs.is_open(epoch)
+
+def is_open_many(epochs, specs):
+    """is_open() of each of an array of times, as an array of bools"""
+    if not isinstance(specs, Schedule):
+        specs = Schedule(specs)
+    return specs.is_open_many(epochs)
+
+def next_transition(epoch, specs):
+    """The first time after <epoch> at which the specs open or close, or None if they never do"""
+    if not isinstance(specs, Schedule):
+        specs = Schedule(specs)
+    return specs.next_transition(epoch)
+
+def is_open_by_walking(epoch, specs):
+    """What is_open() does, by walking every spec (for testing)"""
     t = time.gmtime(epoch)
     weekday = t.tm_wday  # Monday is 0, same as we use here
     hour = t.tm_hour + t.tm_min/60.0 + t.tm_sec/3600.0
@@ -172,5 +253,41 @@ def selfTest():
                 print(" ASSERTED AS EXPECTED")
     print("PARSING TESTS PASSED")
 
+    # The compiled schedule must agree with walking the specs, second by second
+    import random
+    random.seed(1)
+    descs = ["Mo-Su", "Mo 09:00-12:00", "Mo-Fr 09:00-17:00; Sa 10:00-12:00", "Su 20:00-24:00; Mo 00:00-06:00", "Mo-Fr 22:00-06:00",
+             "Mo-Fr 09:00-12:00; Mo-Fr 11:00-14:30", "Mo,We,Fr 00:00-24:00", "Tu 12:34-12:34"]
+    start = 1564617600 - 3 * 86400    # Midnight on a Monday
+    for desc in descs:
+        schedule = parse(desc)
+        epochs = [start + s for s in range(0, 2 * WEEK_S, 7)] + [random.uniform(0, 2e9) for i in range(10000)]
+        walked = [is_open_by_walking(e, schedule) for e in epochs]
+        assert [schedule.is_open(e) for e in epochs] == walked, desc
+        assert list(schedule.is_open_many(epochs)) == walked, desc
+        for e in epochs[::97]:
+            t = schedule.next_transition(e)
+            if t is None:
+                assert len(set(walked)) == 1, desc
+            else:
+                assert t > e and is_open_by_walking(t, schedule) != is_open_by_walking(e, schedule), desc
+                assert is_open_by_walking(t - 1, schedule) == is_open_by_walking(e, schedule), desc
+    print("SCHEDULE TESTS PASSED")
+
+    schedule = parse("Mo-Fr 09:00-17:00; Sa 10:00-12:00")
+    epochs = numpy.arange(start, start + 100000 * 60, 60)
+    t = time.perf_counter()
+    for e in epochs[:20000].tolist():
+        is_open_by_walking(e, schedule)
+    walking = (time.perf_counter() - t) / 20000
+    t = time.perf_counter()
+    for e in epochs[:20000].tolist():
+        schedule.is_open(e)
+    compiled = (time.perf_counter() - t) / 20000
+    t = time.perf_counter()
+    schedule.is_open_many(epochs)
+    many = (time.perf_counter() - t) / len(epochs)
+    print("is_open() by walking specs {:.2f}us, compiled {:.2f}us, is_open_many() {:.3f}us per time".format(walking * 1e6, compiled * 1e6, many * 1e6))
+
 if __name__ == "__main__":
     selfTest()
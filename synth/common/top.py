@@ -33,9 +33,9 @@ class top():
     def get(self):
         """Return a list of latest property-values by device""" 
         L = []            
-        for dev, proptuples in self.top_devices.iteritems():
+        for dev, proptuples in self.top_devices.items():
             props = {}
-            for name,time_and_value in proptuples.iteritems():  # Assemble normal properties set (without times)
+            for name,time_and_value in proptuples.items():  # Assemble normal properties set (without times)
                 props[name] = time_and_value[1]
             L.append(props)
         return L
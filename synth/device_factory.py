@@ -1,5 +1,23 @@
 """DEVICE_FACTORY
-   A device factory. TODO: Turn this into a class."""
+   A device factory. TODO: Turn this into a class.
+
+   Devices are indexed by property, so that finding them doesn't need a scan of every device. The $id index is always kept;
+   an index on any other property is built the first time devices are looked-up by it (e.g. "site", or "metadata.type" for LoRa gateways),
+   and from then on is kept up to date by Basic.set_property() and set_properties(). Lookups return devices in order of creation,
+   as a scan would. Property values which can't be hashed (e.g. lists) aren't indexed, and looking-up such a value falls back to a scan.
+
+   Devices with a numeric "latitude" and "longitude" are also indexed by location (see common/geo/spatial.py), so get_nearest_devices()
+   and get_devices_within() find devices near a point - optionally only those with a given property value, e.g. LoRa gateways -
+   by great-circle distance and without a scan. As with property indexes, each location index is built the first time it's used,
+   and is kept up to date as devices move. Devices at the same distance are returned in order of creation.
+
+   Other code can also watch a property, with watch_property(), to be told whenever any device changes it (the model uses this
+   to keep running totals for aggregate devices). Watchers are forgotten when devices are restored from a checkpoint, so anything
+   which watches must check g_generation, and if it has changed start watching again (and catch up with any changes it missed).
+
+   Unless the scenario sets ``"group_properties" : false``, each event callback runs inside an implicit property group (see PropertyGrouper):
+   all the properties which it sets on a device at one time are sent as a single message when the callback returns,
+   rather than one message per set_property() call."""
 #
 # Copyright (c) 2017 DevicePilot Ltd.
 #
@@ -21,26 +39,72 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import gc
+import threading
 import logging
 import traceback
 import copy
 import json
+import bisect
 import pendulum
 from common import importer
 from common import conftime
+from common.geo import spatial
 from devices.basic import Basic
 
+g_classes = {}         # Tuple of class names -> composite class
+g_templates = {}       # id of a "functions" spec -> (spec, Template). Holding the spec stops its id being reused
 g_devices = []
+g_positions = {}        # Device -> its position in g_devices
+g_indexes = { "$id" : {} }  # Property name -> { value : [(position, device)] in order of position }
+g_watchers = { "$id" : [] } # Property name -> [functions f(device, prop, old_value, new_value)] to call before a device changes it. Includes all indexed properties, so Basic need only check this
+g_generation = 0        # Incremented whenever devices are restored, which forgets all watchers
+ABSENT = object()       # Passed as the old value of a property which a device didn't have
+LOCATION = ("latitude", "longitude")
+g_spatial = {}          # (prop, value) -> spatial.SpatialIndex of located devices whose prop is value. (None, None) indexes all located devices
+g_grouping_thread = None    # While a PropertyGrouper is executing an event callback, the thread executing it
+g_grouped = []          # Devices with implicitly-grouped properties waiting to be sent
+
+class PropertyGrouper():
+    """Executes event callbacks (via Engine.set_profiler()) inside an implicit property group, so that all the properties
+       which a callback sets on one device at one time are sent as one message when it returns. Chains to <profiler>, if any"""
+    def __init__(self, profiler = None):
+        self.profiler = profiler
+        self.thread = threading.get_ident()     # The engine thread. Properties set from other threads aren't grouped
+
+    def call(self, fn, arg):
+        global g_grouping_thread
+        g_grouping_thread = self.thread
+        if self.profiler is None:
+            fn(arg)
+        else:
+            self.profiler.call(fn, arg)
+        g_grouping_thread = None
+        send_grouped()
+
+def send_grouped():
+    """Send all implicitly-grouped properties, device by device in the order in which they were first set"""
+    global g_grouped
+    if len(g_grouped) > 0:
+        (devices, g_grouped) = (g_grouped, [])
+        for d in devices:
+            d.send_implicit_group()
 
 def compose_class(class_names):
-    """Create a composite class from a list of class names."""
+    """Create a composite class from a list of class names (or return the one we made before)."""
+    key = tuple(class_names)
+    if key not in g_classes:
+        g_classes[key] = _compose_class(class_names)
+    return g_classes[key]
+
+def _compose_class(class_names):
     classes = []
     classes.append(Basic)   # Class is the root of inheritance
     for class_name in class_names:
         if class_name != "basic":   # Normally this is not explicitly specified, so is implicit, but even it is explicit we want to ensure that it's the last class added
             classes.append(importer.get_class('device', class_name))
     classes.reverse()   # In each device class constructor, the first thing we do is to call super(). This means that (in terms of the order of execution of all the init code AFTER that call to super()), the last shall be first
-    return type("compositeDeviceClass", tuple(classes), {})
+    return type("compositeDeviceClass", tuple(classes), { "composed_from" : class_names })  # Remember how it was made, so it can be made again (see checkpoint.py)
 
 def sort_by_suffix(dictionary):
     # Given a dictionary whose keys may each have an optional ":N" at the end,
@@ -62,13 +126,71 @@ def sort_by_suffix(dictionary):
     result = [x[1] for x in pairs]
     return result
 
+class Template():
+    """A "functions" spec, compiled once into what's needed to create devices from it (events and models create many devices from the same spec)"""
+    def __init__(self, functions):
+        self.functions = dict(functions)    # sort_by_suffix() changes the dict it's given, and the spec must stay as it was for the next device
+        self.class_names = sort_by_suffix(self.functions)
+        self.cls = compose_class(self.class_names)
+
+def get_template(functions):
+    entry = g_templates.get(id(functions), None)
+    if entry is None:
+        entry = (functions, Template(functions))
+        g_templates[id(functions)] = entry
+    return entry[1]
+
 def create_device(args):
     global g_devices
     (instance_name, client, engine, update_callback, context, params) = args
     
-    sorted_class_names = sort_by_suffix(params["functions"])
-    C = compose_class(sorted_class_names)        # Create a composite device class from all the given class names
-    d = C(instance_name, engine.get_now(), engine, update_callback, context, params["functions"])   # Instantiate it
+    template = get_template(params["functions"])
+    d = template.cls(instance_name, engine.get_now(), engine, update_callback, context, template.functions)   # Instantiate it
+    finish_creating(d, client, engine, params)
+    return d
+
+def create_devices(args):
+    """Create a cohort of params["count"] devices from the same spec, in one go.
+       Each device's boot messages (from Basic, and from each function which sets properties as it starts) are combined
+       into one message per device, and instead of logging each device we log the cohort"""
+    (instance_name, client, engine, update_callback, context, params) = args
+    template = get_template(params["functions"])
+    count = params.get("count", 1)
+    first_number = Basic.device_number
+    t = engine.get_now()
+    gc_enabled = gc.isenabled()
+    gc.disable()    # We're about to create a lot of objects and no garbage, so collection would be slow and pointless
+    try:
+        for i in range(count):
+            boot_messages = []
+            def collect(the_id, ts, properties):
+                boot_messages.append((the_id, ts, properties))
+            d = template.cls.__new__(template.cls)
+            d.in_cohort = True      # Tells Basic not to log
+            d.__init__(instance_name, t, engine, collect, context, template.functions)
+            del d.in_cohort         # (So it doesn't stay on the device, e.g. in checkpoints)
+            send_grouped()          # Properties which the device set as it started go into its boot message too
+            d.update_callback = update_callback
+            for (the_id, ts, properties) in combine_messages(boot_messages):
+                update_callback(the_id, ts, properties)
+            finish_creating(d, client, engine, params)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if count > 0:
+        logging.info("Created devices " + str(first_number+1) + " to " + str(Basic.device_number) + " (" + "+".join(template.class_names) + ")")
+
+def combine_messages(messages):
+    """Combine consecutive messages which are for the same device at the same time"""
+    result = []
+    for (the_id, ts, properties) in messages:
+        if len(result) > 0 and result[-1][0] == the_id and result[-1][1] == ts:
+            result[-1][2].update(properties)
+        else:
+            result.append((the_id, ts, properties.copy()))
+    return result
+
+def finish_creating(d, client, engine, params):
     client.add_device(d.properties["$id"], engine.get_now(), d.properties)
 
     if "stop_at" in params:
@@ -78,9 +200,28 @@ def create_device(args):
     if get_device_by_property("$id", d.properties["$id"]) != None:
         logging.error("FATAL: Attempt to create duplicate device "+str(d.properties["$id"]))
         exit(-1)
+    add_device(d)
+
+def add_device(d):
+    g_positions[d] = len(g_devices)
     g_devices.append(d)
+    for prop in g_indexes:
+        if prop in d.properties:
+            _index(d, prop, d.properties[prop])
+    if len(g_spatial) > 0:
+        location_changed(d)
 
-    return d
+def restore_devices(devices):
+    """Replace all devices (e.g. from a checkpoint), and rebuild the indexes"""
+    global g_devices, g_positions, g_indexes, g_watchers, g_generation, g_spatial
+    g_devices = []
+    g_positions = {}
+    g_indexes = { prop : {} for prop in g_indexes }
+    g_watchers = { prop : [] for prop in g_indexes }
+    g_generation += 1
+    g_spatial = {}  # Location indexes are rebuilt when next used
+    for d in devices:
+        add_device(d)
 
 def stop_device(args):
     # We stop a device by removing all its pending events
@@ -95,22 +236,108 @@ def num_devices():
     return n
 
 def get_device_by_property(prop, value):
-    global g_devices
-    for d in g_devices:
-        if prop in d.properties:
-            if d.properties[prop] == value:
-                return d
-    return None
+    devs = get_devices_by_property(prop, value)
+    if len(devs) == 0:
+        return None
+    return devs[0]
 
 def get_devices_by_property(prop, value):
     # Same as above, but return list of all matching devices
-    global g_devices
-    devs = []
+    if prop not in g_indexes:
+        _build_index(prop)
+    try:
+        entries = g_indexes[prop].get(value, [])
+    except TypeError:   # Unhashable, so can't be in the index
+        return [d for d in g_devices if prop in d.properties and d.properties[prop] == value]
+    return [d for (_, d) in entries]
+
+def property_changing(d, prop, old_value, new_value):
+    """Called (by Basic) before a device changes an indexed or watched property. old_value is ABSENT if the device doesn't yet have the property"""
+    if d not in g_positions:    # Not yet created (devices set properties as they're constructed, and are indexed when they're added)
+        return
+    if prop in g_indexes:
+        if old_value is not ABSENT:
+            _unindex(d, prop, old_value)
+        _index(d, prop, new_value)
+        for ((p, value), index) in g_spatial.items():   # Move it between location indexes which depend on this property
+            if p == prop:
+                if value == new_value:
+                    _locate(index, d)
+                else:
+                    index.remove(d)
+    for fn in g_watchers[prop]:
+        fn(d, prop, old_value, new_value)
+
+def watch_property(prop, fn):
+    """From now on, call fn(device, prop, old_value, new_value) before any (already-created) device changes <prop>"""
+    fns = g_watchers.setdefault(prop, [])
+    if fn not in fns:
+        fns.append(fn)
+
+def location_changed(d):
+    """Called (by Basic) after a device changes its latitude or longitude, if there are any location indexes"""
+    if d not in g_positions:
+        return
+    for ((prop, value), index) in g_spatial.items():
+        if prop is None or (prop in d.properties and d.properties[prop] == value):
+            _locate(index, d)
+
+def get_nearest_devices(latitude, longitude, count = 1, prop = None, value = None):
+    """Return a list of up to <count> (distance in km, device) nearest to a point, nearest first.
+       If <prop> is given, only devices whose <prop> is <value> (which must be hashable)"""
+    return _spatial_index(prop, value).nearest(latitude, longitude, count)
+
+def get_devices_within(latitude, longitude, radius_km, prop = None, value = None):
+    """Return a list of (distance in km, device) for all devices within <radius_km> of a point, nearest first.
+       If <prop> is given, only devices whose <prop> is <value> (which must be hashable)"""
+    return _spatial_index(prop, value).within(latitude, longitude, radius_km)
+
+def _spatial_index(prop, value):
+    index = g_spatial.get((prop, value), None)
+    if index is None:
+        index = spatial.SpatialIndex()
+        if prop is None:
+            devices = g_devices
+        else:
+            devices = get_devices_by_property(prop, value)  # (Which also makes sure <prop> is indexed, so property_changing() tells us when it changes)
+        for d in devices:
+            _locate(index, d)
+        g_spatial[(prop, value)] = index
+    return index
+
+def _locate(index, d):
+    (lat, lon) = (d.properties.get("latitude", None), d.properties.get("longitude", None))
+    if type(lat) in (int, float) and type(lon) in (int, float):
+        index.set(d, lat, lon, g_positions[d])
+    else:
+        index.remove(d)
+
+def _build_index(prop):
+    g_indexes[prop] = {}
+    g_watchers.setdefault(prop, [])
     for d in g_devices:
         if prop in d.properties:
-            if d.properties[prop] == value:
-                devs.append(d)
-    return devs
+            _index(d, prop, d.properties[prop])
+
+def _index(d, prop, value):
+    try:
+        entries = g_indexes[prop].setdefault(value, [])
+    except TypeError:   # Unhashable values aren't indexed
+        return
+    bisect.insort(entries, (g_positions[d], d))    # Positions are unique, so devices themselves are never compared
+
+def _unindex(d, prop, value):
+    try:
+        entries = g_indexes[prop].get(value, None)
+    except TypeError:
+        return
+    if entries is None:
+        return
+    i = bisect.bisect_left(entries, (g_positions[d],))
+    if i < len(entries) and entries[i][1] is d:
+        del entries[i]
+        if len(entries) == 0:
+            del g_indexes[prop][value]
 
 ##def logString(s, time=None):
 ##    logging.info(s)
@@ -123,15 +350,14 @@ def get_devices_by_property(prop, value):
 def external_event(params):
     """Accept events from outside world.
     (these have already been synchronised via the event queue so we don't need to worry about thread-safety here)"""
-    global g_devices
     body = params["body"]
     try:
         logging.debug("external Event received: "+str(params))
-        for d in g_devices:
-            if d.properties["$id"] == body["deviceId"]:
-                arg = body.get("arg", None)
-                d.external_event(body["eventName"], arg)
-                return
+        d = get_device_by_property("$id", body["deviceId"])
+        if d is not None:
+            arg = body.get("arg", None)
+            d.external_event(body["eventName"], arg)
+            return
         logging.error("No such device "+str(body["deviceId"])+" for incoming event "+str(body["eventName"]))
     except Exception as e:
         logging.error("Error processing external_event: "+str(e))
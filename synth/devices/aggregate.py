@@ -1,7 +1,9 @@
 """
 Aggregate
 =====
-Aggregates properties within the model
+Aggregates properties within the model: every 15 minutes, sets <name>_average to the average of property <name>
+over the device's peers and the devices below it in the model hierarchy (see model.get_peers_and_below()).
+Booleans are averaged as the fraction of devices for which they're true.
 
 Configurable parameters::
 
@@ -27,7 +29,7 @@ class Aggregate(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         super(Aggregate,self).__init__(instance_name, time, engine, update_callback, context, params)
         self.set_property("device_type", "aggregate")
-        self.engine.register_event_in(POLL_INTERVAL_S, self.tick_aggregate, self, self)
+        self.engine.register_periodic(POLL_INTERVAL_S, self.tick_aggregate, self, self)
         self.numbers_to_aggregate = params["aggregate"].get("numbers", [])
         self.booleans_to_aggregate = params["aggregate"].get("booleans", [])
 
@@ -44,49 +46,17 @@ class Aggregate(Device):
     # Private methods
 
     def do_aggregation(self):
-        # logging.info("Doing aggregation for device "+str(self.get_property("$id") + " " + str(self.model_spec)))
-        # logging.info("Looking for "+str(self.numbers_to_aggregate) + " and "+str(self.booleans_to_aggregate))
-        devices = self.model.get_peers_and_below(self)
-        numbers = {}  # A set of lists, one for each property type of interest
-        booleans = {}  # A set of lists, one for each property type of interest
-        for d in devices:
-            new_props = d.get_properties()
-            for p in new_props:
-                # logging.info("Considering property "+str(p))
-                if p in self.numbers_to_aggregate:
-                    # logging.info("Aggregating number "+str(p))
-                    if p in numbers:
-                        numbers[p].append(new_props[p])
-                    else:
-                        numbers[p] = [new_props[p]]
-                if p in self.booleans_to_aggregate:
-                    # logging.info("Aggregating boolean "+str(p))
-                    if p in booleans:
-                        booleans[p].append(new_props[p])
-                    else:
-                        booleans[p] = [new_props[p]]
-        # logging.info("Numbers: "+str(numbers))
-        # logging.info("Booleans: "+str(booleans))
-        # Now aggregate
-        for p in numbers:
-            result = 0.0
-            for n in numbers[p]:
-                result += n
-            result /= len(numbers[p])
-            # logging.info("set property "+str(p)+" = "+str(result))
-            self.set_property(p+"_average", result)
-
-        for p in booleans:
-            result = 0.0
-            for n in booleans[p]:
-                if n:
-                    result += 1.0
-            result /= float(len(booleans[p]))
-            # logging.info("set property "+str(p)+" = "+str(result))
-            self.set_property(p+"_average", result)
+        # The model keeps running totals of each property over each part of the hierarchy, so we don't need to visit every device
+        for p in self.numbers_to_aggregate:
+            total = self.model.total_of_peers_and_below(self, p)
+            if total.number_count > 0:
+                self.set_property(p+"_average", total.mean())
 
+        for p in self.booleans_to_aggregate:
+            total = self.model.total_of_peers_and_below(self, p)
+            if total.count > 0:
+                self.set_property(p+"_average", total.fraction_true())
 
     def tick_aggregate(self, _):
         self.do_aggregation()
-        self.engine.register_event_in(POLL_INTERVAL_S, self.tick_aggregate, self, self)
 
@@ -20,14 +20,18 @@ Device properties created::
 """
 
 import random
+import threading
 import logging
 from .device import Device
 from common import importer
+import device_factory
 
 class Basic(Device):
     device_number = 0
     myRandom = random.Random()  # Use our own private random-number generator, so we will repeatably generate the same device ID's regardless of who else is asking for random numbers
     myRandom.seed(1234)
+    implicit_group = None   # Properties waiting to be sent as one message when the current event callback returns (see device_factory.PropertyGrouper)
+    implicit_group_forced = False
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         self.instance_name = instance_name
         self.creation_time = time
@@ -50,7 +54,8 @@ class Basic(Device):
                 self.properties["$id"] = "-".join([format(Basic.myRandom.randrange(0,255),'02x') for i in range(6)])  # A 6-byte MAC address 01-23-45-67-89-ab
             self.properties["label"] = label
         self.do_comms(self.properties, force_comms=True) # Communicate ALL properties on boot (else device and its properties might not be created if comms is down).
-        logging.info("Created device " + str(Basic.device_number+1) + " : " + self.properties["$id"])
+        if not getattr(self, "in_cohort", False):    # device_factory.create_devices() logs the whole cohort instead
+            logging.info("Created device " + str(Basic.device_number+1) + " : " + self.properties["$id"])
         Basic.device_number = Basic.device_number + 1
         self.in_property_group = False
         
@@ -129,13 +134,19 @@ class Basic(Device):
             timestamp = self.engine.get_now()
 
         new_props = { prop_name : value, "$id" : self.properties["$id"], "$ts" : timestamp }
+        if changed and prop_name in device_factory.g_watchers:
+            device_factory.property_changing(self, prop_name, self.properties.get(prop_name, device_factory.ABSENT), new_props[prop_name])
         self.properties.update(new_props)
+        if changed and prop_name in device_factory.LOCATION and len(device_factory.g_spatial) > 0:
+            device_factory.location_changed(self)
         # logging.info("set_prop")
         if changed or always_send:
             # logging.info("c or as")
             if self.in_property_group:
                 # logging.info("in group")
                 self.property_group.update(new_props)
+            elif device_factory.g_grouping_thread == threading.get_ident():
+                self.group_implicitly(new_props, force_send)
             else:
                 # logging.info("not in group")
                 self.do_comms(new_props, timestamp = timestamp, force_comms = force_send)
@@ -143,8 +154,17 @@ class Basic(Device):
     def set_properties(self, new_props):
         np = new_props.copy()
         np.update({ "$id" : self.properties["$id"], "$ts" : self.engine.get_now() })  # Force ID and timestamp to be correct
+        for prop_name in device_factory.g_watchers.keys() & np.keys():
+            old_value = self.properties.get(prop_name, device_factory.ABSENT)
+            if old_value is device_factory.ABSENT or old_value != np[prop_name]:
+                device_factory.property_changing(self, prop_name, old_value, np[prop_name])
         self.properties.update(np)
-        self.do_comms(np)    # TODO: Suppress if unchanged
+        if len(device_factory.g_spatial) > 0 and ("latitude" in np or "longitude" in np):
+            device_factory.location_changed(self)
+        if device_factory.g_grouping_thread == threading.get_ident():
+            self.group_implicitly(np, False)
+        else:
+            self.do_comms(np)    # TODO: Suppress if unchanged
 
     def start_property_group(self):
         """Mark the beginning of a group of set_property() updates, which we want to group as a single message"""
@@ -154,7 +174,29 @@ class Basic(Device):
 
     def end_property_group(self):
         assert self.in_property_group == True
-        self.do_comms(self.property_group)
+        if len(self.property_group) > 0 and device_factory.g_grouping_thread == threading.get_ident():
+            self.group_implicitly(self.property_group, False)
+        else:
+            self.do_comms(self.property_group)
 
         self.in_property_group = False
         self.property_group = {}
+
+    def group_implicitly(self, new_props, force_send):
+        """Add properties (with their $ts) to our implicit group. Properties set at different times go in different messages"""
+        group = self.implicit_group
+        if group is not None and group["$ts"] != new_props["$ts"]:
+            self.send_implicit_group()
+            group = None
+        if group is None:
+            group = self.implicit_group = {}
+            self.implicit_group_forced = False
+            device_factory.g_grouped.append(self)
+        group.update(new_props)
+        self.implicit_group_forced = self.implicit_group_forced or force_send
+
+    def send_implicit_group(self):
+        group = self.implicit_group
+        if group is not None:
+            self.implicit_group = None
+            self.do_comms(group, timestamp = group["$ts"], force_comms = self.implicit_group_forced)
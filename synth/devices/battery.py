@@ -24,7 +24,7 @@ Device properties created::
 
 from .device import Device
 import random
-import isodate
+from common import conftime
 import logging
 
 REPORT_PERIOD = 60*60*24    # It would be more elegant to only report when battery percentage (an integer) changes, but that would mean very infrequent reporting which isn't good for demos
@@ -33,8 +33,8 @@ class Battery(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         """Set battery life with a normal distribution which won't exceed 2 standard deviations."""
         super(Battery,self).__init__(instance_name, time, engine, update_callback, context, params)
-        mu = isodate.parse_duration(params["battery"].get("life_mu", "P1M")).total_seconds()
-        sigma = isodate.parse_duration(params["battery"].get("life_sigma", "PT0S")).total_seconds()
+        mu = conftime.duration_seconds(params["battery"].get("life_mu", "P1M"))
+        sigma = conftime.duration_seconds(params["battery"].get("life_sigma", "PT0S"))
         life = random.normalvariate(mu, sigma)
         life = min(life, mu+2*sigma)
         life = max(life, mu-2*sigma)
@@ -43,7 +43,7 @@ class Battery(Device):
         life = max(life, 60) # A battery life of 0 causes auto-replace to blow up.
         self.battery_life = life
         self.battery_autoreplace = params["battery"].get("autoreplace", False)
-        self.battery_autoreplace_delay = isodate.parse_duration(params["battery"].get("autoreplace_delay", "P7D")).total_seconds()
+        self.battery_autoreplace_delay = conftime.duration_seconds(params["battery"].get("autoreplace_delay", "P7D"))
         self.battery_install_time = self.engine.get_now()
         self.set_property("battery", 100)
         self.engine.register_event_in(REPORT_PERIOD, self.tick_battery_decay, self, self)
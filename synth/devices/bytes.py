@@ -25,7 +25,7 @@ class Bytes(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         self.bytes_sent_this_interval = 0
         super(Bytes,self).__init__(instance_name, time, engine, update_callback, context, params)
-        self.engine.register_event_in(BYTECOUNT_SEND_INTERVAL_S, self.tick_sendbytes, self, self)
+        self.engine.register_periodic(BYTECOUNT_SEND_INTERVAL_S, self.tick_sendbytes, self, self)
 
     def comms_ok(self):
         return super(Bytes,self).comms_ok()
@@ -43,4 +43,3 @@ class Bytes(Device):
     def tick_sendbytes(self, _):
         self.set_property("bytes_sent", self.bytes_sent_this_interval)
         self.bytes_sent_this_interval = 0
-        self.engine.register_event_in(BYTECOUNT_SEND_INTERVAL_S, self.tick_sendbytes, self, self)
@@ -23,7 +23,7 @@ Device properties created::
 """
 import logging
 import random
-import isodate
+from common import conftime
 from .helpers import opening_times as opening_times
 
 from .device import Device
@@ -85,7 +85,7 @@ class Charger(Device):
         self.set_property("max_kW", max_rate)
         self.set_property("monthly_value", max_rate * POWER_TO_MONTHLY_VALUE)
         self.average_charges_per_day = params["charger"].get("average_charges_per_day", DEFAULT_AVERAGE_CHARGES_PER_DAY)
-        self.average_hog_time_s = isodate.parse_duration(params["charger"].get("average_hog_time", DEFAULT_AVERAGE_HOG_TIME)).total_seconds()
+        self.average_hog_time_s = conftime.duration_seconds(params["charger"].get("average_hog_time", DEFAULT_AVERAGE_HOG_TIME))
 
         self.last_charging_start_time = None
         self.set_properties( {
@@ -96,7 +96,7 @@ class Charger(Device):
             "fault" : None
             })
 
-        self.engine.register_event_in(HEARTBEAT_PERIOD, self.tick_heartbeat, self, self)
+        self.engine.register_periodic(HEARTBEAT_PERIOD, self.tick_heartbeat, self, self)
         self.engine.register_event_in(self.delay_to_next_charge(), self.tick_start_charge, self, self)
 
     def comms_ok(self):
@@ -122,7 +122,6 @@ class Charger(Device):
         self.set_properties({
             "heartbeat" : True
             })
-        self.engine.register_event_in(HEARTBEAT_PERIOD, self.tick_heartbeat, self, self)
 
     def tick_start_charge(self, _):
         # Faulty points can't charge
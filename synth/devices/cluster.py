@@ -53,7 +53,7 @@ class Cluster(Device):
         self.available_slots = self.calc_occupancy()
         self.set_properties({"num_slots" : self.num_slots, "available_slots" : self.available_slots})
 
-        engine.register_event_in(TICK_INTERVAL_S, self.tick_availability, self, self)
+        engine.register_periodic(TICK_INTERVAL_S, self.tick_availability, self, self)
 
     def comms_ok(self):
         return super(Cluster,self).comms_ok()
@@ -70,7 +70,6 @@ class Cluster(Device):
     def tick_availability(self, _):
         self.available_slots = self.calc_occupancy()
         self.set_property("available_slots", self.available_slots)
-        self.engine.register_event_in(TICK_INTERVAL_S, self.tick_availability, self, self)
 
     def calc_occupancy(self):
         occupancy = opening_times.chance_of_occupied(self.engine.get_now() + self.time_skew, self.occupancy_pattern)
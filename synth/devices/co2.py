@@ -39,7 +39,7 @@ class Co2(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         super(Co2,self).__init__(instance_name, time, engine, update_callback, context, params)
         self.co2_ppm = sensor_noise(MIN_CO2_LEVEL_PPM)
-        self.engine.register_event_in(CO2_POLL_INTERVAL_S, self.tick_co2, self, self)
+        self.engine.register_periodic(CO2_POLL_INTERVAL_S, self.tick_co2, self, self)
 
     def comms_ok(self):
         return super(Co2,self).comms_ok()
@@ -72,5 +72,4 @@ class Co2(Device):
         target = MIN_CO2_LEVEL_PPM + (MAX_CO2_LEVEL_PPM - MIN_CO2_LEVEL_PPM) * occupancy_fraction
         self.co2_ppm = (self.co2_ppm * (1-COUPLING)) + (target * COUPLING)
         self.set_property("co2_ppm", sensor_noise(self.co2_ppm))
-        self.engine.register_event_in(CO2_POLL_INTERVAL_S, self.tick_co2, self, self)
 
@@ -14,6 +14,7 @@ Configurable parameters::
         "period" :      P1D     Mean period with which device goes up and down [or RSSI varies, if being created] (has exponential tail with max 100x). Defaults to once a day
         "metronomic_period" : false    If true then the up/down period is EXACTLY the above (not random)
         "has_buffer" :  false          If true then the device buffers data while comms is down (else it throws it away)
+        "buffer_limit" : 10000         (optional) The most messages to buffer. During a longer outage the oldest are thrown away (null for no limit)
         "unbuffered_properties" : ["propname",...] (optional) these properties will be lost (not buffered) when comms goes offline - means that e.g. heartbeat messages don't get magically restored after an outage
         "suppress_messages" : false    If true then wont emit log messages
     }
@@ -23,14 +24,22 @@ Device properties created::
     {
             "connected" : true/false     An MQTT-like connection indicator
     }
-    
+
+Each device's comms ticks (and its RSSI at each) are generated ahead, TIMELINE_TICKS at a time, from its own random-number generator
+(seeded from the global one when the device is created), and only the ticks at which comms actually goes up or down are scheduled as events (so none at all if reliability is 1.0).
+A scenario can set ``"comms_timelines" : false`` to instead schedule an event for every tick, drawing from the global random-number
+generator as it goes (which is how comms used to work, so gives the same results as older versions of Synth).
 """
 
 
 from .device import Device
 from .helpers import timewave
 import random
-import isodate
+import collections
+from array import array
+from bisect import bisect_right
+import numpy
+from common import conftime
 import logging
 
 BEST_RSSI = -50.0
@@ -38,6 +47,8 @@ WORST_RSSI = -120.0
 DEFAULT_RSSI_KNEE = -90.0           # Below this, comms gets progressively less reliable
 DEFAULT_CHANCE_ABOVE_KNEE = 0.95    # Chance of any comms being OK if above knee
 DEFAULT_CHANCE_AT_WORST = 0.00      # Chance of any comms being OK if RSSI is at worst
+DEFAULT_BUFFER_LIMIT = 10000        # Messages
+TIMELINE_TICKS = 256                # Number of up/down ticks generated at a time
 
 class Comms(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
@@ -48,7 +59,7 @@ class Comms(Device):
             self.rssi_mean = WORST_RSSI + rssi_span*0.2 + random.random() * rssi_span*0.8   # Mean value for RSSI of any particular device lies between a fifth and four fifths of the range
             self.rssi_sigma = rssi_span/12 
             self.set_rssi()
-        self.comms_up_down_period = isodate.parse_duration(params["comms"].get("period", "P1D")).total_seconds()
+        self.comms_up_down_period = conftime.duration_seconds(params["comms"].get("period", "P1D"))
         self.comms_metronomic_period = params["comms"].get("metronomic_period", False)
         self.has_buffer = params["comms"].get("has_buffer", False)
         self.suppress_messages = params["comms"].get("suppress_messages", False)
@@ -56,12 +67,30 @@ class Comms(Device):
         self.chance_above_knee = params["comms"].get("reliability_above_rssi_knee", DEFAULT_CHANCE_ABOVE_KNEE)
         self.chance_at_worst = params["comms"].get("reliability_at_worst", DEFAULT_CHANCE_AT_WORST)
         self.rssi_knee = params["comms"].get("rssi_knee", DEFAULT_RSSI_KNEE)
-        self.buffer = []
+        self.buffer = collections.deque(maxlen=params["comms"].get("buffer_limit", DEFAULT_BUFFER_LIMIT))   # A ring, so a long outage can't use unlimited memory
         self.messages_attempted = 0
         self.messages_sent = 0
         self.messages_delayed = 0
+        self.messages_dropped = 0
+        self.comms_timeline = context.get("comms_timelines", True)
+        self.comms_always_up = isinstance(self.comms_reliability, (int,float)) and self.comms_reliability >= 1.0     # So its timeline has nothing in it
+        if self.comms_timeline and not self.comms_always_up:
+            self.timeline_seed = random.getrandbits(64)
+            self.timeline_blocks = 0
+            self.timeline_end = engine.get_now()    # The first tick happens as the device is created
+            self.timeline_ok = True                 # Comms state after the last tick generated so far
+            self.change_times = array("d")                  # Ticks at which comms changes ...
+            self.change_states = array("b")                 # ... and what it changes to
+            self.change_index = 0
+            self.rssi_times = array("d")                    # Every tick ...
+            self.rssi_values = array("h")                   # ... and the RSSI from then on
+            self.extend_comms_timeline(engine.get_now())
         super(Comms,self).__init__(instance_name, time, engine, update_callback, context, params)   # Chain other classes last, so we set ourselves up before others do, so comms up/down takes effect even on device "boot"
-        engine.register_event_in(0, self.tick_comms_up_down, self, self)
+        if self.comms_timeline:
+            if not self.comms_always_up:
+                self.schedule_comms_timeline()
+        else:
+            engine.register_event_in(0, self.tick_comms_up_down, self, self)
         self.set_property("connected", True)
 
     def comms_ok(self): # Overrides base-class's definition
@@ -72,7 +101,7 @@ class Comms(Device):
         # logging.info("comms.py::transmit")
         if self.ok_comms or force_comms:
             if self.comms_reliability == "rssi":
-                properties["rssi"] = self.rssi  # Add an RSSI property to any outgoing messages
+                properties["rssi"] = self.current_rssi()  # Add an RSSI property to any outgoing messages
             super(Comms, self).transmit(the_id, ts, properties, force_comms)
             self.messages_sent += 1
             # logging.info("(doing comms)")
@@ -83,6 +112,10 @@ class Comms(Device):
                     if p in properties:
                         logging.info("Throwing-away unbuffered property "+str(p))
                         del properties[p]
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.messages_dropped += 1
+                    if self.messages_dropped == 1 and not self.suppress_messages:
+                        logging.warning("comms.py: buffer full for device " + str(self.properties["$id"]) + ", so throwing away its oldest messages")
                 self.buffer.append( (the_id, ts, properties) )
             else:
                 pass # Discard data
@@ -94,7 +127,8 @@ class Comms(Device):
         logging.info("Comms report for " + str(self.properties["$id"]) + " " +
                 str(self.messages_sent) + " sent ("+str(100 * self.messages_sent/self.messages_attempted) + "%) and " +
                 str(self.messages_delayed) + " delayed ("+str(100 * self.messages_delayed/self.messages_attempted) + "%) of " +
-                str(self.messages_attempted) + " total")
+                str(self.messages_attempted) + " total" +
+                ("" if self.messages_dropped == 0 else (", and " + str(self.messages_dropped) + " dropped from a full buffer")))
         super(Comms,self).close()
 
     # Private methods
@@ -122,6 +156,7 @@ class Comms(Device):
         if ok and (not self.ok_comms): # Comms coming back online
             self.ok_comms = True
             self.set_property("connected", True)    # Send this *after* restoring comms!
+            self.send_implicit_group()              # ... and before anything buffered
             if not self.suppress_messages:
                 logging.info("comms.py: comms coming back online for device "+str(self.properties["$id"]))
             if self.has_buffer:
@@ -129,10 +164,11 @@ class Comms(Device):
                     logging.info("comms.py: ... so now transmitting " + str(len(self.buffer)) + " buffered events")
                 for e in self.buffer:   # Transmit everything stored while we were offline
                     self.transmit(e[0],e[1],e[2], True)
-                self.buffer = []
+                self.buffer.clear()
 
         if (not ok) and self.ok_comms:  # Comms going offline
             self.set_property("connected", False)   # Send this *before* stopping comms!
+            self.send_implicit_group()              # (Rather than when the current event callback returns)
             self.ok_comms = False
             if not self.suppress_messages:
                 logging.info("comms.py: comms going offline for device " + str(self.properties["$id"]))
@@ -154,6 +190,63 @@ class Comms(Device):
             delta_time = min(delta_time, self.comms_up_down_period * 10.0) # Limit long tail
         self.engine.register_event_in(delta_time, self.tick_comms_up_down, self, self)
 
+    def current_rssi(self):
+        if not self.comms_timeline:
+            return self.rssi
+        i = max(0, bisect_right(self.rssi_times, self.engine.get_now()) - 1)
+        return self.rssi_values[i]
+
+    def extend_comms_timeline(self, now):
+        """Generate the next TIMELINE_TICKS ticks, keeping only those at which comms changes (and the RSSI of every tick)"""
+        n = TIMELINE_TICKS
+        rng = numpy.random.Generator(numpy.random.PCG64((self.timeline_seed << 32) + self.timeline_blocks))   # So each block can be generated from scratch
+        self.timeline_blocks += 1
+        times = numpy.empty(n + 1)
+        times[0] = self.timeline_end
+        if self.comms_metronomic_period:
+            times[1:] = self.comms_up_down_period
+        else:
+            times[1:] = rng.exponential(self.comms_up_down_period, n)
+            times[1:].clip(60.0, self.comms_up_down_period * 10.0, out=times[1:])   # Never more than once a minute, and limit long tail
+        times.cumsum(out=times)     # (Adding each interval in turn, just as scheduling each tick would)
+        if isinstance(self.comms_reliability, (int,float)):   # Simple probability
+            ok = rng.random(n) < self.comms_reliability
+        elif self.comms_reliability=="rssi":
+            rssi = numpy.trunc(numpy.clip(rng.normal(self.rssi_mean, self.rssi_sigma, n), WORST_RSSI, BEST_RSSI)).astype(numpy.int16)
+            chance = self.chance_at_worst + (rssi - WORST_RSSI) / (self.rssi_knee - WORST_RSSI) * (self.chance_above_knee - self.chance_at_worst)
+            chance = numpy.where(rssi > self.rssi_knee, self.chance_above_knee, chance)
+            ok = rng.random(n) < chance
+            keep = max(0, bisect_right(self.rssi_times, now) - 1)   # Forget RSSIs which can no longer be needed
+            self.rssi_times = self.rssi_times[keep:] + array("d", times[:n].tolist())
+            self.rssi_values = self.rssi_values[keep:] + array("h", rssi.tolist())
+        else:
+            assert False, "comms_reliability spec of "+str(self.comms_reliability)+" not supported"
+        changes = numpy.flatnonzero(ok[1:] != ok[:-1]) + 1
+        if ok[0] != self.timeline_ok:
+            changes = numpy.concatenate(([0], changes))
+        self.change_times = array("d", times[changes].tolist())
+        self.change_states = array("b", ok[changes].tolist())
+        self.change_index = 0
+        self.timeline_ok = bool(ok[-1])
+        self.timeline_end = float(times[n])
+
+    def schedule_comms_timeline(self):
+        """Schedule an event for the next change of comms, or for the end of the timeline if comms doesn't change before then"""
+        if self.change_index >= len(self.change_times):
+            self.extend_comms_timeline(self.engine.get_now())
+        if self.change_index < len(self.change_times):
+            t = self.change_times[self.change_index]
+        else:
+            t = self.timeline_end
+        self.engine.register_event_at(t, self.tick_comms_timeline, self, self)
+
+    def tick_comms_timeline(self, _):
+        now = self.engine.get_now()
+        while self.change_index < len(self.change_times) and self.change_times[self.change_index] <= now:
+            self.change_comms(bool(self.change_states[self.change_index]))
+            self.change_index += 1
+        self.schedule_comms_timeline()
+
 # Model for comms unreliability
 # -----------------------------
 # Two variables define comms (un)reliability:
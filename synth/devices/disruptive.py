@@ -58,7 +58,7 @@ Device properties created::
 import random
 import logging
 import time
-import isodate
+from common import conftime
 from math import sin, pi
 
 from .device import Device
@@ -135,11 +135,11 @@ class Disruptive(Device):
         self.set_property("device_type", "DT_"+self.sensor_type)    # In DP demos we tend to use this property
 
         if(self.sensor_type != "ccon"):
-            engine.register_event_in(BATTERY_INTERVAL, self.tick_battery, self, self)
+            engine.register_periodic(BATTERY_INTERVAL, self.tick_battery, self, self)
             if(params["disruptive"].get("send_network_status", False)):
-                engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
+                engine.register_periodic(NETWORK_INTERVAL, self.tick_network, self, self)
         if(self.sensor_type == "ccon"):
-            engine.register_event_in(CELLULAR_INTERVAL, self.tick_cellular, self, self)
+            engine.register_periodic(CELLULAR_INTERVAL, self.tick_cellular, self, self)
         if(self.sensor_type == "temperature"):
             self.nominal_temperature = params["disruptive"].get("nominal_temp", DEFAULT_NOMINAL_TEMP_C)
             if isinstance(self.nominal_temperature, list):
@@ -154,7 +154,7 @@ class Disruptive(Device):
             if "site_type" in params["disruptive"]:
                 site_type = params["disruptive"]["site_type"][choice]
                 self.set_property("site_type", site_type)
-            engine.register_event_in(TEMPERATURE_INTERVAL, self.tick_temperature, self, self)
+            engine.register_periodic(TEMPERATURE_INTERVAL, self.tick_temperature, self, self)
             self.having_cooling_failure = False
         if(self.sensor_type == "proximity"):
             self.set_property("objectPresent", "PRESENT")   # Door starts closed
@@ -162,8 +162,8 @@ class Disruptive(Device):
 
         self.cooling_mtbf = params["disruptive"].get("cooling_mtbf", None)
         if self.cooling_mtbf:
-            self.cooling_mtbf = isodate.parse_duration(self.cooling_mtbf).total_seconds()
-        self.cooling_ttf = isodate.parse_duration(params["disruptive"].get("cooling_TTF", "P3D")).total_seconds()
+            self.cooling_mtbf = conftime.duration_seconds(self.cooling_mtbf)
+        self.cooling_ttf = conftime.duration_seconds(params["disruptive"].get("cooling_TTF", "P3D"))
 
         Disruptive.odd_site = not Disruptive.odd_site
         if not Disruptive.odd_site:
@@ -183,17 +183,14 @@ class Disruptive(Device):
     def tick_battery(self, _):
         self.set_property("eventType", "batteryPercentage", always_send=True)
         self.set_property("batteryPercentage", 100, always_send=True)
-        self.engine.register_event_in(BATTERY_INTERVAL, self.tick_battery, self, self)
 
     def tick_network(self, _):
         self.set_property("eventType", "networkStatus", always_send=True)
         self.set_property("signalStrengthSensor", 100, always_send=True)
-        self.engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
 
     def tick_cellular(self, _):
         self.set_property("eventType", "cellularStatus", always_send=True)
         self.set_property("signalStrengthCellular", 100, always_send=True)
-        self.engine.register_event_in(CELLULAR_INTERVAL, self.tick_cellular, self, self)
 
     def tick_temperature(self, _):
         # Check for cooling failure
@@ -225,7 +222,6 @@ class Disruptive(Device):
             temp = self.nominal_temperature + cyclic_noise(self.get_property("$id"), self.engine.get_now()) * self.temperature_deviation
 
         self.set_temperature(temp)
-        self.engine.register_event_in(TEMPERATURE_INTERVAL, self.tick_temperature, self, self)
 
     def tick_presence(self, _):
         if self.get_property("objectPresent")=="PRESENT":   # Door currently closed
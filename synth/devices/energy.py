@@ -55,7 +55,7 @@ class Energy(Device):
         else:
             self.set_property("meter_type", "gas")
             self.set_property("icon", "flame")
-        self.engine.register_event_in(ENERGY_READING_INTERVAL_S, self.tick_reading, self, self)
+        self.engine.register_periodic(ENERGY_READING_INTERVAL_S, self.tick_reading, self, self)
 
     def comms_ok(self):
         return super(Energy,self).comms_ok()
@@ -93,5 +93,4 @@ class Energy(Device):
         if self.occupied_bodge:
             self.set_property("occupied", not self.get_property("occupied"))    # !!!!!!!!!!! TEMP BODGE TO OVERCOME CLUSTERING PROBLEM
         self.end_property_group() # <--
-        self.engine.register_event_in(ENERGY_READING_INTERVAL_S, self.tick_reading, self, self)
 
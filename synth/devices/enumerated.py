@@ -29,7 +29,7 @@ Device properties created::
 
 from .device import Device
 import random
-import isodate
+from common import conftime
 import logging
 
 DEFAULT_SIGMA_RATIO = 0.1   # If no sigma specified, it defaults to this fraction of the period
@@ -57,9 +57,9 @@ class Enumerated(Device):
         else:
             self.enumerated_sigmas = []
         for i in range(len(self.enumerated_values)):
-            self.enumerated_periods.append(isodate.parse_duration(periods[i]).total_seconds())
+            self.enumerated_periods.append(conftime.duration_seconds(periods[i]))
             if self.enumerated_sigmas is not None:
-                self.enumerated_sigmas.append(isodate.parse_duration(sigmas[i]).total_seconds())
+                self.enumerated_sigmas.append(conftime.duration_seconds(sigmas[i]))
 
         # Find most likely current state
         recip_periods = [1.0/x for x in self.enumerated_periods]    # The shorter the period, the more likely it is to be the current state]
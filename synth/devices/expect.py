@@ -24,10 +24,11 @@ Device properties created::
 """
 
 import logging, datetime
-import pendulum, isodate
+import pendulum
 import requests, httplib, json
 from .device import Device
 from common import importer
+from common import conftime
 from common import plotting
 
 # Types of event that we log
@@ -54,7 +55,7 @@ class Expect(Device):
         self.expected_timefunction = importer.get_class("timefunction", tf.keys()[0])(engine, self, tf[tf.keys()[0]])
         self.expected_event_name = params["expect"]["event_name"]
         self.expected_instance_name = context["instance_name"]
-        self.expected_ignore_start = isodate.parse_duration(params["expect"].get("ignore_start", "PT0S")).total_seconds()
+        self.expected_ignore_start = conftime.duration_seconds(params["expect"].get("ignore_start", "PT0S"))
         self.expected_required_score_percent = params["expect"].get("required_score_percent", None)
         if not Expect.initialised:
             self.engine.register_event_in(REPORT_PERIOD_S, self.tick_send_report, self, self)
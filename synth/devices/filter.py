@@ -0,0 +1,121 @@
+"""
+filter
+======
+Reduces the volume of output by not sending property values which haven't changed much, or which are being sent too often.
+Each filtered property is judged against the value which was last actually sent. A message whose properties are all filtered-out
+isn't sent at all (but a message which has no properties in the first place, e.g. a heartbeat, is). Messages which
+must be sent (e.g. when a device boots, or comms restores buffered messages) aren't filtered.
+
+Configurable parameters::
+
+    {
+        "properties" : {
+            "<name>" : {            A filter for property <name> (or "*" for any property which doesn't have its own filter)
+                "deadband" : 0.5            (optional) only send a numeric value which has moved at least this far from the value last sent
+                "deadband_percent" : 1.0    (optional) ditto, as a percentage of the value last sent (if both are given, the larger applies)
+                "change_only" : true        (optional) only send a value which is different from the value last sent (implied by a deadband)
+                "min_interval" : "PT10M"    (optional) never send the property more often than this
+                "heartbeat" : "PT6H"        (optional) always send the property if it hasn't been sent for this long, whatever the above say
+            }
+        }
+    }
+
+Filtering happens as the device transmits, so it's independent of how the device's properties are set, and each device
+logs how many messages and properties it suppressed when it closes. Non-numeric values are filtered as if "change_only".
+A heartbeat can only re-send a value when the device sends a message, so if a device falls silent so does its filter.
+
+Device properties created::
+
+    {
+    }
+
+"""
+
+from .device import Device
+from common import conftime
+import logging
+
+NOT_FILTERED = ("$id", "$ts")
+
+class PropertyFilter():
+    def __init__(self, spec):
+        self.deadband = spec.get("deadband", None)
+        self.deadband_percent = spec.get("deadband_percent", None)
+        self.change_only = spec.get("change_only", False) or (self.deadband is not None) or (self.deadband_percent is not None)
+        self.min_interval = None
+        if "min_interval" in spec:
+            self.min_interval = conftime.duration_seconds(spec["min_interval"])
+        self.heartbeat = None
+        if "heartbeat" in spec:
+            self.heartbeat = conftime.duration_seconds(spec["heartbeat"])
+
+    def passes(self, ts, value, last_ts, last_value):
+        """Should <value> be sent at time <ts>, given that <last_value> was last sent at <last_ts>?"""
+        age = ts - last_ts
+        if self.heartbeat is not None and age >= self.heartbeat:
+            return True
+        if self.min_interval is not None and age < self.min_interval:
+            return False
+        if not self.change_only:
+            return True
+        if is_number(value) and is_number(last_value):
+            band = 0.0
+            if self.deadband is not None:
+                band = self.deadband
+            if self.deadband_percent is not None:
+                band = max(band, abs(last_value) * self.deadband_percent / 100.0)
+            if band > 0.0:
+                return abs(value - last_value) >= band
+        return value != last_value
+
+def is_number(v):
+    return type(v) in (int, float)   # (Not bool)
+
+class Filter(Device):
+    def __init__(self, instance_name, time, engine, update_callback, context, params):
+        specs = params["filter"].get("properties", {})
+        self.filters = { name : PropertyFilter(spec) for (name, spec) in specs.items() if name != "*" }
+        self.default_filter = None
+        if "*" in specs:
+            self.default_filter = PropertyFilter(specs["*"])
+        self.filter_last_sent = {}  # Property name -> (time, value) last sent
+        self.filter_messages_suppressed = 0
+        self.filter_properties_suppressed = 0
+        self.filter_messages = 0
+        super(Filter,self).__init__(instance_name, time, engine, update_callback, context, params)
+
+    def comms_ok(self):
+        return super(Filter,self).comms_ok()
+
+    def external_event(self, event_name, arg):
+        super(Filter,self).external_event(event_name, arg)
+
+    def close(self):
+        super(Filter,self).close()
+        logging.info("Filter report for " + str(self.properties["$id"]) + " " +
+            str(self.filter_messages_suppressed) + " of " + str(self.filter_messages) + " messages suppressed, and " +
+            str(self.filter_properties_suppressed) + " properties removed from other messages")
+
+    def transmit(self, the_id, ts, properties, force_comms):
+        self.filter_messages += 1
+        if not force_comms:
+            rejected = [name for name in properties if name not in NOT_FILTERED and not self.filter_passes(name, ts, properties[name])]
+            if len(rejected) > 0:
+                if len(rejected) == len(properties) - len([name for name in NOT_FILTERED if name in properties]):
+                    self.filter_messages_suppressed += 1
+                    return
+                self.filter_properties_suppressed += len(rejected)
+                properties = { name : value for (name, value) in properties.items() if name not in rejected }  # (The caller may still be using its dict)
+        for name in properties:
+            if name in self.filters or (self.default_filter is not None and name not in NOT_FILTERED):
+                self.filter_last_sent[name] = (ts, properties[name])
+        super(Filter,self).transmit(the_id, ts, properties, force_comms)
+
+    def filter_passes(self, name, ts, value):
+        f = self.filters.get(name, self.default_filter)
+        if f is None:
+            return True
+        last = self.filter_last_sent.get(name, None)
+        if last is None:
+            return True
+        return f.passes(ts, value, last[0], last[1])
@@ -19,15 +19,15 @@ Device properties created::
 
 from .device import Device
 import random
-import isodate
+from common import conftime
 import logging
 
 class Heartbeat(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         """Simple metronomic heartbeat transmission so that server knows we're still here"""
         super(Heartbeat,self).__init__(instance_name, time, engine, update_callback, context, params)
-        self.heartbeat_interval = isodate.parse_duration(params["heartbeat"].get("interval", "PT10M")).total_seconds()
-        self.engine.register_event_in(self.heartbeat_interval, self.tick_heartbeat, self, self)
+        self.heartbeat_interval = conftime.duration_seconds(params["heartbeat"].get("interval", "PT10M"))
+        self.engine.register_periodic(self.heartbeat_interval, self.tick_heartbeat, self, self)
 
     def comms_ok(self):
         return super(Heartbeat,self).comms_ok()
@@ -42,5 +42,4 @@ class Heartbeat(Device):
     
     def tick_heartbeat(self,_):
         self.do_comms({})
-        self.engine.register_event_in(self.heartbeat_interval, self.tick_heartbeat, self, self)
         
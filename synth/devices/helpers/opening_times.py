@@ -2,9 +2,15 @@
 opening_times
 =====
 Produce realistic patterns of occupancy
+
+Each pattern gives the chance of being occupied in each hour of the week. Patterns are compiled when this module
+is loaded into a table of 168 chances, so chance_of_occupied() is just an index into a table, and chances_of_occupied()
+looks up a whole array of times at once. Run "python3 -m devices.helpers.opening_times" (from the synth directory) to test and measure.
 """
 import logging
 import time
+import math
+import numpy
 
 #               0   1   2   3   4   5   6   7   8   9  10  11  12  13  14  15  16  17  18  19  20  21  22  23  <- HOURS OF DAY
 t86 =          [0,  0,  0,  0,  0,  0,  0,  1,  9,  9,  7,  7,  5,  7,  6,  5,  6,  7,  8,  1,  0,  0,  0,  0] 
@@ -25,8 +31,50 @@ patterns = {
         "domestic" :        [domestic, domestic, domestic, domestic, domestic, domestic_we, domestic_we]
 }
 
+HOURS_PER_WEEK = 7 * 24
+EPOCH_WEEK_OFFSET_H = 3 * 24    # The Unix epoch was a Thursday, so this many hours into a Monday-based week
+
+def compile_pattern(pattern):
+    """A pattern as a table of the chance of being occupied in each hour of the (Monday-based) week"""
+    return [pattern[weekday][hour] * (1.0/9.0) for weekday in range(7) for hour in range(24)]  # Renormalise to 0.0..1.0
+
+tables = { name : compile_pattern(pattern) for (name, pattern) in patterns.items() }
+arrays = { name : numpy.array(table) for (name, table) in tables.items() }
+
 def chance_of_occupied(epoch, pattern_name = "nine_to_five"):
-    t = time.gmtime(epoch) # Should be localised using lat/lon if available
+    # Should be localised using lat/lon if available
+    return tables[pattern_name][(math.floor(epoch) // 3600 + EPOCH_WEEK_OFFSET_H) % HOURS_PER_WEEK]
+
+def chances_of_occupied(epochs, pattern_name = "nine_to_five"):
+    """chance_of_occupied() of each of an array of times, as an array"""
+    hours = numpy.floor(numpy.asarray(epochs, dtype=numpy.float64)).astype(numpy.int64) // 3600
+    return arrays[pattern_name][(hours + EPOCH_WEEK_OFFSET_H) % HOURS_PER_WEEK]
+
+def chance_of_occupied_by_gmtime(epoch, pattern_name = "nine_to_five"):
+    """What chance_of_occupied() does, by working out the day and hour (for testing)"""
+    t = time.gmtime(epoch)
     weekday = t.tm_wday  # Monday is 0
     hour = t.tm_hour + t.tm_min/60.0
-    return patterns[pattern_name][weekday][int(hour)] * (1.0/9.0)  # Renormalise to 0.0..1.0
+    return patterns[pattern_name][weekday][int(hour)] * (1.0/9.0)
+
+if __name__ == "__main__":
+    import random
+    random.seed(1)
+    start = 1564617600 - 3 * 86400    # Midnight on a Monday
+    epochs = [start + s for s in range(0, 2 * 7 * 86400, 59)] + [random.uniform(0, 2e9) for i in range(100000)]
+    for name in patterns:
+        expected = [chance_of_occupied_by_gmtime(e, name) for e in epochs]
+        assert [chance_of_occupied(e, name) for e in epochs] == expected, name
+        assert chances_of_occupied(epochs, name).tolist() == expected, name
+    print("Tests passed")
+
+    N = 200000
+    epochs = [start + random.uniform(0, 7 * 86400) for i in range(N)]
+    for (name, fn) in [("by gmtime", chance_of_occupied_by_gmtime), ("by table", chance_of_occupied)]:
+        t = time.perf_counter()
+        for e in epochs:
+            fn(e, "nine_to_five")
+        print("chance_of_occupied() {:10s} {:.3f} us per time".format(name, (time.perf_counter() - t) / N * 1e6))
+    t = time.perf_counter()
+    chances_of_occupied(epochs, "nine_to_five")
+    print("chances_of_occupied()           {:.3f} us per time".format((time.perf_counter() - t) / N * 1e6))
@@ -76,7 +76,7 @@ class Hvac(Device):
         self.pump_run_on_start_time = self.engine.get_now()
         self.temperature = 20
         self.hvac_functional = True # If false then we won't respond to demand
-        self.engine.register_event_in(POLL_INTERVAL_S, self.tick_temperature, self, self)
+        self.engine.register_periodic(POLL_INTERVAL_S, self.tick_temperature, self, self)
 
     def comms_ok(self):
         return super(Hvac,self).comms_ok()
@@ -188,6 +188,3 @@ class Hvac(Device):
         if(random.random() < 0.01):
             p.update({"boiler_selection_mode" : random.randrange(1,3)})    # Always have SOME boiler on
         self.set_properties(p)
-
-        self.engine.register_event_in(POLL_INTERVAL_S, self.tick_temperature, self, self)
-
@@ -37,6 +37,7 @@ class Light(Device):
             r = random.normalvariate(scalar, scalar/10.0)
             self.gen_light_to_power_ratio = max(scalar * 0.7, min(scalar * 1.3, r))
             self.set_property("energy", 0.0)
+        self.light_timer = None
         engine.register_event_in(0, self.tick_light, self, self)
 
     def comms_ok(self):
@@ -73,4 +74,5 @@ class Light(Device):
                 "energy" : self.get_property("energy") + pow * TICK_INTERVAL_S/(60*60.0)
                 })
             self.set_properties(p)
-        self.engine.register_event_in(TICK_INTERVAL_S, self.tick_light, self, self)
+        if self.light_timer is None:    # Go periodic after the first tick, so the timer's sort key is taken when the tick would have re-registered
+            self.light_timer = self.engine.register_periodic(TICK_INTERVAL_S, self.tick_light, self, self)
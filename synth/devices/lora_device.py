@@ -2,6 +2,7 @@
 lora_device
 =====
 Simulates a LoraWAN device (e.g. from The Things Network)
+As it is created, the device connects to the gateway nearest to it (by great-circle distance), so it needs a latitude and longitude by then.
 
 Configurable parameters::
 
@@ -44,7 +45,7 @@ class Lora_device(Device):
                 "metadata.gateway.latitude" : gw_props["latitude"],
                 "metadata.gateway.longitude" : gw_props["longitude"]
                 } )
-        self.engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
+        self.engine.register_periodic(NETWORK_INTERVAL, self.tick_network, self, self)
     
     def comms_ok(self):
         return super(Lora_device, self).comms_ok()
@@ -58,19 +59,13 @@ class Lora_device(Device):
 
     # Private methods
     def closest_gateway(self):
-        my_lat, my_lon = self.get_property("latitude"), self.get_property("longitude")
-        closest = None
-        closest_distance = 1e99
-        for device in device_factory.get_devices_by_property("metadata.type", "gateway"):
-            lat, lon = device.get_property("latitude"), device.get_property("longitude")
-            dist = (my_lat - lat) * (my_lat - lat) + (my_lon - lon) * (my_lon - lon)    # Don't bother to sqrt. This will FAIL where lon wraps around from -180 to 180.
-            if dist < closest_distance:
-                closest = device
-                closest_distance = dist
-        return closest
+        """The gateway nearest to us (by great-circle distance), or None if there are no gateways"""
+        nearest = device_factory.get_nearest_devices(self.get_property("latitude"), self.get_property("longitude"), 1, "metadata.type", "gateway")
+        if len(nearest) == 0:
+            return None
+        return nearest[0][1]
 
     def tick_network(self, _):
         self.set_properties({}) # Just send a heartbeat with no data
-        self.engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
 
 
@@ -33,7 +33,7 @@ class Lora_gateway(Device):
         super(Lora_gateway,self).__init__(instance_name, time, engine, update_callback, context, params)
         # self.sensor_type = params["disruptive"].get("sensor_type", None)
         self.set_property("metadata.type", "gateway")
-        self.engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
+        self.engine.register_periodic(NETWORK_INTERVAL, self.tick_network, self, self)
     
     def comms_ok(self):
         return super(Lora_gateway, self).comms_ok()
@@ -48,6 +48,5 @@ class Lora_gateway(Device):
     # Private methods
     def tick_network(self, _):
         self.set_properties({}) # Just send a heartbeat with no data
-        self.engine.register_event_in(NETWORK_INTERVAL, self.tick_network, self, self)
 
 
@@ -25,9 +25,9 @@ Device properties created::
 """
 
 from .device import Device
-from common.geo import google_maps, geo
+from common.geo import google_maps, geo, spatial
 import random, math
-import isodate
+from common import conftime
 import logging
 
 MINUTES = 60
@@ -56,7 +56,7 @@ DEFAULT_STUCK_IN_TRANSIT_MTBF = 1 * WEEKS   # amount of travel time, not elapsed
 DEFAULT_STUCK_IN_TRANSIT_RECOVERY_DURATION = 1 * WEEKS
 
 MPG = 8 # USA levels of fuel-efficiency!
-LATLON_TO_MILES = 88    # Very approximate conversion factor from "latlong distance in degrees" to miles!
+KM_TO_MILES = 0.621371
 
 class Location_group():
     """ A group of locations that devices might visit """
@@ -151,7 +151,7 @@ class Mobile(Device):
         self.points_to_visit = params["mobile"].get("points_to_visit", DEFAULT_POINTS_TO_VISIT)
         assert self.points_to_visit <= num_locs, "for mobile devices, points_to_visit must be <= num_locations"
         self.fleet_mgmt = params["mobile"].get("generate_fleet_management_metrics", False)
-        self.update_period = isodate.parse_duration(params["mobile"].get("update_period", DEFAULT_UPDATE_PERIOD)).total_seconds()
+        self.update_period = conftime.duration_seconds(params["mobile"].get("update_period", DEFAULT_UPDATE_PERIOD))
         self.route_plan = params["mobile"].get("route_plan", None)
         self.dwell_h_min = params["mobile"].get("dwell_h_min", DEFAULT_MIN_DWELL_H) # "dwell" is how long an asset dwells at each target location
         self.dwell_h_max = params["mobile"].get("dwell_h_max", DEFAULT_MAX_DWELL_H)
@@ -195,8 +195,7 @@ class Mobile(Device):
     # Private methods
 
     def miles_between(self, lon1,lat1, lon2,lat2):
-        (delta_lon, delta_lat) =  (lon2-lon1, lat2-lat1)
-        return math.sqrt(delta_lon * delta_lon + delta_lat * delta_lat) * LATLON_TO_MILES
+        return spatial.distance_km(lat1, lon1, lat2, lon2) * KM_TO_MILES    # Great-circle distance
 
     def update_lon_lat(self):
         if self.route_plan:
@@ -35,7 +35,7 @@ class Occupancy(Device):
         self.peak_occupancy = params["occupancy"].get("peak_occupancy", 1.0)
         self.set_property("device_type", "occupancy")
         self.set_property("occupied", False)
-        self.engine.register_event_in(OCCUPANCY_POLL_INTERVAL_S, self.tick_occupancy, self, self)
+        self.engine.register_periodic(OCCUPANCY_POLL_INTERVAL_S, self.tick_occupancy, self, self)
 
     def comms_ok(self):
         return super(Occupancy,self).comms_ok()
@@ -51,5 +51,4 @@ class Occupancy(Device):
     def tick_occupancy(self, _):
         occupied = random.random() < opening_times.chance_of_occupied(self.engine.get_now(), self.opening_times) * self.peak_occupancy
         self.set_property("occupied", occupied, always_send=False)
-        self.engine.register_event_in(OCCUPANCY_POLL_INTERVAL_S, self.tick_occupancy, self, self)
 
@@ -32,6 +32,7 @@ RAIN_SCALAR = 1.0
 class Pump(Device):
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         super(Pump,self).__init__(instance_name, time, engine, update_callback, context, params)
+        self.pump_timer = None
         engine.register_event_in(0, self.tick_pump, self, self)
         self.set_property("sump_level_mm", 0)
         self.set_property("sump_limit_mm",
@@ -60,5 +61,5 @@ class Pump(Device):
             self.set_property("sump_pump_energy_consumption_kW", 0.0, always_send=False)
         self.set_property("sump_level_mm", level, always_send=False)
 
-        self.engine.register_event_in(CHECK_INTERVAL_S, self.tick_pump, self, self)
-
+        if self.pump_timer is None:     # Go periodic after the first tick, so the timer's sort key is taken when the tick would have re-registered
+            self.pump_timer = self.engine.register_periodic(CHECK_INTERVAL_S, self.tick_pump, self, self)
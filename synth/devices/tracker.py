@@ -27,7 +27,7 @@ Device properties created::
 import random
 import logging
 import time
-import isodate
+from common import conftime
 from math import sin, pi
 
 from .device import Device
@@ -85,7 +85,7 @@ class Tracker(Device):
         self.noise_level = args.get("noise", 0)
         self.precision = args.get("precision", 1)
         self.smoothing_alpha = args.get("smoothing_alpha", 0.1)
-        self.polling_interval = isodate.parse_duration(args.get("period", DEFAULT_PERIOD)).total_seconds()
+        self.polling_interval = conftime.duration_seconds(args.get("period", DEFAULT_PERIOD))
         self.tracking_value = None
         self.time_offset = None
 
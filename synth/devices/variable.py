@@ -21,6 +21,10 @@ Configurable parameters::
 
     [an array of the above to create multiple properties]
 
+A timefunction whose state depends only on time (see Timefunction.is_pure()) is computed ahead, a window of values at a time,
+and a variable whose values come at regular intervals is then set by a periodic timer rather than by scheduling an event for each value.
+The output is exactly the same. A scenario can set ``"analytic_variables" : false`` to compute every value as it's needed instead.
+
 Device properties created::
 
     {
@@ -34,18 +38,19 @@ import random
 from .device import Device
 from common import importer
 from common import randstruct
+from timefunctions.timefunction import Series
 
 class Variable(Device):
     device_indices = {}  # For every series-type variable we see, this maintains an index into the series
     def __init__(self, instance_name, time, engine, update_callback, context, params):
         """A property whose value is static or driven by some time function."""
         def create_var(params):
-            self.my_random = random.Random() # We use our own random-number generator, one per variable per device
             rp = params.get("randomness_property", None)
             if rp is None:
-                self.my_random.seed(self.get_property("$id"))   # Seed each device uniquely
+                seed = self.get_property("$id")     # Seed each device uniquely
             else:
-                self.my_random.seed(hash(self.get_property(rp)))
+                seed = hash(self.get_property(rp))
+            self.my_random = random.Random(seed) # We use our own random-number generator, one per variable per device
 
             var_name = params["name"]
 
@@ -59,7 +64,10 @@ class Variable(Device):
                 var_value = importer.get_class("timefunction", tf_name)(engine, self, params["timefunction"][tf_name])
                 variables[var_name] = var_value.state()
                 next_change = var_value.next_change()
-                engine.register_event_at(next_change, self.tick_variable, (var_name, var_value), self)
+                if context.get("analytic_variables", True) and var_value.is_pure():
+                    engine.register_event_at(next_change, self.tick_series, VariableSeries(var_name, var_value, engine.get_now()), self)
+                else:
+                    engine.register_event_at(next_change, self.tick_variable, (var_name, var_value), self)
             elif "random_lower" in params:
                 lower = float(params["random_lower"])
                 upper = float(params["random_upper"])
@@ -111,3 +119,34 @@ class Variable(Device):
         self.set_property(name, new_value, always_send = True)
         next_change = function.next_change()
         self.engine.register_event_at(next_change, self.tick_variable, args, self)
+
+    def tick_series(self, series):
+        (t, value) = series.pop()
+        self.set_property(series.name, value, always_send = True)
+        next_change = series.next_time()
+        if series.timer is not None:
+            if next_change == t + series.interval:
+                return  # The timer will fire again then
+            self.engine.cancel_periodic(series.timer)
+            series.timer = None
+        interval = next_change - t
+        if interval > 0 and series.following() == next_change + interval:    # Regular, so use a periodic timer (which is cheaper to schedule)
+            series.interval = interval
+            series.timer = self.engine.register_periodic(interval, self.tick_series, series, self)
+        else:
+            self.engine.register_event_at(next_change, self.tick_series, series, self)
+
+class VariableSeries(Series):
+    """The future values of a variable, and the periodic timer (if any) which is setting them"""
+    def __init__(self, name, function, t):
+        super(VariableSeries, self).__init__(function, t)
+        self.name = name
+        self.interval = None
+        self.timer = None
+
+    def following(self):
+        """The time of the change after the next one"""
+        self.next_time()
+        if self.index + 1 < len(self.times):
+            return self.times[self.index + 1]
+        return None
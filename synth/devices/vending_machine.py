@@ -24,7 +24,7 @@ Device properties created::
 
 from .device import Device
 import random
-import isodate
+from common import conftime
 import logging
 
 HOURS = 60*60
@@ -105,7 +105,7 @@ class Vending_machine(Device):
                 e["price"] = p["price"]
                 e["category"] = p["category"]
                 if "lifetime" in p:
-                    e["lifetime"] = isodate.parse_duration(p["lifetime"]).total_seconds()
+                    e["lifetime"] = conftime.duration_seconds(p["lifetime"])
                 self.product_catalogue.append(e)
         else:
             self.product_catalogue = default_product_catalogue
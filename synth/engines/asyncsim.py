@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+# ASYNCSIM
+# A variant of sim which, once caught-up with real time, waits in an asyncio event loop rather than polling
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# How it works
+# ------------
+# When sim has to wait for real time, it sleeps for up to a second at a time, so events injected asynchronously
+# (e.g. from ZeroMQ) wait for up to a second, and an idle process still wakes every second.
+# asyncsim instead waits in an asyncio event loop until exactly when the next event is due, or until it's woken:
+#
+#   * Events injected from other threads wake the loop immediately (via call_soon_threadsafe())
+#   * Other things can run in the loop itself, such as ZeroMQ reception (see zeromq_rx.init_asyncio()), in which case
+#     their callbacks run in the engine thread and so can register events directly
+#   * The loop also wakes every "tick_interval" seconds (default 1, or null for never), so that the top level can call the
+#     client's tick() to flush anything it has buffered. Clients which don't buffer (e.g. filesystem, null) don't need this
+#
+# To dispatch events within a fraction of a millisecond of when they're due, the loop wakes a couple of milliseconds early
+# and then sleeps the rest of the way. During the historical phase asyncsim runs exactly like sim, giving the loop a chance to run between bursts.
+# Run "python3 -m engines.asyncsim" (from the synth directory) to measure how long injected events wait.
+
+import time
+import asyncio
+import logging
+import threading
+
+from engines.sim import Sim
+
+DEFAULT_TICK_INTERVAL_S = 1.0
+FINAL_SLEEP_S = 0.002       # The loop's timers have millisecond resolution, so we wake this early and then sleep the last bit precisely
+
+class Asyncsim(Sim):
+    def __init__(self, params, cb = None, event_count_callback = None):
+        super(Asyncsim, self).__init__(params, cb, event_count_callback)
+        self.loop = asyncio.new_event_loop()
+        self.wakeup = asyncio.Event()
+        self.waiting = False    # True whilst the engine thread is waiting in the loop
+        self.tick_interval = params.get("tick_interval", DEFAULT_TICK_INTERVAL_S)
+
+    def get_event_loop(self):
+        return self.loop
+
+    def _add_event(self, time, func, arg, dev, interval = None):
+        super(Asyncsim, self)._add_event(time, func, arg, dev, interval)
+        if threading.get_ident() != self.engine_thread:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        elif self.waiting:  # e.g. registered by a ZeroMQ callback running in the loop
+            self.wakeup.set()
+
+    def _collect_inbox(self):
+        self._run_loop_once()
+        super(Asyncsim, self)._collect_inbox()
+
+    def _run_loop_once(self):
+        """Run anything that's ready in the loop (e.g. ZeroMQ reception), without waiting"""
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    def _wait_for_real_time(self, wait):
+        if self.end_time not in [None, "when_done", "now"]:     # Wake at the end, in case there are no events before it
+            until_end = self.end_time - time.time()
+            wait = until_end if wait is None else min(wait, until_end)
+        if self.tick_interval is not None:
+            wait = self.tick_interval if wait is None else min(wait, self.tick_interval)
+
+        if wait is not None and wait <= FINAL_SLEEP_S:
+            time.sleep(max(0, wait))
+            return
+
+        self.wakeup.clear()
+        timer = None
+        if wait is not None:
+            timer = self.loop.call_later(wait - FINAL_SLEEP_S, self.wakeup.set)
+        self.waiting = True
+        try:
+            self.loop.run_until_complete(self.wakeup.wait())
+        finally:
+            self.waiting = False
+            if timer is not None:
+                timer.cancel()
+
+if __name__ == "__main__":
+    import statistics
+
+    def measure_latency(engine_class, num_events, params = {}):
+        """Inject events from another thread into a live engine, and measure how long each waits before it's executed"""
+        engine = engine_class(dict({ "start_time" : "now", "end_time" : None }, **params))
+        latencies = []
+        def fn(injected_at):
+            latencies.append(time.time() - injected_at)
+        def inject():
+            for i in range(num_events):
+                time.sleep(0.05)
+                engine.register_event_in(0, fn, time.time(), None)
+        t = threading.Thread(target=inject)
+        t.daemon = True
+        t.start()
+        while len(latencies) < num_events:
+            engine.events_to_come()
+            engine.next_event()
+        latencies.sort()
+        print("{:10s} median {:8.3f}ms  90th percentile {:8.3f}ms  max {:8.3f}ms".format(engine_class.__name__,
+            statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.9)] * 1000, latencies[-1] * 1000))
+        return latencies
+
+    def measure_lateness(engine_class, num_events):
+        """Schedule events a little way into the future, and measure how late each is executed"""
+        engine = engine_class({ "start_time" : "now", "end_time" : None, "tick_interval" : None })
+        lateness = []
+        def fn(due):
+            lateness.append(time.time() - due)
+        for i in range(num_events):
+            due = time.time() + 0.05 * (i+1)
+            engine.register_event_at(due, fn, due, None)
+        while len(lateness) < num_events:
+            engine.events_to_come()
+            engine.next_event()
+        lateness.sort()
+        print("{:10s} median {:8.3f}ms  max {:8.3f}ms".format(engine_class.__name__, statistics.median(lateness) * 1000, lateness[-1] * 1000))
+        return lateness
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print("Latency of events injected asynchronously into a live engine")
+    measure_latency(Sim, 20)
+    latencies = measure_latency(Asyncsim, 100)
+    assert statistics.median(latencies) < 0.001
+    print("Lateness of scheduled events in a live engine")
+    measure_lateness(Sim, 20)
+    lateness = measure_lateness(Asyncsim, 40)
+    assert statistics.median(lateness) < 0.001
@@ -42,6 +42,38 @@ class Engine(object):
         """Schedule an event (callback) after a given interval from current sim time"""
         pass
 
+    def register_periodic(self, interval, event, arg, device):
+        """Schedule an event (callback) to happen every <interval>, starting <interval> from current sim time,
+           until the device's events are removed. Engines may implement this more cheaply than by re-registering every time.
+           Returns a handle for cancel_periodic()"""
+        handle = [True]
+        def tick(a):
+            event(a)
+            if handle[0]:
+                self.register_event_in(interval, tick, a, device)
+        self.register_event_in(interval, tick, arg, device)
+        return handle
+
+    def cancel_periodic(self, handle):
+        """Stop a periodic event from repeating. Must be called from within the event's own callback"""
+        handle[0] = False
+
+    def set_profiler(self, profiler):
+        """Execute event callbacks via <profiler>.call(function, arg), e.g. so they are timed (see profiler.py) or so that the properties they set are grouped (see device_factory.PropertyGrouper)"""
+        self.profiler = profiler
+
+    def get_event_loop(self):
+        """Return the asyncio event loop in which the engine waits, if it has one (see asyncsim.py), so other things can run in it too"""
+        return None
+
+    def get_checkpoint(self):
+        """Return the engine's state (simulation time, pending events etc.), for checkpoint.py to save"""
+        raise NotImplementedError(self.__class__.__name__+" engine does not support checkpoints")
+
+    def restore_checkpoint(self, state):
+        """Replace the engine's state with one returned by get_checkpoint()"""
+        raise NotImplementedError(self.__class__.__name__+" engine does not support checkpoints")
+
     @abstractmethod
     def set_now(self):
         """Set current simulation time"""
@@ -0,0 +1,657 @@
+#!/usr/bin/env python
+#
+# EVENT_QUEUE
+# Priority queues of pending simulation events, for use by the sim engine
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Every entry is a tuple (epochTime, sortkeycount, function, arg, device), except periodic timers (see PeriodicQueue).
+# The sortkeycount is unique and monotonically rising, so entries never compare equal
+# (and we never fall through to comparing the functions), and events scheduled
+# for the same time come out in the order in which they were added.
+#
+# None of these queues are thread-safe - the engine holds its own lock around them.
+
+import heapq
+import bisect
+import math
+import collections
+from abc import ABCMeta, abstractmethod
+
+class EventQueue(object):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def push(self, entry):
+        """Add an entry"""
+        pass
+
+    @abstractmethod
+    def pop(self):
+        """Remove and return the earliest entry"""
+        pass
+
+    @abstractmethod
+    def peek(self):
+        """Return the earliest entry without removing it"""
+        pass
+
+    @abstractmethod
+    def remove_if(self, predicate):
+        """Remove all entries for which predicate(entry) is True. Returns the number of entries removed"""
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    @abstractmethod
+    def __iter__(self):
+        """Iterate over all entries, in order"""
+        pass
+
+
+class HeapQueue(EventQueue):
+    """A binary heap: O(log n) push and pop"""
+    def __init__(self):
+        self.heap = []
+
+    def push(self, entry):
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+    def peek(self):
+        return self.heap[0]
+
+    def remove_if(self, predicate):
+        old_len = len(self.heap)
+        self.heap = [e for e in self.heap if not predicate(e)]
+        heapq.heapify(self.heap)
+        return old_len - len(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return iter(sorted(self.heap))
+
+
+class CalendarQueue(EventQueue):
+    """A calendar queue (R. Brown, CACM 1988): O(1) average push and pop, if event times are reasonably evenly spread.
+       Events are hashed by time into an array of "day" buckets, each one <width> seconds wide, which wrap around
+       into "years". We resize (and re-estimate the bucket width) whenever the number of events grows or shrinks by 2x."""
+    MIN_BUCKETS = 2
+    WIDTH_SAMPLE_SIZE = 25  # How many of the earliest events to sample when estimating bucket width
+
+    def __init__(self):
+        self.size = 0
+        self._build(CalendarQueue.MIN_BUCKETS, 1.0, [])
+
+    def _build(self, num_buckets, width, entries):
+        self.num_buckets = num_buckets
+        self.width = width
+        self.buckets = [[] for i in range(num_buckets)]
+        for e in entries:
+            bisect.insort(self.buckets[self._day_of(e[0]) % num_buckets], e)
+        if len(entries) > 0:
+            self.day = self._day_of(min(entries)[0])
+        else:
+            self.day = 0    # The day we've scanned up to. We use integer day numbers, so no rounding errors accumulate as we scan
+
+    def _day_of(self, t):
+        return int(math.floor(t / self.width))
+
+    def _resize(self, num_buckets):
+        entries = [e for b in self.buckets for e in b]
+        self._build(num_buckets, self._estimate_width(entries), entries)
+
+    def _estimate_width(self, entries):
+        """Choose a bucket width of about three times the typical gap between the earliest events"""
+        sample = heapq.nsmallest(CalendarQueue.WIDTH_SAMPLE_SIZE, entries)
+        if len(sample) < 2:
+            return self.width
+        gaps = [sample[i+1][0] - sample[i][0] for i in range(len(sample)-1)]
+        mean_gap = sum(gaps) / len(gaps)
+        typical = [g for g in gaps if g <= 2 * mean_gap]   # Exclude outliers
+        if len(typical) == 0 or sum(typical) == 0:
+            return self.width
+        return 3.0 * sum(typical) / len(typical)
+
+    def _find(self):
+        """Move the scan position to the day holding the earliest entry, and return that day's bucket"""
+        day = self.day
+        for n in range(self.num_buckets):   # Scan through one "year" of buckets
+            b = self.buckets[day % self.num_buckets]
+            if len(b) > 0 and self._day_of(b[0][0]) <= day:
+                self.day = day
+                return b
+            day += 1
+        # Nothing within a year, so fall back to a direct search for the earliest entry (events are sparse)
+        earliest = min([b[0] for b in self.buckets if len(b) > 0])
+        self.day = self._day_of(earliest[0])
+        return self.buckets[self.day % self.num_buckets]
+
+    def push(self, entry):
+        day = self._day_of(entry[0])
+        bisect.insort(self.buckets[day % self.num_buckets], entry)
+        self.size += 1
+        if day < self.day:  # An event earlier than where we've got to (legal, if unusual)
+            self.day = day
+        if self.size > 2 * self.num_buckets:
+            self._resize(2 * self.num_buckets)
+
+    def pop(self):
+        if self.size == 0:
+            raise IndexError("pop from empty CalendarQueue")
+        entry = self._find().pop(0)
+        self.size -= 1
+        if self.size < self.num_buckets / 2 and self.num_buckets > CalendarQueue.MIN_BUCKETS:
+            self._resize(self.num_buckets // 2)
+        return entry
+
+    def peek(self):
+        if self.size == 0:
+            raise IndexError("peek into empty CalendarQueue")
+        return self._find()[0]
+
+    def remove_if(self, predicate):
+        removed = 0
+        for i in range(self.num_buckets):
+            b = self.buckets[i]
+            kept = [e for e in b if not predicate(e)]
+            removed += len(b) - len(kept)
+            self.buckets[i] = kept
+        self.size -= removed
+        return removed
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(sorted([e for b in self.buckets for e in b]))
+
+
+class DeviceIndexedQueue(EventQueue):
+    """Wraps any of the queues above, additionally indexing pending events by device, so that all
+       the events for one device can be cancelled in time proportional to how many that device has.
+       Cancelled events are left in the underlying queue as "tombstones" (identified by their unique sortkeycount)
+       and are skipped when they reach the front. If tombstones come to dominate the queue then we compact it."""
+    COMPACT_RATIO = 0.5     # Compact when this fraction of the underlying queue is tombstones...
+    COMPACT_MIN = 10000     # ...but don't bother for small queues, which are cheap to carry
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.by_device = {}     # device -> set of sortkeycounts of its pending events
+        self.cancelled = set()  # sortkeycounts of tombstones still in the queue
+        self.compactions = 0
+
+    def push(self, entry):
+        dev = entry[4]
+        if dev is not None:
+            if dev not in self.by_device:
+                self.by_device[dev] = set()
+            self.by_device[dev].add(entry[1])
+        self.queue.push(entry)
+
+    def _forget(self, entry):
+        dev = entry[4]
+        if dev is not None:
+            keys = self.by_device[dev]
+            keys.discard(entry[1])
+            if len(keys) == 0:
+                del self.by_device[dev]
+
+    def _discard_tombstones(self):
+        while len(self.cancelled) > 0 and len(self.queue) > 0:
+            skc = self.queue.peek()[1]
+            if skc not in self.cancelled:
+                return
+            self.queue.pop()
+            self.cancelled.remove(skc)
+
+    def pop(self):
+        self._discard_tombstones()
+        entry = self.queue.pop()
+        self._forget(entry)
+        return entry
+
+    def peek(self):
+        self._discard_tombstones()
+        return self.queue.peek()
+
+    def remove_device(self, dev):
+        """Cancel all pending events for device <dev>. Returns the number of events cancelled"""
+        keys = self.by_device.pop(dev, set())
+        self.cancelled.update(keys)
+        if len(self.cancelled) > DeviceIndexedQueue.COMPACT_MIN and len(self.cancelled) > DeviceIndexedQueue.COMPACT_RATIO * len(self.queue):
+            self.compact()
+        return len(keys)
+
+    def compact(self):
+        """Physically remove all tombstones from the underlying queue"""
+        cancelled = self.cancelled
+        self.queue.remove_if(lambda e: e[1] in cancelled)
+        self.cancelled = set()
+        self.compactions += 1
+
+    def remove_if(self, predicate):
+        cancelled = self.cancelled
+        removed = [0]
+        def remove(e):
+            if e[1] in cancelled:
+                return True
+            if predicate(e):
+                self._forget(e)
+                removed[0] += 1
+                return True
+            return False
+        self.queue.remove_if(remove)
+        self.cancelled = set()
+        return removed[0]
+
+    def __len__(self):
+        return len(self.queue) - len(self.cancelled)
+
+    def __iter__(self):
+        return iter([e for e in self.queue if e[1] not in self.cancelled])
+
+
+class PeriodicQueue(EventQueue):
+    """Wraps a DeviceIndexedQueue, adding periodic timers which fire repeatedly at a fixed interval.
+
+       A timer is a list [epochTime, sortkeycount, function, arg, device, interval, armed] which is reused for every firing:
+       when it has fired, the engine updates its time and sortkeycount and pushes it back with push_timer().
+       Timers with the same interval are kept in a FIFO, which stays in order because timers fire in time order and each one
+       re-arms at (the time it fired + interval). So firing a timer costs a popleft() and an append(), with no allocation and no
+       heap sift. If a timer is ever pushed out of order, it starts a new FIFO for its interval.
+       Cancelled timers have their function set to None, and are discarded when they reach the front of their FIFO.
+       A cancelled timer is forgotten by by_device straight away, so devices which keep cancelling and re-registering timers don't accumulate dead ones."""
+    UNKNOWN = object()
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.fifos = []         # Deques of armed timers, each in time order
+        self.tails = {}         # interval -> the FIFO to which timers with that interval are appended
+        self.by_device = {}     # device -> list of its timers
+        self.timers = 0         # Number of armed (and not cancelled) timers
+        self.next_fifo = None   # The FIFO with the earliest timer (None if unknown)
+        self.next = PeriodicQueue.UNKNOWN   # Where the earliest entry is: a FIFO, or None for the wrapped queue
+        self.queue_head = None  # Cache of the wrapped queue's earliest entry (None if empty)
+
+    def __setstate__(self, state):
+        """When unpickled (see checkpoint.py) the UNKNOWN sentinel becomes a different object, so forget our caches"""
+        self.__dict__.update(state)
+        self.next_fifo = None
+        self.next = PeriodicQueue.UNKNOWN
+        self.queue_head = PeriodicQueue.UNKNOWN
+
+    def push(self, entry):
+        self.queue.push(entry)
+        if self.queue_head is None or (self.queue_head is not PeriodicQueue.UNKNOWN and entry < self.queue_head):
+            self.queue_head = entry
+        self.next = PeriodicQueue.UNKNOWN
+
+    def push_timer(self, timer):
+        """Arm a timer, which may be new, or may just have fired"""
+        if timer[2] is None:    # Cancelled whilst it was firing
+            self._forget(timer)
+            return
+        if timer[6] is None:    # New
+            dev = timer[4]
+            if dev is not None:
+                if dev not in self.by_device:
+                    self.by_device[dev] = []
+                self.by_device[dev].append(timer)
+        interval = timer[5]
+        fifo = self.tails.get(interval, None)
+        if fifo is None or (len(fifo) > 0 and (fifo[-1][0] > timer[0] or (fifo[-1][0] == timer[0] and fifo[-1][1] > timer[1]))):
+            fifo = collections.deque()
+            self.fifos.append(fifo)
+            self.tails[interval] = fifo
+        if len(fifo) == 0:
+            self.next_fifo = None
+        fifo.append(timer)
+        timer[6] = True
+        self.timers += 1
+        self.next = PeriodicQueue.UNKNOWN
+
+    def cancel_timer(self, timer):
+        """Cancel a timer which isn't armed (i.e. from within its own callback)"""
+        timer[2] = None
+        self._forget(timer)
+
+    def _forget(self, timer):
+        timers = self.by_device.get(timer[4], None)
+        if timers is not None:
+            for i in range(len(timers)):
+                if timers[i] is timer:
+                    del timers[i]
+                    break
+            if len(timers) == 0:
+                del self.by_device[timer[4]]
+
+    def _find_next(self):
+        if self.next is not PeriodicQueue.UNKNOWN:
+            return self.next
+        fifo = None
+        if self.timers > 0:
+            fifo = self.next_fifo
+            if fifo is None:
+                for f in self.fifos:
+                    while len(f) > 0 and f[0][2] is None:
+                        f.popleft()
+                    if len(f) > 0 and (fifo is None or f[0][0] < fifo[0][0] or (f[0][0] == fifo[0][0] and f[0][1] < fifo[0][1])):
+                        fifo = f
+                self.next_fifo = fifo
+            entry = self.queue_head
+            if entry is PeriodicQueue.UNKNOWN:
+                entry = self.queue.peek() if len(self.queue) > 0 else None
+                self.queue_head = entry
+            if entry is not None:
+                timer = fifo[0]
+                if entry[0] < timer[0] or (entry[0] == timer[0] and entry[1] < timer[1]):
+                    fifo = None
+        self.next = fifo
+        return fifo
+
+    def pop(self):
+        fifo = self._find_next()
+        self.next = PeriodicQueue.UNKNOWN
+        if fifo is None:
+            self.queue_head = PeriodicQueue.UNKNOWN
+            return self.queue.pop()
+        timer = fifo.popleft()
+        timer[6] = False
+        self.timers -= 1
+        while len(fifo) > 0 and fifo[0][2] is None:
+            fifo.popleft()
+        if len(fifo) == 0:
+            if self.tails[timer[5]] is not fifo:
+                self.fifos.remove(fifo)
+            self.next_fifo = None
+        elif len(self.fifos) > 1:
+            self.next_fifo = None
+        return timer
+
+    def peek(self):
+        fifo = self._find_next()
+        if fifo is None:
+            return self.queue.peek()
+        return fifo[0]
+
+    def remove_device(self, dev):
+        """Cancel all pending events and timers for device <dev>. Returns the number cancelled"""
+        removed = self.queue.remove_device(dev)
+        for timer in self.by_device.pop(dev, []):
+            timer[2] = None
+            if timer[6]:
+                self.timers -= 1
+                removed += 1
+        self.next_fifo = None
+        self.next = PeriodicQueue.UNKNOWN
+        self.queue_head = PeriodicQueue.UNKNOWN
+        return removed
+
+    def remove_if(self, predicate):
+        removed = self.queue.remove_if(predicate)
+        for timer in self._armed_timers():
+            if predicate(timer):
+                timer[2] = None
+                self.timers -= 1
+                removed += 1
+        self.next_fifo = None
+        self.next = PeriodicQueue.UNKNOWN
+        self.queue_head = PeriodicQueue.UNKNOWN
+        return removed
+
+    def _armed_timers(self):
+        return [t for fifo in self.fifos for t in fifo if t[2] is not None]
+
+    def __len__(self):
+        return len(self.queue) + self.timers
+
+    def __iter__(self):
+        return iter(sorted(list(self.queue) + [tuple(t[:5]) for t in self._armed_timers()], key=lambda e: (e[0], e[1])))
+
+
+QUEUE_TYPES = {
+    "heap" : HeapQueue,
+    "calendar" : CalendarQueue
+}
+
+def create(queue_type):
+    assert queue_type in QUEUE_TYPES, "Unknown event queue type "+str(queue_type)+" (should be one of "+str(list(QUEUE_TYPES.keys()))+")"
+    return PeriodicQueue(DeviceIndexedQueue(QUEUE_TYPES[queue_type]()))
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    def test_order(queue_type):
+        """Check that we always get events back in time order, and FIFO for equal times"""
+        q = create(queue_type)
+        r = random.Random(1234)
+        skc = 0
+        expected = []
+        for i in range(20000):
+            t = 1.5e9 + r.choice([0, 0, 1, 60, 3600]) * r.randrange(0, 100)   # Lots of identical times
+            e = (t, skc, None, i, None)
+            skc += 1
+            q.push(e)
+            expected.append(e)
+        expected.sort()
+        assert len(q) == len(expected)
+        assert list(q) == expected
+        got = []
+        while len(q) > 0:
+            assert q.peek() == expected[len(got)]
+            got.append(q.pop())
+        assert got == expected, queue_type+" returned events out of order"
+
+        # Interleaved pushes and pops, including pushes earlier than the last pop
+        q = create(queue_type)
+        reference = []
+        for i in range(20000):
+            e = (1.5e9 + r.random() * 86400 * r.choice([0.001, 1, 1000]), skc, None, None, None)
+            skc += 1
+            q.push(e)
+            heapq.heappush(reference, e)
+            if r.random() < 0.45:
+                assert q.pop() == heapq.heappop(reference)
+        assert q.remove_if(lambda e: e[0] < 1.5e9 + 43200) > 0
+        assert all([e[0] >= 1.5e9 + 43200 for e in q])
+        prev = None
+        while len(q) > 0:
+            e = q.pop()
+            assert prev is None or e > prev
+            prev = e
+        print(queue_type, "order tests passed")
+
+    def test_remove_device(queue_type):
+        """Check that cancelling a device's events is exact, and survives compaction"""
+        q = create(queue_type)
+        r = random.Random(1234)
+        devices = [object() for i in range(100)]
+        reference = []
+        skc = 0
+        for i in range(50000):
+            e = (1.5e9 + r.random() * 86400, skc, None, None, r.choice(devices + [None]))
+            skc += 1
+            q.push(e)
+            reference.append(e)
+        for d in devices[:60]:
+            expected = len([e for e in reference if e[4] is d])
+            assert q.remove_device(d) == expected
+            assert q.remove_device(d) == 0
+            reference = [e for e in reference if e[4] is not d]
+            assert len(q) == len(reference)
+        assert q.queue.compactions > 0
+        q.push((0, skc, None, None, devices[0]))    # A cancelled device can get new events
+        reference.append((0, skc, None, None, devices[0]))
+        reference.sort()
+        assert list(q) == reference
+        got = []
+        while len(q) > 0:
+            got.append(q.pop())
+        assert got == reference
+        assert len(q.queue.by_device) == 0
+        print(queue_type, "remove_device tests passed")
+
+    def test_timers(queue_type):
+        """Check that periodic timers interleave correctly with ordinary events, re-arm in order, and can be cancelled"""
+        q = create(queue_type)
+        r = random.Random(1234)
+        devices = [object() for i in range(50)]
+        tick = lambda arg: None
+        skc = 0
+        for d in devices:
+            q.push_timer([1.5e9 + r.randrange(0, 600), skc, tick, None, d, r.choice([60, 600]), None])
+            skc += 1
+            q.push((1.5e9 + r.randrange(0, 86400), skc, None, None, d))
+            skc += 1
+        q.push_timer([1.5e9, skc, tick, None, None, 60, None])  # Out of order for its interval, so starts a new FIFO
+        skc += 1
+        fired = 0
+        prev = None
+        while len(q) > 0 and fired < 10000:
+            e = q.pop()
+            assert prev is None or (e[0], e[1]) > prev
+            prev = (e[0], e[1])
+            if len(e) > 5:
+                fired += 1
+                if fired == 5000:
+                    for d in devices[:25]:
+                        assert q.remove_device(d) > 0
+                    e[2] = None    # Cancel the timer which is firing
+                e[0] += e[5]
+                e[1] = skc
+                skc += 1
+                q.push_timer(e)
+        assert all([e[4] not in devices[:25] for e in q])
+        assert len(q) == len(list(q))
+
+        # Devices which keep cancelling their timer and registering a new one (as a variable switching series spacing does) don't leave dead timers behind
+        for i in range(10000):
+            e = q.pop()
+            if len(e) > 5:
+                if i % 2 == 0:
+                    q.cancel_timer(e)
+                else:
+                    e[2] = None     # ... or cancelled by hand
+                    q.push_timer(e)
+                q.push_timer([e[0] + e[5], skc, tick, None, e[4], r.choice([60, 600]), None])
+                skc += 1
+        assert all([len(timers) == 1 for timers in q.by_device.values()])
+        assert len(q.by_device) <= len(devices) - 25 + 1
+        print(queue_type, "timer tests passed")
+
+    def benchmark_remove_device(queue_type, num_devices, events_per_device):
+        """Stop every device in turn (as a scenario full of stop_at's would)"""
+        q = create(queue_type)
+        r = random.Random(1234)
+        devices = [object() for i in range(num_devices)]
+        skc = 0
+        for d in devices:
+            for i in range(events_per_device):
+                q.push((r.random() * 86400, skc, None, None, d))
+                skc += 1
+        t0 = time.time()
+        for d in devices:
+            q.remove_device(d)
+        elapsed = time.time() - t0
+        assert len(q) == 0
+        print("{:10s} stopped {:d} devices with {:d} events each in {:.3f}s ({:d} compactions)".format(queue_type, num_devices, events_per_device, elapsed, q.queue.compactions))
+
+    def benchmark_timers(queue_type, num_timers):
+        """Fire <num_timers> devices' heartbeats, by re-pushing a new entry each time, and with a periodic timer"""
+        r = random.Random(1234)
+        starts = sorted([r.random() * 600 for i in range(num_timers)])    # As if devices were created one after another
+        N = 200000
+
+        q = create(queue_type)
+        skc = 0
+        for t in starts:
+            q.push((t, skc, None, None, None))
+            skc += 1
+        t0 = time.time()
+        for i in range(N):
+            (t, k, f, a, d) = q.pop()
+            q.push((t + 600, skc, f, a, d))
+            skc += 1
+        repush_per_s = N / (time.time() - t0)
+
+        q = create(queue_type)
+        for t in starts:
+            q.push_timer([t, skc, len, None, None, 600, None])
+            skc += 1
+        t0 = time.time()
+        for i in range(N):
+            e = q.pop()
+            e[0] += e[5]
+            e[1] = skc
+            skc += 1
+            q.push_timer(e)
+        timer_per_s = N / (time.time() - t0)
+        print("{:10s} {:>9d} heartbeats: {:>12,.0f} firings/s re-pushing {:>12,.0f} firings/s with periodic timers".format(queue_type, num_timers, repush_per_s, timer_per_s))
+
+    def benchmark(queue_type, pending):
+        """Steady-state hold model: with <pending> events in the queue, pop one and push one further into the future"""
+        q = create(queue_type)
+        r = random.Random(1234)
+        skc = 0
+        t0 = time.time()
+        for i in range(pending):
+            q.push((r.random() * 86400, skc, None, None, None))
+            skc += 1
+        inserts_per_s = pending / (time.time() - t0)
+
+        N = 100000
+        t0 = time.time()
+        for i in range(N):
+            (t, k, f, a, d) = q.pop()
+            q.push((t + r.random() * 3600, skc, f, a, d))
+            skc += 1
+        holds_per_s = N / (time.time() - t0)
+
+        t0 = time.time()
+        while len(q) > 0:
+            q.pop()
+        pops_per_s = pending / (time.time() - t0)
+        print("{:10s} {:>9d} pending: {:>12,.0f} inserts/s {:>12,.0f} pops/s {:>12,.0f} pop+push/s".format(queue_type, pending, inserts_per_s, pops_per_s, holds_per_s))
+
+    for qt in QUEUE_TYPES:
+        test_order(qt)
+        test_remove_device(qt)
+        test_timers(qt)
+
+    for qt in QUEUE_TYPES:
+        benchmark_remove_device(qt, 10000, 10)
+
+    for num_timers in [1000, 100000]:
+        for qt in QUEUE_TYPES:
+            benchmark_timers(qt, num_timers)
+
+    for pending in [10000, 100000, 1000000]:
+        for qt in QUEUE_TYPES:
+            benchmark(qt, pending)
@@ -26,11 +26,15 @@
 import time
 import logging
 import threading
-import bisect
+import collections
 from common import ISO8601
 from common.conftime import richTime
 
 from engines.engine import Engine
+from engines import event_queue
+
+CATCH_UP_SLACK_S = 1.0      # Allow a bit of slack because otherwise we might never quite catch-up, because we always wait to ensure we don't
+BURST_MAX_EVENTS = 10000    # Length of a historical burst, i.e. how often we look at the wall-clock and collect asynchronously-injected events
 
 class Sim(Engine):
     """Capable of both historical and real-time simulation,
@@ -38,17 +42,30 @@ class Sim(Engine):
 
     def __init__(self, params, cb = None, event_count_callback = None):
         self.sim_lock = threading.Lock() # Protects events[] and sim_time to make sim thread-safe, as event-injection can happen asynchronously (we can't use Queues because we need peeking)
+        self.historical_burst = params.get("historical_burst", True)
+        self.in_burst = False   # During a burst, only the engine thread touches events[] and sim_time, so we don't lock
+        self.burst_until = None
+        self.burst_events = 0
+        self.inbox = collections.deque()    # Events injected from other threads wait here until the engine thread collects them (deque.append() is thread-safe)
+        self.engine_thread = threading.get_ident()
+        self.historical_events = 0
+        self.historical_start = time.time()
+        self.historical_reported = False
         self.set_start_time_str(params.get("start_time", "now"))
         self.set_end_time_str(params.get("end_time", None))
         self.end_after_events = params.get("end_after_events", None)
         self.caught_up_callback = cb
         self.caught_up = False
         self.event_count_callback = event_count_callback
-        self.events = []     # A sorted list of simulation callbacks: [(epochTime,sortkeycount,function,arg,device), ...]
+        self.events = event_queue.create(params.get("queue", "heap"))   # A priority queue of simulation callbacks: (epochTime,sortkeycount,function,arg,device)
         self.sort_key_count = 0
         self.next_event_time = None
+        self.profiler = None    # See profiler.py
 
     def set_now(self, epochSecs):
+        if self.in_burst:
+            self.sim_time = epochSecs
+            return
         self.sim_lock.acquire()
         self.sim_time = epochSecs
         self.sim_lock.release()
@@ -81,6 +98,8 @@ class Sim(Engine):
         return self.end_time
     
     def get_now(self):
+        if self.in_burst:
+            return self.sim_time
         self.sim_lock.acquire()
         t = self.sim_time
         self.sim_lock.release()
@@ -95,89 +114,199 @@ class Sim(Engine):
     def get_now_str(self):
         return str(ISO8601.epoch_seconds_to_ISO8601(self.get_now()))
 
+    def caught_up_with_real_time(self):
+        if not self.caught_up:
+            logging.info("Caught-up with real time")
+            self.report_historical()
+            if self.caught_up_callback:
+                self.caught_up_callback()  # Mustn't create new events, or deadlock will occur
+        self.caught_up = True
+
+    def report_historical(self):
+        """Log the event rate achieved during the historical part of the simulation"""
+        if self.historical_reported:
+            return
+        self.historical_reported = True
+        elapsed = time.time() - self.historical_start
+        logging.info("Historical phase executed "+str(self.historical_events)+" events in {:.2f}s real time ({:.0f} events/s)".format(elapsed, self.historical_events / max(elapsed, 0.001)))
+
     def events_to_come(self):
         """Return False if simulation has definitely ended"""
-        def caught_up():
-            if not self.caught_up:
-                logging.info("Caught-up with real time")
-                if self.caught_up_callback:
-                    self.caught_up_callback()  # Mustn't create new events, or deadlock will occur
-            self.caught_up = True
-
         if self.end_after_events:
             if self.event_count_callback() >= self.end_after_events:
                 logging.info("Reached target of "+str(self.end_after_events)+" events")
+                self.report_historical()
                 return False
-            
-        try:
-            self.sim_lock.acquire()       # <--
-            
-            if self.sim_time >= time.time() - 1.0:   # Allow a bit of slack because otherwise we might never quite catch-up, because we always wait to ensure we don't
-                caught_up()
-
-            if self.end_time == None:
-                return True
-
-            if self.end_time == "when_done":
-                keep_going = len(self.events)>0
-                if not keep_going:
-                    logging.info("No further events")
-                return keep_going
-                           
-            if self.end_time=="now":    # Terminate when we've caught-up with real-time
-                if self.sim_time >= (time.time()-1.0):   # Allow some slack
-                    caught_up()
-                    logging.info("Caught up with real time")
-                    return False
-                return True
-
-            if self.sim_time >= self.end_time:
-                logging.info("Reached simulation end time with "+str(len(self.events))+" events still in future")
+
+        if self.in_burst:   # We know we're still behind real time, so no need to look at the wall-clock (or lock)
+            keep_going = self._before_end_time()
+        else:
+            try:
+                self.sim_lock.acquire()       # <--
+                if self.sim_time >= time.time() - CATCH_UP_SLACK_S:
+                    self.caught_up_with_real_time()
+                keep_going = self._before_end_time()
+            finally:
+                self.sim_lock.release()   # -->
+
+        if not keep_going:
+            self.report_historical()
+        return keep_going
+
+    def _before_end_time(self):
+        if self.end_time == None:
+            return True
+
+        if self.end_time == "when_done":
+            keep_going = len(self.events)>0
+            if not keep_going:
+                logging.info("No further events")
+            return keep_going
+
+        if self.end_time=="now":    # Terminate when we've caught-up with real-time
+            if self.sim_time >= (time.time()-CATCH_UP_SLACK_S):   # Allow some slack
+                self.caught_up_with_real_time()
+                logging.info("Caught up with real time")
                 return False
             return True
-        finally:
-            self.sim_lock.release()   # -->
-            
+
+        if self.sim_time >= self.end_time:
+            logging.info("Reached simulation end time with "+str(len(self.events))+" events still in future")
+            return False
+        return True
+
     def next_event(self):
         """Execute next event
 
            If we have to wait for real time to catch up, then
            new external events can appear asychronously whilst we wait.
-           So we wait only a short period and then release so can reassess from scratch again soon (and so any other heartbeats can happen)."""
+           So we wait only a short period and then release so can reassess from scratch again soon (and so any other heartbeats can happen).
+
+           Whilst the simulation is well behind real time we run in "historical bursts": we look at the wall-clock once
+           at the start of each burst, and until then every event earlier than that is definitely due, so we execute them
+           without locking or consulting the wall-clock. Events injected asynchronously are collected between bursts."""
+        if self.in_burst:
+            if self._next_event_in_burst():
+                return
+            self.in_burst = False
+
+        self._collect_inbox()
+        if self.historical_burst and self._start_burst():
+            return
+
         self.sim_lock.acquire()           # <---
         if len(self.events) < 1:
             logging.info("No events pending")
-            wait = 1.0
+            (t, wait) = (None, None)
         else:
-            (t,skc,fn,arg,dev) = self.events[0]
+            e = self.events.peek()
+            (t,skc,fn,arg,dev) = e[:5]
             wait = t - time.time()
             if wait <= 0:
-                self.events.pop(0)
+                self.events.pop()
                 self.sim_lock.release()   # --->
                 self.set_now(t)
+                if not self.caught_up:
+                    self.historical_events += 1
                 logging.debug(str(fn.__name__)+"("+str(arg)+")")
-                fn(arg)             # Note that this is likely to itself inject more events, so we must have released lock
+                if self.profiler is None:
+                    fn(arg)         # Note that this is likely to itself inject more events, so we must have released lock
+                else:
+                    self.profiler.call(fn, arg)
+                if len(e) > 5:
+                    self._rearm(e)
                 return
         self.sim_lock.release()           # --->
         if t != self.next_event_time:
-            if wait >= 1.0:
+            if wait is not None and wait >= 1.0:
                 logging.info("Waiting {:.2f}s for real time".format(wait))
             self.next_event_time = t
-        time.sleep(min(1.0, wait))
+        self._wait_for_real_time(wait)
         self.set_now(time.time())    # So that any events injected asynchronously will correctly get stamped with current time
 
-    def _add_event(self, time, func, arg, dev):
+    def _wait_for_real_time(self, wait):
+        """Wait for up to <wait> seconds (None if no events are pending) for real time to catch up with the next event.
+           We wait no more than a second, so that we notice any events injected asynchronously meanwhile"""
+        if wait is None:
+            wait = 1.0
+        time.sleep(min(1.0, wait))
+
+    def _next_event_in_burst(self):
+        """Execute the next event of the current burst, without locking. Return False if the burst is over"""
+        if self.burst_events >= BURST_MAX_EVENTS or len(self.events) < 1:
+            return False
+        e = self.events.peek()
+        if e[0] >= self.burst_until:
+            return False
+        self.events.pop()
+        self.sim_time = e[0]
+        self.burst_events += 1
+        self.historical_events += 1
+        if self.profiler is None:
+            e[2](e[3])
+        else:
+            self.profiler.call(e[2], e[3])
+        if len(e) > 5:
+            self._rearm(e)
+        return True
+
+    def _start_burst(self):
+        """If the next event is sufficiently far in the past, start a historical burst"""
+        if len(self.events) < 1:
+            return False
+        burst_until = time.time() - CATCH_UP_SLACK_S
+        if self.events.peek()[0] >= burst_until:
+            return False
+        self.burst_until = burst_until
+        self.burst_events = 0
+        self.in_burst = True
+        return True
+
+    def _collect_inbox(self):
+        """Add any asynchronously-injected events to the queue. They were stamped with the simulation time when they arrived, but
+           may have waited here for a whole burst, so we ensure that they don't take effect in the past"""
+        while len(self.inbox) > 0:
+            (t, func, arg, dev, interval) = self.inbox.popleft()
+            self._add_event(max(t, self.get_now()), func, arg, dev, interval)
+
+    def _add_event(self, time, func, arg, dev, interval = None):
         """If multiple events are inserted at the same time, we guarnatee they'll get executed in order.
-        We do this by ensuring that the second item in the tuple is a monotonically rising number"""
+        We do this by ensuring that the second item in the tuple is a monotonically rising number.
+        If <interval> is given, the event is a periodic timer which will then repeat every <interval>, and we return the timer
+        (or None if it was injected asynchronously, in which case it can't be cancelled)"""
+        if threading.get_ident() != self.engine_thread:     # Injected asynchronously, so let engine thread collect it when it's ready
+            self.inbox.append((time, func, arg, dev, interval))
+            return None
+
         if time == 0:
             logging.info("Advisory: Setting event at epoch=0 (not illegal, but often a sign of a mistake)")
         elif time < self.get_now():
             logging.info("Advisory: Setting event in the past (not illegal, but often a sign of a mistake)")
 
-        self.sim_lock.acquire()
-        bisect.insort(self.events, (time, self.sort_key_count, func, arg, dev)) # Efficient since we know the list is kept sorted.
+        if not self.in_burst:
+            self.sim_lock.acquire()
+        timer = None
+        if interval is None:
+            self.events.push((time, self.sort_key_count, func, arg, dev))
+        else:
+            timer = [time, self.sort_key_count, func, arg, dev, interval, None]
+            self.events.push_timer(timer)
         self.sort_key_count += 1
-        self.sim_lock.release()
+        if not self.in_burst:
+            self.sim_lock.release()
+        return timer
+
+    def _rearm(self, timer):
+        """A periodic timer has just fired, so schedule it again (exactly as if it had re-registered itself)"""
+        timer[0] += timer[5]
+        timer[1] = self.sort_key_count
+        self.sort_key_count += 1
+        if self.in_burst:
+            self.events.push_timer(timer)
+        else:
+            self.sim_lock.acquire()
+            self.events.push_timer(timer)
+            self.sim_lock.release()
 
 ##        try:
 ##            self.sim_lock.acquire()   # <---
@@ -190,12 +319,13 @@ class Sim(Engine):
 ##            self.sim_Lock.release()   # --->
 
     def remove_all_events_for_device(self, dev):
-        self.sim_lock.acquire()
-        old_len = len(self.events)
-        self.events = [e for e in self.events if e[4] != dev] # Remove any events with device=dev
-        new_len = len(self.events)
-        self.sim_lock.release()
-        logging.info("Removed all events for device "+str(dev)+ " (" + str(old_len-new_len)+" events removed)")
+        if self.in_burst:
+            removed = self.events.remove_device(dev)
+        else:
+            self.sim_lock.acquire()
+            removed = self.events.remove_device(dev)
+            self.sim_lock.release()
+        logging.info("Removed all events for device "+str(dev)+ " (" + str(removed)+" events removed)")
           
     def register_event_at(self, time, func, arg, device):
         self._add_event(time, func, arg, device)
@@ -204,6 +334,22 @@ class Sim(Engine):
         assert deltaTime >= 0
         self._add_event(self.get_now() + deltaTime, func, arg, device)
 
+    def register_periodic(self, interval, func, arg, device):
+        assert interval > 0
+        return self._add_event(self.get_now() + interval, func, arg, device, interval)
+
+    def cancel_periodic(self, handle):
+        self.events.cancel_timer(handle)    # The timer isn't armed while its callback runs, so it just won't be re-armed (see event_queue.PeriodicQueue)
+
+    def get_checkpoint(self):
+        return { "events" : self.events, "sim_time" : self.sim_time, "sort_key_count" : self.sort_key_count, "inbox" : list(self.inbox) }
+
+    def restore_checkpoint(self, state):
+        self.events = state["events"]
+        self.sim_time = state["sim_time"]
+        self.sort_key_count = state["sort_key_count"]
+        self.inbox.extend(state["inbox"])
+
     def dump_events(self):
         logging.info("EVENT QUEUE:")
         for e in self.events:
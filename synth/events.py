@@ -46,6 +46,18 @@ Create a device::
         }
     }
 
+Create a cohort of many devices at once (much faster than a create_device event with many repeats)::
+
+    "create_devices" : {
+        "count" : 100000,
+        "functions" : {
+                ...
+        }
+    }
+
+Devices in a cohort behave exactly as if each had been created by create_device, except that each device sends just one message as it boots
+(rather than one from each of its functions), and instead of logging each device Synth logs the whole cohort.
+
 Change arbitrary device properties with arbitrary timestamps::
 
     "change_property" : {
@@ -95,12 +107,12 @@ Install an anomaly-analyser::
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
-# TODO: Started writing a "sharding" mechanism, to split a Synth run across multiple instances. But not finished as
-#       for now it's good-enough to create large loads by just "exploding" device IDs 
-#       (so an explode factor of 100 will generate 100 output devices for every 1 simulated device, and they'll be identical (apart from id))
-# 
+# To create large loads, you can either "explode" device IDs
+# (so an explode factor of 100 will generate 100 output devices for every 1 simulated device, and they'll be identical (apart from id))
+# Each message is passed to the client once, with the list of exploded ids, so that clients can encode it once (see Client.update_variants())
+# or split the run across multiple processes with "shards" (see sharding.py)
+#
 import os, errno
-import sys
 from datetime import datetime
 import logging
 import json
@@ -138,14 +150,15 @@ class Events():
 
             if explode_factor is None:
                 client.update_device(device_id, time, properties)
-            else:
-                new_props = properties.copy()
-                for i in range(explode_factor):
-                    eid = str(device_id) + "_" + str(i)    # Each exploded device is identical, except for trailing "-N" ID (and label, if exists)
-                    new_props["$id"] = eid
-                    if "label" in new_props:
-                        new_props["label"] = properties["label"] + "_" + str(i) 
-                    client.update_device(eid, time, new_props)
+            else:   # Each exploded device is identical, except for trailing "_N" ID (and label, if exists)
+                eid = str(device_id)
+                if "label" in properties:
+                    label = properties["label"]
+                    variants = [(eid + suffix, label + suffix) for suffix in explode_suffixes]
+                    client.update_variants(time, properties, ("$id", "label"), variants)
+                else:
+                    variants = [(eid + suffix,) for suffix in explode_suffixes]
+                    client.update_variants(time, properties, ("$id",), variants)
 
         def query_action(params):
             events = evt2csv.read_evt_str("".join(self.logtext))
@@ -163,7 +176,8 @@ class Events():
             d = device_factory.get_devices_by_property( params["identity_property"], params["identity_value"])
             if "identity_property2" in params:
                 d2 = device_factory.get_devices_by_property( params["identity_property2"], params["identity_value2"])
-                d = list(set(d) & set(d2))
+                d2 = set(d2)
+                d = [x for x in d if x in d2]   # In order of creation, so the order of output is repeatable
             logging.info("change property acting on "+str(len(d))+" matching devices")
 
             if "$ts" in params:
@@ -183,6 +197,9 @@ class Events():
             else:
                 logging.error("Ignoring action '"+str(name)+"' as client "+str(client.__class__.__name__)+" does not support it")
 
+        self.update_callback = update_callback  # checkpoint.py needs to find these
+        self.actions = { "query" : query_action, "change_property" : change_property_action, "client" : client_action }
+
         @functools.lru_cache(maxsize=128)
         def dt_string(t):
             return pendulum.from_timestamp(t).to_datetime_string() + " "    # For some reason, this is very slow
@@ -208,10 +225,12 @@ class Events():
         restart_log = context.get("restart_log", True)
         self.do_write_log = context.get("write_log", True)
         shard_size = context.get("shard_size", None)
-        shard_start = context.get("shard_start", 0) # If not specified, we are shard 0, so get to create the other shards
+        shard_start = context.get("shard_start", 0) # If not specified, we are shard 0
+        first_shard = (shard_start == 0)    # Actions which aren't per-device are only done by the first shard
         explode_factor = context.get("explode_factor", None)
         if explode_factor is not None:
             logging.info("Running with explode_factor="+str(explode_factor))
+            explode_suffixes = ["_" + str(i) for i in range(explode_factor)]
 
         self.event_count = 0
         self.update_callbacks = []
@@ -260,24 +279,41 @@ class Events():
                         if device_count >= shard_start + shard_size:
                             do_create = False
 
-                        if shard_start == 0:    # We're the first shard
-                            if device_count > 0:
-                                if (device_count % shard_size) == 0:
-                                    logging.info("CREATE NEW SHARD for devices starting at "+str(device_count))
-                                    args = sys.argv.copy()
-                                    args = ["python3"] + args + ["{ shard_start : " + str(device_count) + " } "]
-                                    logging.info(str(args))
-
                     if do_create:
                         engine.register_event_at(insert_time, device_factory.create_device,
                                              (instance_name, client, engine, update_callback, context, action["create_device"]),
                                              None)
 
                     device_count += 1
+                elif "create_devices" in action:
+                    count = action["create_devices"].get("count", 1)
+                    (first, last) = (device_count, device_count + count)
+                    if shard_size is not None:      # Just the part of this cohort which is in our shard
+                        (first, last) = (max(first, shard_start), min(last, shard_start + shard_size))
+
+                    if last > first:
+                        params = action["create_devices"]
+                        if last - first != count:
+                            params = dict(params, count = last - first)
+                        engine.register_event_at(insert_time, device_factory.create_devices,
+                                             (instance_name, client, engine, update_callback, context, params),
+                                             None)
+
+                    device_count += count
                 elif "use_model" in action:
-                    engine.register_event_at(insert_time,
-                            model.use_model,
-                            (instance_name, client, engine, update_callback, context, action["use_model"]), None)
+                    groups = None
+                    if shard_size is not None:      # Just the groups of model devices whose first device is in our shard (see model.shard_groups())
+                        groups = set()
+                        for (group, count) in model.shard_groups(model.load_specification(action["use_model"])):
+                            if shard_start <= device_count < shard_start + shard_size:
+                                groups.add(group)
+                            device_count += count
+                    if groups is None or len(groups) > 0:
+                        engine.register_event_at(insert_time,
+                                model.use_model,
+                                (instance_name, client, engine, update_callback, context, action["use_model"], groups), None)
+                elif not first_shard and "change_property" not in action and "install_analyser" not in action:
+                    pass    # Only the first shard does actions which aren't per-device
                 elif "query" in action:
                     engine.register_event_at(insert_time,
                                              query_action,
@@ -313,6 +349,27 @@ class Events():
             if time_advance:
                 at_time = insert_time
 
+    def get_checkpoint(self):
+        """Return our state, for checkpoint.py to save"""
+        position = None
+        if self.logfile is not None:
+            self.logfile.flush()
+            position = self.logfile.tell()
+        return { "event_count" : self.event_count, "update_callbacks" : self.update_callbacks, "analyser" : getattr(self, "analyser", None), "log_position" : position }
+
+    def restore_checkpoint(self, state):
+        """Carry on from a checkpoint. The .evt file must have been opened for appending (not restarted), and is truncated to
+           where it was at the checkpoint, so that it ends up exactly as if the run had never been interrupted"""
+        self.event_count = state["event_count"]
+        self.update_callbacks = state["update_callbacks"]
+        if state["analyser"] is not None:
+            self.analyser = state["analyser"]
+        if self.logfile is not None and state["log_position"] is not None:
+            filename = self.logfile.name
+            self.logfile.close()
+            os.truncate(filename, state["log_position"])
+            self.logfile = open(filename, "at")
+
     def flush(self):
         """Call at exit to clean up."""
         if self.logfile is not None:
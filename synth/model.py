@@ -27,6 +27,8 @@
     Devices can also find out what model hierarchy they exist within. For example the Disruptive Technology
     device behaviour can use the model to discover if it is in the same part of a model as other devices.
     Thus proximity sensors attached to fridge doors can make the fridge get warm if they are left open.
+    Model elements and devices are indexed by their place in the hierarchy (see HierarchyIndex), so finding them takes time in
+    proportion to how many match, rather than to the size of the whole model, and even large estates load quickly.
 
 
     Helpful shortcuts for rapid modelling:
@@ -66,12 +68,14 @@ import json
 import copy
 import device_factory
 import random
+import math
 from os import path
 from common import importer
 from common import randstruct
 from directories import *
 
 MODEL_FIELDS_BECOME_PROPERTIES = True
+EXACT_SHIFT = 1074      # Every finite float is a whole number of 2**-1074ths
 
 def randomise(s):
 # If string s contains a "randomise me" list of choices, then turn it into one of its choices
@@ -144,15 +148,168 @@ def enumerate_model_counters(struc):
 
     return L
 
+def exact(value):
+    """A finite number as a whole number of 2**-EXACT_SHIFTths, or None if it isn't one"""
+    if isinstance(value, int):  # (Including bool)
+        return int(value) << EXACT_SHIFT
+    if isinstance(value, float) and math.isfinite(value):
+        (n, d) = value.as_integer_ratio()   # d is a power of 2
+        return n << (EXACT_SHIFT + 1 - d.bit_length())
+    return None
+
+class Total():
+    """Running totals of the values of a property over a set of things. Numbers are summed exactly, so values can be
+       added and taken away forever without the total drifting, and the mean doesn't depend on the order of doing so"""
+    def __init__(self):
+        self.count = 0          # Things with the property
+        self.true_count = 0     # ... whose value is true
+        self.number_count = 0   # ... whose value is a finite number
+        self.number_sum = 0     # ... and the sum of those numbers, in 2**-EXACT_SHIFTths
+
+    def add(self, value, sign = 1):
+        """Add a value to the totals (or with sign = -1, take it away)"""
+        self.count += sign
+        if value:
+            self.true_count += sign
+        n = exact(value)
+        if n is not None:
+            self.number_count += sign
+            self.number_sum += sign * n
+
+    def include(self, other):
+        self.count += other.count
+        self.true_count += other.true_count
+        self.number_count += other.number_count
+        self.number_sum += other.number_sum
+
+    def mean(self):
+        return self.number_sum / (self.number_count << EXACT_SHIFT)    # Division of ints is correctly-rounded
+
+    def fraction_true(self):
+        return self.true_count / float(self.count)
+
+class HierarchyNode():
+    def __init__(self):
+        self.children = {}      # Value at this level -> node
+        self.unspecified = None # Node for things which don't specify this level
+        self.things = []        # (Below the last level) numbers of the things at this place, in the order in which they were added
+        self.totals = {}        # Property -> Total of all the things at or below this node
+
+class HierarchyIndex():
+    """A trie of things (model elements, or devices) by their place in the model hierarchy, i.e. by the value which they give for each level
+       (or not, as levels can be left unspecified). Finds the things which match a place - those which, at every level which both
+       they and the place specify, have the same value - by visiting only the parts of the trie which match, rather than every thing.
+       It can also keep totals of properties of the things, which are rolled-up from each node to the one above, so that
+       the total over all the things which match a place needs only the nodes where the place stops specifying levels"""
+    def __init__(self, hierarchy):
+        self.hierarchy = hierarchy or []
+        self.root = HierarchyNode()
+        self.things = []
+        self.paths = []     # [nodes from the root to each thing], by number
+
+    def add(self, thing, place):
+        """Add a thing, and return its number"""
+        node = self.root
+        path = [node]
+        for h in self.hierarchy:
+            if h in place:
+                child = node.children.get(place[h], None)
+                if child is None:
+                    child = node.children[place[h]] = HierarchyNode()
+            else:
+                child = node.unspecified
+                if child is None:
+                    child = node.unspecified = HierarchyNode()
+            node = child
+            path.append(node)
+        node.things.append(len(self.things))
+        self.things.append(thing)
+        self.paths.append(path)
+        return len(self.things) - 1
+
+    def matching(self, place):
+        """Things which match <place>, in the order in which they were added"""
+        numbers = []
+        nodes = self._nodes(place, len(self.hierarchy))
+        for node in nodes:
+            numbers.extend(node.things)
+        if len(nodes) > 1:
+            numbers.sort()
+        return [self.things[n] for n in numbers]
+
+    def _nodes(self, place, depth):
+        """The nodes <depth> levels down which match <place>"""
+        nodes = [self.root]
+        for h in self.hierarchy[:depth]:
+            next_nodes = []
+            for node in nodes:
+                if h in place:
+                    child = node.children.get(place[h], None)
+                    if child is not None:
+                        next_nodes.append(child)
+                else:
+                    next_nodes.extend(node.children.values())
+                if node.unspecified is not None:
+                    next_nodes.append(node.unspecified)
+            nodes = next_nodes
+        return nodes
+
+    def track(self, prop, value_of):
+        """Start (or restart) keeping totals of <prop> of all things. value_of(thing) is its value, or device_factory.ABSENT"""
+        for node in self._all_nodes():
+            node.totals[prop] = Total()
+        for (number, thing) in enumerate(self.things):
+            value = value_of(thing)
+            if value is not device_factory.ABSENT:
+                self.changing(number, prop, device_factory.ABSENT, value)
+
+    def _all_nodes(self):
+        nodes = [self.root]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            yield node
+            nodes.extend(node.children.values())
+            if node.unspecified is not None:
+                nodes.append(node.unspecified)
+
+    def changing(self, number, prop, old_value, new_value):
+        """Update the totals of <prop> as thing <number> changes it (either value may be device_factory.ABSENT)"""
+        for node in self.paths[number]:
+            total = node.totals.get(prop, None)
+            if total is None:
+                total = node.totals[prop] = Total()
+            if old_value is not device_factory.ABSENT:
+                total.add(old_value, -1)
+            if new_value is not device_factory.ABSENT:
+                total.add(new_value)
+
+    def total(self, place, prop):
+        """The Total of <prop> over all the things which match <place>"""
+        depth = len(self.hierarchy)
+        while depth > 0 and self.hierarchy[depth-1] not in place:   # Below here the place matches everything, so the totals of the nodes at this level will do
+            depth -= 1
+        result = Total()
+        for node in self._nodes(place, depth):
+            if prop in node.totals:
+                result.include(node.totals[prop])
+        return result
+
+def place_key(place):
+    try:
+        return frozenset(place.items())
+    except TypeError:   # An unhashable value, so just put it with any others
+        return None
+
 class Model():
-    def __init__(self, specification, instance_name, client, engine, update_callback, context):
+    def __init__(self, specification, instance_name, client, engine, update_callback, context, groups = None):
         self.instance_name = instance_name
         self.client = client
         self.engine = engine
         self.update_callback = update_callback
         self.context = context
+        self.groups = groups    # If not None, only create the devices of model elements in these shard groups (see shard_groups())
         self.devices = []
-        self.cache_gpab = {}    # If we anticipate changing the model after loading, we should invalidate this cache then
+        self.cache_gpab = {}    # Emptied whenever a device is added
 
         self.load_file(specification)
         self.enact_models(self.models)
@@ -170,10 +327,19 @@ class Model():
                     self.models.append(e)
             else:
                 assert "Element of model file contains neither hierarchy or model: "+repr(elem)
+        self.model_index = HierarchyIndex(self.hierarchy)   # Built once we know the hierarchy, which may come after model elements
+        for m in self.models:
+            self.model_index.add(m, m["model"])
+        self.device_index = HierarchyIndex(self.hierarchy)
+        self.peer_groups = {}   # place_key of a model element -> list of (model element, [devices created by elements equal to it])
+        self.peer_group_of = {} # Device -> its list of peers (including itself)
+        self.device_numbers = {}    # Device -> its number in device_index
+        self.tracked = set()    # Properties of which device_index keeps totals
+        self.tracking_generation = None     # The device_factory.g_generation in which we started watching them
 
     def enact_models(self, models):
         for m in models:
-            if "devices" in m:
+            if "devices" in m and (self.groups is None or shard_group(self.hierarchy, m) in self.groups):
                 properties = self.collect_properties(self.find_matching_models(m))
                 number = m.get("count", 1)
                 assert type(m["devices"]) == list, "This should be a [{'list':{}}, {'of':{}}, {'dicts':{}}]  :  "+str(m["devices"])
@@ -183,10 +349,29 @@ class Model():
                         device = self.create_device(device_spec)
                         device.model = self
                         device.model_spec = m
+                        self.add_to_hierarchy(device)
                         device.set_properties(properties) 
                         if MODEL_FIELDS_BECOME_PROPERTIES:
                             device.set_properties(m["model"])
 
+    def add_to_hierarchy(self, device):
+        """Index a new device (whose model_spec is set) by its place in the hierarchy"""
+        number = self.device_index.add(device, device.model_spec["model"])
+        self.device_numbers[device] = number
+        groups = self.peer_groups.setdefault(place_key(device.model_spec["model"]), [])
+        for (spec, peers) in groups:
+            if spec is device.model_spec or spec == device.model_spec:
+                break
+        else:
+            peers = []
+            groups.append((device.model_spec, peers))
+        peers.append(device)
+        self.peer_group_of[device] = peers
+        self.cache_gpab.clear()
+        for prop in self.tracked:
+            if prop in device.properties:
+                self.device_index.changing(number, prop, device_factory.ABSENT, device.properties[prop])
+
     def collect_properties(self, models):
         props = {}
         for m in models:
@@ -212,28 +397,11 @@ class Model():
         return device
 
     def find_matching_models(self, desired):
-        # TODO: If models get large, this needs to be rewritten to use set intersection
-        match = [True] * len(self.models)   # A flag for every model entry
-        for h in self.hierarchy:
-            if h in desired["model"]: 
-                for i in range(len(self.models)):
-                    if h in self.models[i]["model"]:
-                        if self.models[i]["model"][h] != desired["model"][h]:
-                            match[i] = False
-        result = []
-        for i in range(len(self.models)):
-            if match[i]:
-                result.append(self.models[i])
-        return result
+        return self.model_index.matching(desired["model"])
 
     def get_peers(self, device):
         # Get all other devices which are at the same level of the model
-        peers = []
-        for d in self.devices:
-            if d != device:
-                if d.model_spec == device.model_spec:
-                    peers.append(d)
-        return peers
+        return [d for d in self.peer_group_of[device] if d is not device]
 
     def get_peers_and_below(self, device):
         # Should perhaps be called "get_peers_and_above"!
@@ -242,31 +410,70 @@ class Model():
         # So for example if a weather device defines "site=X" and you call this function from a device which also defines "site=X" (whatever other model hierarchy levels it defines), it will match
         if device in self.cache_gpab:
             return self.cache_gpab[device]
-        desired = device.model_spec
-        devs = []
-        for d in self.devices:
-            if d != device:
-                match = True
-                for h in self.hierarchy:
-                    if h in desired["model"]:
-                        if h in d.model_spec["model"]:
-                            if desired["model"][h] != d.model_spec["model"][h]:
-                                match = False
-                if match:
-                    devs.append(d)
+        devs = [d for d in self.device_index.matching(device.model_spec["model"]) if d is not device]
         self.cache_gpab[device] = devs
         return devs
 
-
-def use_model(args):
-    (instance_name, client, engine, update_callback, context, params) = args
+    def total_of_peers_and_below(self, device, prop):
+        # The Total (see above) of <prop> over the devices which get_peers_and_below(device) returns
+        # Totals are kept up to date as devices change, so this takes the same time however many devices there are
+        self.track(prop)
+        total = self.device_index.total(device.model_spec["model"], prop)
+        if prop in device.properties:
+            total.add(device.properties[prop], -1)  # Not including itself
+        return total
+
+    def track(self, prop):
+        if self.tracking_generation != device_factory.g_generation:   # Restored from a checkpoint (or first time), so no longer being told of changes
+            self.tracking_generation = device_factory.g_generation
+            (tracked, self.tracked) = (self.tracked, set())
+            for p in sorted(tracked):
+                self.track(p)
+        if prop not in self.tracked:
+            self.tracked.add(prop)
+            self.device_index.track(prop, lambda d: d.properties.get(prop, device_factory.ABSENT))
+            device_factory.watch_property(prop, self.property_changing)
+
+    def property_changing(self, device, prop, old_value, new_value):
+        number = self.device_numbers.get(device, None)
+        if number is not None:
+            self.device_index.changing(number, prop, old_value, new_value)
+
+
+def load_specification(params):
     if "file" in params:
         filepath = SCENARIO_DIR + params["file"]
         logging.info("Loading model file "+str(filepath))
-        struc = json.loads(open(filepath, "rt").read())    # We expect a list of dicts
-    else:
-        struc = params
-    model = Model(struc, instance_name, client, engine, update_callback, context)
+        return json.loads(open(filepath, "rt").read())    # We expect a list of dicts
+    return params
+
+def shard_group(hierarchy, elem):
+    """Devices which share a value of the top level of the hierarchy (e.g. all those of one customer) can see each other, so must be
+       created by the same shard. Elements which don't specify the top level are estate-wide, and form one group of their own (None)"""
+    if hierarchy is None:
+        return None
+    return elem["model"].get(hierarchy[0], None)
+
+def shard_groups(specification):
+    """Return [(group, number of devices)] for the devices which this model will create, in order of first appearance (see sharding.py)"""
+    state = random.getstate()   # Enumerating may randomise, which mustn't disturb the simulation's own random numbers
+    hierarchy = None
+    elems = []
+    for elem in specification:
+        if "hierarchy" in elem:
+            hierarchy = elem["hierarchy"].split("/")
+        elif "model" in elem and "devices" in elem:
+            elems.extend(enumerate_model_counters(elem))
+    random.setstate(state)
+    groups = {}
+    for e in elems:
+        group = shard_group(hierarchy, e)
+        groups[group] = groups.get(group, 0) + len(e["devices"]) * e.get("count", 1)
+    return list(groups.items())
+
+def use_model(args):
+    (instance_name, client, engine, update_callback, context, params, groups) = args    # <groups> is None, except in a shard of a sharded run
+    model = Model(load_specification(params), instance_name, client, engine, update_callback, context, groups)
 
 if __name__ == "__main__":
     def test(length, x):
@@ -283,5 +490,22 @@ if __name__ == "__main__":
     test( 2, { "model" : { "a" : "A #2#", "b" : "B #1#" } } )
     test( 4, { "model" : { "a" : "A #2#", "b" : "B #2#" } } )
     test( 27, { "model" : { "a" : "A #3#", "b" : "B #3#", "c" : "C #3#" } } )
+
+    # HierarchyIndex must match exactly what a scan would
+    def matches(place, other, hierarchy):
+        return all([place[h] == other[h] for h in hierarchy if h in place and h in other])
+    random.seed(1)
+    hierarchy = ["a", "b", "c", "d"]
+    def random_place():
+        return { h : random.choice([1, 2, 3]) for h in hierarchy if random.random() < 0.7 }
+    index = HierarchyIndex(hierarchy)
+    places = []
+    for i in range(2000):
+        place = random_place()
+        index.add(i, place)
+        places.append(place)
+    for q in range(200):
+        desired = random_place()
+        assert index.matching(desired) == [i for i in range(len(places)) if matches(desired, places[i], hierarchy)]
     print("Tests passed")
 
@@ -0,0 +1,166 @@
+"""PROFILER
+   Measure where a simulation spends its time, event callback by event callback.
+
+   Add ``"profile" : true`` to a scenario (or on the command-line as ``{"profile" : true}``), or e.g.
+   ``"profile" : { "sort_by" : "count", "top" : 20 }``, and the engine times every event callback it executes. For each callback
+   (e.g. Comms.tick_comms_up_down, Variable.tick_variable), and for each kind of composed device (e.g. heartbeat+comms+variable), it records:
+
+    * How many times it was called
+    * The total time spent in it (including everything it called, e.g. the client)
+    * A histogram of how long each call took, from which we report the median, 99th percentile and maximum
+
+   The report is written to <instance>.profile in the log directory when the simulation ends, and whenever the process
+   receives SIGUSR2 (e.g. ``kill -USR2 <pid>``). It is sorted by "sort_by", which can be "total" (the default), "count", "mean" or "max".
+   It also shows how much of the elapsed time was spent outside callbacks (i.e. in the engine and the top-level loop, and sending
+   the properties which callbacks set, which are grouped into messages after each callback returns - see device_factory.PropertyGrouper).
+
+   Each call costs two clock reads and a dictionary update, so it's fine to leave on for full-sized runs.
+"""
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import time
+import logging
+from time import perf_counter
+from datetime import datetime
+from directories import *
+
+HISTOGRAM_BUCKETS = 32      # Bucket N counts calls which took less than 2^N microseconds (and at least 2^(N-1))
+SORT_KEYS = ["total", "count", "mean", "max"]
+MAX_US = 1 << (HISTOGRAM_BUCKETS-2)     # Longer calls are counted in the last bucket
+DEFAULT_TOP = 50            # Number of lines in each section of the report
+
+class Stats():
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for i in range(HISTOGRAM_BUCKETS):
+            self.histogram[i] += other.histogram[i]
+
+    def percentile(self, p):
+        """Return (an upper bound on) the time taken by the <p>th percentile call, in seconds"""
+        target = self.count * p / 100.0
+        n = 0
+        for i in range(HISTOGRAM_BUCKETS):
+            n += self.histogram[i]
+            if n >= target:
+                return min((1 << i) / 1000000.0, self.max)
+        return self.max
+
+    def sort_key(self, sort_by):
+        if sort_by == "count":
+            return self.count
+        if sort_by == "mean":
+            return self.total / max(1, self.count)
+        if sort_by == "max":
+            return self.max
+        return self.total
+
+def callback_name(func):
+    if hasattr(func, "__qualname__"):
+        if "." not in func.__qualname__:    # A plain function, so say which module it's in
+            return func.__module__ + "." + func.__qualname__
+        return func.__qualname__
+    return repr(func)
+
+def class_name(cls):
+    """Name a composed device class after the classes it was composed from (see device_factory.compose_class())"""
+    composed_from = getattr(cls, "composed_from", None)
+    if composed_from is None:
+        return None
+    return "+".join(composed_from)
+
+class Profiler():
+    def __init__(self, instance_name, params):
+        if type(params) != dict:
+            params = {}     # "profile" : true
+        self.filename = LOG_DIR + instance_name + ".profile"
+        self.sort_by = params.get("sort_by", "total")
+        assert self.sort_by in SORT_KEYS, "profile sort_by must be one of "+str(SORT_KEYS)
+        self.top = params.get("top", DEFAULT_TOP)
+        self.stats = {}     # (function, class of the object it's bound to) -> Stats
+        self.start_time = time.time()
+        logging.info("Profiling event callbacks (report will be written to "+self.filename+")")
+
+    def call(self, fn, arg):
+        """Call event callback fn(arg), measuring how long it takes"""
+        t = perf_counter()
+        fn(arg)
+        dt = perf_counter() - t
+        key = (getattr(fn, "__func__", fn), type(getattr(fn, "__self__", None)))
+        s = self.stats.get(key, None)
+        if s is None:
+            s = Stats()
+            self.stats[key] = s
+        s.count += 1
+        s.total += dt
+        if dt > s.max:
+            s.max = dt
+        us = int(dt * 1000000)
+        s.histogram[us.bit_length() if us < MAX_US else HISTOGRAM_BUCKETS-1] += 1
+
+    def summarise(self, name_of):
+        """Combine stats according to <name_of>((function, class)), which may return None to exclude them"""
+        result = {}
+        for (key, s) in list(self.stats.items()):
+            name = name_of(key)
+            if name is None:
+                continue
+            if name not in result:
+                result[name] = Stats()
+            result[name].add(s)
+        return result
+
+    def format_section(self, title, summary):
+        lines = [title, "{:>10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}  {}".format("count", "total s", "mean us", "median us", "99% us", "max us", "name")]
+        for (name, s) in sorted(summary.items(), key=lambda item: item[1].sort_key(self.sort_by), reverse=True)[:self.top]:
+            lines.append("{:10d} {:10.3f} {:10.1f} {:10.1f} {:10.1f} {:10.1f}  {}".format(s.count, s.total, s.total / max(1, s.count) * 1e6,
+                s.percentile(50) * 1e6, s.percentile(99) * 1e6, s.max * 1e6, name))
+        if len(summary) > self.top:
+            lines.append("... and "+str(len(summary) - self.top)+" more")
+        return lines
+
+    def report(self):
+        """Write the report file"""
+        by_callback = self.summarise(lambda key: callback_name(key[0]))
+        by_class = self.summarise(lambda key: class_name(key[1]))
+        total = Stats()
+        for s in by_callback.values():
+            total.add(s)
+        elapsed = time.time() - self.start_time
+
+        lines = ["Synth profile written at real time "+str(datetime.now())+", sorted by "+self.sort_by]
+        lines.append("{:,} callbacks took {:.3f}s in total, of {:.3f}s elapsed ({:.3f}s outside callbacks, i.e. in the engine and top-level loop)".format(
+            total.count, total.total, elapsed, elapsed - total.total))
+        lines.append("Median and 99th percentile times are upper bounds (from a histogram with power-of-two buckets)")
+        lines.append("")
+        lines += self.format_section("By event callback", by_callback)
+        lines.append("")
+        lines += self.format_section("By device class", by_class)
+        open(self.filename, "wt").write("\n".join(lines) + "\n")
+        logging.info("Wrote profile of "+str(total.count)+" callbacks to "+self.filename)
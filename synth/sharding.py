@@ -0,0 +1,248 @@
+"""SHARDING
+   Split a Synth run across multiple processes on one machine, so that a large scenario can use every core.
+
+   Add e.g. ``"shards" : 8`` to a scenario (or on the command-line as ``{"shards" : 8}``) and this process becomes a coordinator:
+
+    * It counts the devices created by the scenario's create_device(s) and use_model events, and divides them into contiguous blocks, one per shard
+    * It launches one worker process per shard. Each worker runs the whole scenario but only creates its own block of devices
+      (using the "shard_start" and "shard_size" parameters). Workers are named <instance>_shard<N>, so each writes its own .out, .err, .evt and JSON files
+    * It reports the combined progress of all the workers
+    * When all workers have finished, it merges their .evt and JSON outputs by timestamp into <instance>.evt and <instance>NNNNN.json
+    * It exits with status 0 only if every worker did
+
+   A model's devices are split between shards by the top level of its hierarchy (e.g. by customer): all the devices with one value of it
+   are created by the shard in which the first of them falls, so devices which read each other's state through the model (e.g. aggregate)
+   still see all their peers. Devices in model elements which don't specify the top level span the whole estate, so only see peers in their own shard.
+   Only the first shard performs query and client actions, so those aren't duplicated.
+   Each shard seeds its random-number generators differently, so shards don't all behave identically.
+   The engine's "end_after_events" is divided between the shards in proportion to their numbers of devices, so a sharded run
+   writes the same number of events as an unsharded one.
+   CSV files are not merged (each shard leaves its own).
+"""
+#
+# Copyright (c) 2017 DevicePilot Ltd.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+import glob
+import json
+import math
+import time
+import heapq
+import random
+import logging
+import threading
+import subprocess
+import model
+from common import json_writer
+from devices.basic import Basic
+from directories import *
+
+PROGRESS_INTERVAL_S = 5
+
+def is_coordinator(params):
+    return params.get("shards", 1) > 1 and "shard_start" not in params
+
+def is_worker(params):
+    return "shard_index" in params
+
+def shard_name(instance_name, shard_index):
+    return instance_name + "_shard" + str(shard_index)
+
+def count_devices(event_list):
+    """How many devices will the create_device(s) and use_model events in this scenario create?"""
+    n = 0
+    for event in event_list:
+        action = event.get("action", None)
+        if action is not None and "create_device" in action:
+            n += event.get("repeats", 1)
+        elif action is not None and "create_devices" in action:
+            n += event.get("repeats", 1) * action["create_devices"].get("count", 1)
+        elif action is not None and "use_model" in action:
+            groups = model.shard_groups(model.load_specification(action["use_model"]))
+            if None in [group for (group, count) in groups]:
+                logging.warning("Model has devices which don't specify the top level of its hierarchy, so they will only see peers in their own shard")
+            n += event.get("repeats", 1) * sum([count for (group, count) in groups])
+    return n
+
+# Worker side
+
+def end_after_events_shares(total, num_devices, num_shards, shard_size):
+    """Divide <total> events between the shards in proportion to their devices, so that the shares add up to exactly <total>"""
+    shares = []
+    done = 0
+    for i in range(num_shards):
+        devices_so_far = min(num_devices, (i+1) * shard_size)
+        share = (total * devices_so_far) // max(1, num_devices) - done
+        shares.append(share)
+        done += share
+    return shares
+
+def init_worker(params, instance_name):
+    """Set up this process as one shard of a sharded run. Returns the instance name to run as."""
+    shard_index = params["shard_index"]
+    name = shard_name(instance_name, shard_index)
+    if "filename" in params.get("client", {}):
+        params["client"]["filename"] = shard_name(params["client"]["filename"], shard_index)
+    random.seed(12345 + shard_index)
+    Basic.myRandom.seed(1234 + shard_index)             # So device IDs don't collide between shards (shard 0 gets the same IDs as an unsharded run)
+    Basic.device_number = params.get("shard_start", 0)  # So device labels are numbered as if unsharded
+    return name
+
+def start_progress_reporting(instance_name, events, engine):
+    """Periodically write our progress to a file, for the coordinator to read. Done in a thread, so costs the engine nothing."""
+    def report():
+        while True:
+            progress = { "events" : events.event_count, "sim_time" : engine.get_now_no_lock() }
+            open(LOG_DIR + instance_name + ".progress", "wt").write(json.dumps(progress))
+            time.sleep(PROGRESS_INTERVAL_S)
+
+    t = threading.Thread(target=report)
+    t.daemon = True
+    t.start()
+
+# Coordinator side
+
+def read_progress(name):
+    try:
+        return json.loads(open(LOG_DIR + name + ".progress", "rt").read())
+    except:
+        return None     # Not started yet, or we caught it mid-write
+
+def report_progress(names, running):
+    total_events = 0
+    sim_times = []
+    for name in names:
+        p = read_progress(name)
+        if p is not None:
+            total_events += p["events"]
+            sim_times.append(p["sim_time"])
+    s = str(running) + " of " + str(len(names)) + " shards running, " + str(total_events) + " events written"
+    if len(sim_times) > 0:
+        s += ", slowest shard at " + time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(min(sim_times)))
+    logging.info(s)
+
+def evt_lines(filename, shard_index):
+    """Yield (timestamp, shard, line) for each event in a .evt file"""
+    if not os.path.exists(filename):
+        return
+    with open(filename, "rt") as f:
+        for L in f:
+            i = L.find("$ts,")
+            if i == -1:
+                continue    # Not an event (e.g. a header)
+            j = L.find(",", i+4)
+            yield (float(L[i+4:j]), shard_index, L)
+
+def json_files(name):
+    """All the JSON files written by the shard called <name>, in the order written (they may have timestamp or message-count prefixes)"""
+    files = glob.glob(LOG_DIR + "*" + name + "[0-9][0-9][0-9][0-9][0-9].json")
+    files = [f for f in files if os.path.basename(f)[:-len("00000.json")].endswith(name)]
+    return sorted(files, key=lambda f: f[-len("00000.json"):])
+
+def json_lines(name, shard_index):
+    """Yield (timestamp, shard, line) for each event in the JSON files written by a shard"""
+    for filename in json_files(name):
+        with open(filename, "rt") as f:
+            for L in f:
+                L = L.strip()
+                if L in ["[", "]", ""]:
+                    continue
+                L = L.rstrip(",")
+                i = L.find('"$ts": ') + 7
+                j = i
+                while L[j] not in ",}":
+                    j += 1
+                yield (int(L[i:j]) / 1000.0, shard_index, L)
+        os.remove(filename)
+
+def merge_outputs(instance_name, names, params):
+    """Merge the outputs of all shards, by timestamp. Where timestamps are equal, earlier shards come first."""
+    if params.get("write_log", True):
+        logging.info("Merging shard .evt files")
+        with open(LOG_DIR + instance_name + ".evt", "wt") as out:
+            for (ts, shard, L) in heapq.merge(*[evt_lines(LOG_DIR + names[i] + ".evt", i) for i in range(len(names))]):
+                out.write(L)
+
+    if any([len(json_files(name)) > 0 for name in names]):
+        logging.info("Merging shard JSON files")
+        client_params = params.get("client", {})
+        stream = json_writer.Stream(instance_name,
+            ts_prefix = client_params.get("timestamp_prefix", False),
+            messages_prefix = client_params.get("messages_prefix", False),
+            max_events_per_file = client_params.get("max_events_per_file", json_writer.DEFAULT_MAX_EVENTS_PER_FILE))
+        for (ts, shard, L) in heapq.merge(*[json_lines(names[i], i) for i in range(len(names))]):
+            stream.write_encoded(L, ts)
+        stream.close()
+
+def run_coordinator(params, instance_name):
+    """Run a sharded simulation. Returns the exit status."""
+    num_devices = count_devices(params.get("events", []))
+    num_shards = max(1, min(params["shards"], num_devices))
+    shard_size = int(math.ceil(num_devices / float(num_shards)))
+    logging.info("Splitting "+str(num_devices)+" devices into "+str(num_shards)+" shards of up to "+str(shard_size)+" devices")
+    end_after_events = params.get("engine", {}).get("end_after_events", None)
+    if end_after_events:
+        shares = end_after_events_shares(end_after_events, num_devices, num_shards, shard_size)
+        logging.info("Dividing end_after_events of "+str(end_after_events)+" between shards as "+str(shares))
+
+    names = []
+    workers = []
+    try:
+        for i in range(num_shards):
+            name = shard_name(instance_name, i)
+            names.append(name)
+            if os.path.exists(LOG_DIR + name + ".progress"):
+                os.remove(LOG_DIR + name + ".progress")
+            shard_params = { "shard_index" : i, "shard_start" : i * shard_size, "shard_size" : shard_size }
+            if end_after_events:
+                shard_params["engine"] = { "end_after_events" : shares[i] }
+            args = [sys.executable] + sys.argv + [json.dumps(shard_params)]
+            logging.info("Starting shard "+str(i)+": "+" ".join(args))
+            with open(LOG_DIR + name + ".err", "wt") as err:    # Each shard logs to its own .out file, but anything which goes wrong before logging starts only reaches stderr
+                workers.append(subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=err))
+
+        while True:
+            running = len([w for w in workers if w.poll() is None])
+            report_progress(names, running)
+            if running == 0:
+                break
+            time.sleep(PROGRESS_INTERVAL_S)
+    finally:
+        for w in workers:
+            if w.poll() is None:
+                logging.error("Terminating shard process "+str(w.pid))
+                w.terminate()
+
+    status = 0
+    for i in range(num_shards):
+        if workers[i].returncode != 0:
+            logging.error("Shard "+str(i)+" failed with exit status "+str(workers[i].returncode)+" (see "+LOG_DIR+names[i]+".out and .err)")
+            status = 1
+
+    merge_outputs(instance_name, names, params)
+    for name in names:
+        if os.path.exists(LOG_DIR + name + ".progress"):
+            os.remove(LOG_DIR + name + ".progress")
+        if os.path.exists(LOG_DIR + name + ".err") and os.path.getsize(LOG_DIR + name + ".err") == 0:
+            os.remove(LOG_DIR + name + ".err")
+
+    return status
@@ -12,15 +12,16 @@ Arguments::
 """
 
 
-from .timefunction import Timefunction
-import isodate
+from .timefunction import Timefunction, grid_after
+from common import conftime
 import math
+import numpy
 
 class Count(Timefunction):
     def __init__(self, engine, device, params):
         """<interval> is the length between counts"""
         self.engine = engine
-        self.interval = float(isodate.parse_duration(params["interval"]).total_seconds())
+        self.interval = float(conftime.duration_seconds(params["interval"]))
         self.modulo = params.get("modulo", None)
 
         self.init_time = engine.get_now()
@@ -35,6 +36,19 @@ class Count(Timefunction):
             v = v % self.modulo
         return v
 
+    def state_many(self, ts, t_relative=False):
+        """Vectorised state()"""
+        v = numpy.trunc((ts - self.init_time) / self.interval).astype(numpy.int64)
+        if self.modulo is not None:
+            v = v % self.modulo
+        return v
+
+    def next_changes(self, t0, t1):
+        """Vectorised next_change()"""
+        n = numpy.arange(numpy.trunc(t0 / self.interval), numpy.trunc(t1 / self.interval) + 1.0)
+        times = n * self.interval + self.interval
+        return times[(times > t0) & (times <= t1)]
+
     def next_change(self, t=None):
         """Return a future time when the next event will happen"""
         if t is None:
@@ -47,6 +61,9 @@ class Count(Timefunction):
     def period(self):
         return self.interval
 
+    def is_pure(self):
+        return True
+
 
 class dummy_engine():
     def get_now(self):
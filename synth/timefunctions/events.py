@@ -13,14 +13,14 @@ Arguments::
 
 
 from .timefunction import Timefunction
-import isodate
+from common import conftime
 import random
 
 class Events(Timefunction):
     def __init__(self, engine, device, params):
         self.engine = engine
         self.value = params.get("value", "event")
-        self.interval = float(isodate.parse_duration(params.get("interval", "PT1D")).total_seconds())
+        self.interval = float(conftime.duration_seconds(params.get("interval", "PT1D")))
         self.first_time_through = True
 
     def state(self, t=None, t_relative=False):
@@ -13,6 +13,7 @@ Arguments::
 
 from .timefunction import Timefunction
 from common import importer
+import numpy
 from common.ordinal import LCMM
 
 class Mix(Timefunction):
@@ -23,7 +24,8 @@ class Mix(Timefunction):
         self.mix_operator = params["operator"]
         self.mix_timefunctions = []
         for f in params["timefunctions"]:
-            tf = importer.get_class("timefunction", f.keys()[0])(engine, device, f[f.keys()[0]])
+            name = list(f.keys())[0]
+            tf = importer.get_class("timefunction", name)(engine, device, f[name])
             self.mix_timefunctions.append(tf)
 
         self.operators = {
@@ -45,6 +47,26 @@ class Mix(Timefunction):
             r = self.operators[self.mix_operator](r, tf.state(t,t_relative))
         return r
     
+    def state_many(self, ts, t_relative=False):
+        """Vectorised state()"""
+        states = [tf.state_many(ts, t_relative) for tf in self.mix_timefunctions]
+        if self.mix_operator == "and":
+            r = states[0]   # (1.0 and A is A)
+            for s in states[1:]:
+                r = numpy.where(r != 0, s, r)
+            return r
+        r = numpy.full(len(ts), self.initial_state[self.mix_operator])
+        for s in states:
+            if self.mix_operator == "add":
+                r = r + s
+            else:
+                r = 0.5 + 2 * ((r - 0.5) * (s - 0.5))     # As operator_mul()
+        return r
+
+    def next_changes(self, t0, t1):
+        """Vectorised next_change()"""
+        return numpy.unique(numpy.concatenate([tf.next_changes(t0, t1) for tf in self.mix_timefunctions]))
+
     def next_change(self, t=None):
         """Return a future time when the next event will happen"""
         earliest = None
@@ -59,6 +81,10 @@ class Mix(Timefunction):
         periods = [tf.period() for tf in self.mix_timefunctions]
         return LCMM(periods)
 
+    def is_pure(self):
+        # "and" returns whichever of its operands decides, so its type varies
+        return self.mix_operator != "and" and all([tf.is_pure() for tf in self.mix_timefunctions])
+
     # Operators
 
     def operator_add(self, A, B):
@@ -12,9 +12,10 @@ Arguments::
     }
 """
 
-from .timefunction import Timefunction
-import isodate
+from .timefunction import Timefunction, grid_after
+from common import conftime
 import math
+import numpy
 import random
 import logging
  
@@ -23,7 +24,7 @@ class Propertydriven(Timefunction):
     def __init__(self, engine, device, params):
         self.engine = engine
         self.device = device
-        self.period = float(isodate.parse_duration(params.get("period","PT24H")).total_seconds())    # Since our value doesn't change, period is rather meaningless, but we have to be able to report a "next_change" time.
+        self.period = float(conftime.duration_seconds(params.get("period","PT24H")))    # Since our value doesn't change, period is rather meaningless, but we have to be able to report a "next_change" time.
         self.initTime = engine.get_now()
         self.driving_property_name = params.get("property", "$id")
 
@@ -37,6 +38,14 @@ class Propertydriven(Timefunction):
         r.random()
         return r.random()
     
+    def state_many(self, ts, t_relative=False):
+        """Vectorised state()"""
+        return numpy.full(len(ts), self.state())
+
+    def next_changes(self, t0, t1):
+        """Vectorised next_change()"""
+        return grid_after(t0 - self.initTime, t1 - self.initTime, float(self.period)) + self.initTime
+
     def next_change(self, t=None):
         """Return a future time when the next event will happen"""
         if t is None:
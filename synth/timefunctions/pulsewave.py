@@ -17,8 +17,9 @@ Arguments::
 
 
 from .timefunction import Timefunction
-import isodate
+from common import conftime
 import math
+import numpy
 
 class Pulsewave(Timefunction):
     def __init__(self, engine, device, params):
@@ -27,17 +28,17 @@ class Pulsewave(Timefunction):
            <delay> is the absolute amount that the start is delayed
            If <phase_absolute> then phase of period is relative to 00:00:00 1 Jan 1970, otherwise to when this device is created"""
         self.engine = engine
-        self.interval = float(isodate.parse_duration(params["interval"]).total_seconds())
+        self.interval = float(conftime.duration_seconds(params["interval"]))
         if "transition" not in params:
             self.transition = 0.5 # Square wave by default
         else:
             if params["transition"].endswith("%"):
                 self.transition = float(params["transition"][0:-1]) / 100.0
             else:
-                self.transition = float(isodate.parse_duration(params["transition"]).total_seconds()) / self.interval
+                self.transition = float(conftime.duration_seconds(params["transition"])) / self.interval
         assert (self.transition>=0) and (self.transition<self.interval), "Transition must be within interval"
 
-        self.delay = float(isodate.parse_duration(params.get("delay", "PT0S")).total_seconds())
+        self.delay = float(conftime.duration_seconds(params.get("delay", "PT0S")))
         self.phase_absolute = params.get("phase_absolute", False)
         self.invert = params.get("invert", False)
         self.initTime = engine.get_now()
@@ -59,6 +60,30 @@ class Pulsewave(Timefunction):
             
         return [0,1][result]
 
+    def state_many(self, ts, t_relative=False):
+        """Vectorised state()"""
+        if (not self.phase_absolute) and (not t_relative):
+            ts = ts - self.initTime
+        ts = ts - self.delay
+        result = ((ts % self.interval) / self.interval) >= self.transition
+        if self.invert:
+            result = ~result
+        return result.astype(int)
+
+    def next_changes(self, t0, t1):
+        """Vectorised next_change()"""
+        (r0, r1) = (t0, t1)
+        if not self.phase_absolute:
+            (r0, r1) = (r0 - self.initTime, r1 - self.initTime)
+        (r0, r1) = (r0 - self.delay, r1 - self.delay)
+        starts = numpy.arange(numpy.floor(r0 / self.interval), numpy.floor(r1 / self.interval) + 1.0) * self.interval
+        times = numpy.unique(numpy.concatenate((starts + self.transition * self.interval, starts + self.interval)))
+        times = times[times > r0]
+        if not self.phase_absolute:
+            times += self.initTime
+        times += self.delay
+        return times[times <= t1]
+
     def next_change(self, t=None):
         """Return a future time when the next event will happen"""
         if t is None:
@@ -83,6 +108,9 @@ class Pulsewave(Timefunction):
     def period(self):
         return self.interval
 
+    def is_pure(self):
+        return True
+
 
 class dummy_engine():
     def get_now(self):
@@ -13,9 +13,10 @@ Arguments::
     }
 """
 
-from .timefunction import Timefunction
-import isodate
+from .timefunction import Timefunction, grid_after
+from common import conftime
 import math
+import numpy
 import random
 import logging
 
@@ -28,7 +29,7 @@ class Randomwave(Timefunction):
     def __init__(self, engine, device, params):
         self.engine = engine
         self.device = device
-        self.period = float(isodate.parse_duration(params.get("period", "PT1H")).total_seconds())
+        self.period = float(conftime.duration_seconds(params.get("period", "PT1H")))
         self.lower = params.get("lower", 0.0)
         self.upper = params.get("upper", 1.0)
         self.precision = params.get("precision", None)
@@ -53,6 +54,29 @@ class Randomwave(Timefunction):
 
         return v
     
+    def state_many(self, ts, t_relative=False):
+        """Vectorised state(). Each period's value comes from its own random number generator, so we only call that once per period"""
+        if not t_relative:
+            ts = ts - self.initTime
+        (periods, inverse) = numpy.unique(numpy.trunc(ts / self.period).astype(numpy.int64), return_inverse=True)
+        seed = hash(self.device.get_property("$id"))
+        values = []
+        r = random.Random(0)    # (Re-seeding one generator gives the same numbers as seeding a new one, without the cost of seeding it from the OS first)
+        for quantised_time in periods.tolist():
+            r.seed(quantised_time + seed)
+            r.random()
+            r.random()
+            r.random()
+            values.append(r.random())
+        v = self.lower + numpy.array(values) * (self.upper-self.lower)
+        if self.precision is not None:
+            v = numpy.trunc(v * self.precision) / float(self.precision)
+        return v[inverse]
+
+    def next_changes(self, t0, t1):
+        """Vectorised next_change()"""
+        return grid_after(t0 - self.initTime, t1 - self.initTime, float(self.period)) + self.initTime
+
     def next_change(self, t=None):
         """Return a future time when the next event will happen"""
         if t is None:
@@ -69,6 +93,9 @@ class Randomwave(Timefunction):
     def period(self):
         return float(self.period)
 
+    def is_pure(self):
+        return True
+
 
 # Check randomness
 class dummy_engine():
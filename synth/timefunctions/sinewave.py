@@ -20,9 +20,10 @@ Arguments::
     }
 """
 
-from .timefunction import Timefunction
-import isodate
+from .timefunction import Timefunction, grid_after
+from common import conftime
 import math
+import numpy
 
 POINTS_PER_CYCLE = 32
 
@@ -35,9 +36,9 @@ class Sinewave(Timefunction):
         self.periods = []     # But internally always operate on a list
         if type(p) == list:
             for i in p:
-                self.periods.append(float(isodate.parse_duration(i).total_seconds()))
+                self.periods.append(float(conftime.duration_seconds(i)))
         else:
-            self.periods.append(float(isodate.parse_duration(p).total_seconds()))
+            self.periods.append(float(conftime.duration_seconds(p)))
         if not "amplitude" in params:
             self.amplitudes = [1.0] * len(self.periods)
         else:
@@ -52,7 +53,7 @@ class Sinewave(Timefunction):
         self.overall_offset = params.get("overall_offset", 0.0)
         self.sample_period = params.get("sample_period", None)
         if self.sample_period is not None:
-            self.sample_period = float(isodate.parse_duration(self.sample_period).total_seconds())
+            self.sample_period = float(conftime.duration_seconds(self.sample_period))
         self.randomise_phase_by = params.get("randomise_phase_by", None)
         self.precision = params.get("precision", None)
         self.initTime = engine.get_now()
@@ -79,6 +80,34 @@ class Sinewave(Timefunction):
             v = int(v * self.precision) / float(self.precision)
         return v
     
+    def state_many(self, ts, t_relative=False):
+        """Vectorised state()"""
+        if not t_relative:
+            ts = ts - self.initTime
+        if self.randomise_phase_by is not None:
+            ts = ts + float(hash(self.device.get_property(self.randomise_phase_by)))
+        v = numpy.zeros(len(ts))
+        for p,a in zip(self.periods, self.amplitudes):
+            v = v + numpy.sin((2 * math.pi * ts) / float(p)) * a/2.0 + 0.5
+        v /= len(self.periods)
+        v = v * self.overall_amplitude + self.overall_offset
+        if self.precision is not None:
+            v = numpy.trunc(v * self.precision) / float(self.precision)
+        return v
+
+    def next_changes(self, t0, t1):
+        """Vectorised next_change()"""
+        t0 -= self.initTime
+        t1 -= self.initTime
+        if self.sample_period is not None:
+            if not (float(t0).is_integer() and self.sample_period.is_integer() and float(self.initTime).is_integer()):
+                return Timefunction.next_changes(self, t0 + self.initTime, t1 + self.initTime)  # Repeatedly adding the sample period may round differently
+            times = t0 + numpy.arange(1.0, numpy.floor((t1 - t0) / self.sample_period) + 2.0) * self.sample_period
+            times = times[times <= t1]
+        else:
+            times = numpy.unique(numpy.concatenate([grid_after(t0, t1, float(per) / POINTS_PER_CYCLE) for per in self.periods]))
+        return times + self.initTime
+
     def next_change(self, t=None):
         """Return a future time when the next event will happen"""
         if t is None:
@@ -101,6 +130,9 @@ class Sinewave(Timefunction):
     def period(self):
         return float(self.period) / POINTS_PER_CYCLE
 
+    def is_pure(self):
+        return self.randomise_phase_by in [None, "$id"]
+
 class dummy_engine():
     def get_now(self):
         return 0
@@ -1,5 +1,15 @@
 # abc for a simulation engine.
+#
+# As well as the scalar state() and next_change(), timefunctions provide state_many() and next_changes(), which evaluate
+# a whole window of times at once. The defaults here just call the scalar methods, and timefunctions override them with NumPy
+# versions which give the same results. Run "python3 -m timefunctions.timefunction" (from the synth directory) to check and time them.
+#
+# A timefunction which is_pure() can be evaluated ahead of time, so a Series of its changes and states is computed a window
+# at a time (see devices/variable.py, which then only needs to set each value when its time comes).
 from abc import ABCMeta, abstractmethod
+import numpy
+
+SERIES_LENGTH = 32  # Number of changes which a Series computes at a time
 
 class Timefunction(object):
     __metaclass__ = ABCMeta
@@ -22,3 +32,117 @@ class Timefunction(object):
     def period(self):
         """Return period of timefunction in seconds"""
         pass
+
+    def state_many(self, ts, t_relative=False):
+        """Return a NumPy array of the state at each of the epoch-times in <ts> (a NumPy array)"""
+        return numpy.array([self.state(t, t_relative) for t in ts.tolist()])
+
+    def next_changes(self, t0, t1):
+        """Return a NumPy array of the times at which the state changes after <t0>, up to and including <t1>
+           (i.e. the times which calling next_change() repeatedly, starting from <t0>, would return)"""
+        result = []
+        t = self.next_change(t0)
+        while t <= t1:
+            result.append(t)
+            t = self.next_change(t)
+        return numpy.array(result, dtype=float)
+
+    def is_pure(self):
+        """Does the state depend only on the time (not e.g. on device properties which might change), with state_many()
+           returning values of the same types as state()? If so, states can be computed in advance"""
+        return False
+
+def grid_after(t0, t1, step):
+    """The multiples of <step> after <t0>, up to and including <t1>. Each is calculated as n*step + step, just as the
+       scalar next_change() methods calculate math.floor(t/step)*step + step, so that they give identical times"""
+    first = numpy.floor(t0 / step)
+    n = numpy.arange(first, numpy.floor(t1 / step) + 1.0)
+    times = n * step + step
+    return times[(times > t0) & (times <= t1)]
+
+class Series():
+    """The changes of a pure timefunction after a given time, and its state at each, computed SERIES_LENGTH changes at a time"""
+    def __init__(self, function, t):
+        self.function = function
+        self.span = max(function.next_change(t) - t, 1.0) * SERIES_LENGTH   # Time to compute ahead, adjusted to give about SERIES_LENGTH changes
+        self.times = self.values = []
+        self.index = 0
+        self.last = t
+
+    def next_time(self):
+        """The time of the next change"""
+        if self.index >= len(self.times):
+            self._refill()
+        return self.times[self.index]
+
+    def pop(self):
+        """Return the time and state of the next change, and move on to the one after"""
+        t = self.next_time()
+        v = self.values[self.index]
+        self.index += 1
+        self.last = t
+        return (t, v)
+
+    def _refill(self):
+        times = self.function.next_changes(self.last, self.last + self.span)
+        while len(times) == 0:
+            self.span *= 2
+            times = self.function.next_changes(self.last, self.last + self.span)
+        if len(times) > 2 * SERIES_LENGTH or len(times) < SERIES_LENGTH / 2:
+            self.span *= SERIES_LENGTH / float(len(times))
+        self.times = times.tolist()
+        self.values = self.function.state_many(times).tolist()     # (As Python values, of the same types state() returns)
+        self.index = 0
+
+if __name__ == "__main__":
+    # Check that the vectorised methods of each timefunction give exactly the same results as the scalar ones, and time them
+    import time
+    from common import importer
+
+    class dummy_engine():
+        def get_now(self):
+            return 1577836800.0
+
+    class dummy_device():
+        def get_property(self, name):
+            return "01-23-45-67-89-ab"
+
+    CASES = [
+        ("sinewave", { "period" : ["P1D", "PT1H"], "amplitude" : [10, 0.2], "precision" : 100, "randomise_phase_by" : "$id" }),
+        ("sinewave", { "period" : "P1D", "sample_period" : "PT1M" }),
+        ("pulsewave", { "interval" : "PT1H", "transition" : "PT15M", "delay" : "PT5M" }),
+        ("randomwave", { "period" : "PT1H", "precision" : 10 }),
+        ("count", { "interval" : "PT10M", "modulo" : 6 }),
+        ("propertydriven", {}),
+        ("mix", { "operator" : "mul", "timefunctions" : [ { "sinewave" : { "period" : "P1D" } }, { "pulsewave" : { "interval" : "PT8H" } } ] })
+    ]
+    N = 100000
+    WINDOW = 60*60*24*30
+    engine = dummy_engine()
+    t0 = engine.get_now()
+    ts = t0 + numpy.sort(numpy.random.default_rng(1).uniform(0, WINDOW, N))
+    print("{:15s} {:>12s} {:>12s} {:>8s}   {:>12s} {:>12s} {:>8s}".format("", "state us", "state_many", "speedup", "next_change", "next_changes", "speedup"))
+    for (name, params) in CASES:
+        tf = importer.get_class("timefunction", name)(engine, dummy_device(), params)
+
+        start = time.perf_counter()
+        scalar_states = numpy.array([tf.state(t) for t in ts.tolist()])
+        scalar_state_s = time.perf_counter() - start
+        start = time.perf_counter()
+        states = tf.state_many(ts)
+        state_many_s = time.perf_counter() - start
+        assert numpy.array_equal(states, scalar_states), name + " state_many() differs from state()"
+
+        start = time.perf_counter()
+        scalar_changes = Timefunction.next_changes(tf, t0, t0 + WINDOW)   # The default, scalar implementation
+        scalar_changes_s = time.perf_counter() - start
+        start = time.perf_counter()
+        changes = tf.next_changes(t0, t0 + WINDOW)
+        next_changes_s = time.perf_counter() - start
+        assert numpy.array_equal(changes, scalar_changes), name + " next_changes() differs from next_change()"
+
+        n = max(1, len(changes))
+        print("{:15s} {:12.3f} {:12.3f} {:7.0f}x   {:12.3f} {:12.3f} {:7.0f}x   ({:,} changes)".format(name,
+            scalar_state_s / N * 1e6, state_many_s / N * 1e6, scalar_state_s / state_many_s,
+            scalar_changes_s / n * 1e6, next_changes_s / n * 1e6, scalar_changes_s / next_changes_s, len(changes)))
+    print("All timefunctions agree (times are microseconds per state or change)")
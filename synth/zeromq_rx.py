@@ -21,7 +21,9 @@
 # SOFTWARE.
  
 import sys, threading, logging, traceback, json, time
+import asyncio
 import zmq
+import zmq.asyncio
 
 g_emit_logging = True
 
@@ -37,23 +39,39 @@ socket.set_hwm(ZEROMQ_BUFFER)
 topicfilter = ""    # ZeroMQ will do filtering for us, but only on client side
 socket.setsockopt(zmq.SUBSCRIBE, topicfilter.encode('ascii'))
 
+def receive(string, callback):
+    if g_emit_logging:
+        logging.info("Received on ZeroMQ: " + str(string))
+    params = json.loads(string)
+    callback(params)
+
 def rxThread(callback):
     if g_emit_logging:
         logging.info("ZeroMQ rx thread started")
     while True:
         try:
             string = socket.recv()  # { "action" : {"event"|"spawn"} ... }
-            if g_emit_logging:
-                logging.info("Received on ZeroMQ: " + str(string))
-            params = json.loads(string)
-            callback(params)
+            receive(string, callback)
         except Exception as e:
             logging.error("Error in ZeroMQ thread: "+str(e))
             logging.error(traceback.format_exc())
             time.sleep(1)    # Avoid 100% CPU in case socket.recv() dies
 
     logging.critical("ZeroMQ rx thread exiting")
-    
+
+async def rxTask(callback):
+    async_socket = zmq.asyncio.Socket.from_socket(socket)
+    if g_emit_logging:
+        logging.info("ZeroMQ rx task started")
+    while True:
+        try:
+            string = await async_socket.recv()
+            receive(string, callback)
+        except Exception as e:
+            logging.error("Error in ZeroMQ task: "+str(e))
+            logging.error(traceback.format_exc())
+            await asyncio.sleep(1)
+
 def init(callback, emit_logging=True):
     global g_emit_logging
     g_emit_logging = emit_logging
@@ -62,3 +80,12 @@ def init(callback, emit_logging=True):
     t = threading.Thread(target=rxThread, kwargs={"callback":callback})
     t.daemon = True
     t.start()
+
+def init_asyncio(loop, callback, emit_logging=True):
+    """Like init(), but receive within an asyncio event loop (e.g. that of the asyncsim engine) instead of in a thread,
+       so <callback> is called from whichever thread runs the loop, whenever it's running"""
+    global g_emit_logging
+    g_emit_logging = emit_logging
+    if emit_logging:
+        logging.info("Starting ZeroMQ rx task")
+    loop.create_task(rxTask(callback))